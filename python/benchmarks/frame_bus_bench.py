@@ -0,0 +1,87 @@
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+import numpy as np
+
+# Benchmark for the shared memory camera frame bus (frame_bus.py): one writer
+# publishes RGB frames at a fixed rate while reader processes poll for them,
+# and reports publish time, read (copy) time and publish-to-read latency.
+# Run from the python/ directory:
+#
+#     python benchmarks/frame_bus_bench.py --readers 2 --fps 30
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from frame_bus import FrameBus, FrameBusReader
+from run_bench import percentile
+
+NAME = "furhat_frame_bus_bench"
+
+
+def reader(name: str, copy: bool, frames: int, results):
+    bus = FrameBusReader(name)
+    latencies, read_times, seen = [], [], 0
+    while seen < frames:
+        start = time.perf_counter()
+        frame = bus.latest(copy)
+        if frame is None:
+            time.sleep(0.0005)
+            continue
+        read_times.append(time.perf_counter() - start)
+        latencies.append(time.time() - frame[1])
+        seen += 1
+        if frame[0] >= frames:
+            break
+        del frame
+    bus.close()
+    results.put({"latencies": latencies, "read_times": read_times, "frames": seen})
+
+
+def format_ms(values: list) -> str:
+    return " ".join(f"{percentile(values, q) * 1000:7.3f}" for q in (0.5, 0.95, 0.99)) if values else "-"
+
+
+def main(args):
+    frame = np.random.default_rng(0).integers(0, 255, (args.height, args.width, 3), dtype=np.uint8)
+    bus = FrameBus(NAME, args.width, args.height, slots=args.slots)
+    results = multiprocessing.Queue()
+    readers = [multiprocessing.Process(target=reader, args=(NAME, not args.no_copy, args.frames, results))
+               for _ in range(args.readers)]
+    for process in readers:
+        process.start()
+    time.sleep(0.5)     # let the readers attach
+
+    publish_times = []
+    start = time.monotonic()
+    for i in range(args.frames):
+        time.sleep(max(0.0, start + i / args.fps - time.monotonic()))
+        t = time.perf_counter()
+        bus.publish(frame)
+        publish_times.append(time.perf_counter() - t)
+
+    reports = [results.get(timeout=10) for _ in readers]
+    for process in readers:
+        process.join()
+    bus.close()
+
+    print(f"{args.frames} frames of {args.width}x{args.height} RGB at {args.fps:.0f} fps, "
+          f"{args.readers} readers ({'views' if args.no_copy else 'copies'})")
+    print(f"  {'(ms)':<22} {'p50':>7} {'p95':>7} {'p99':>7}")
+    print(f"  {'publish':<22} {format_ms(publish_times)}")
+    for i, report in enumerate(reports):
+        print(f"  {f'reader {i} read':<22} {format_ms(report['read_times'])}")
+        print(f"  {f'reader {i} latency':<22} {format_ms(report['latencies'])}   ({report['frames']} frames seen)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--readers", type=int, default=2)
+    parser.add_argument("--fps", type=float, default=30.0)
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--slots", type=int, default=4)
+    parser.add_argument("--no_copy", action="store_true", help="Readers take views instead of copies")
+    main(parser.parse_args())
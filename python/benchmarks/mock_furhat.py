@@ -0,0 +1,306 @@
+import asyncio
+import base64
+import itertools
+import json
+import time
+from websockets.asyncio.server import serve
+from websockets.exceptions import ConnectionClosed
+from mock_realtime import MIC_MARKER, OUT_MARKER, SAMPLE_RATE, tone
+
+# Local stand-in for the Furhat Realtime API websocket (ws://host:9000/v1/events).
+# Once the bridge starts listening, it plays a scripted conversation: each user
+# utterance is sent as hear_start, optional hear_partial and hear_end events.
+# Speak requests are acknowledged with speak_start and, after a simulated
+# speaking time, speak_end. The next utterance follows when the robot has
+# been quiet for `pause` seconds.
+
+DEFAULT_SCRIPT = [
+    "Hello there, how are you today?",
+    "What is your name?",
+    "What can you do?",
+    "Do you like talking to people?",
+    "Tell me something interesting.",
+    "What is your favourite colour?",
+    "Where are we right now?",
+    "Thank you, that was nice.",
+]
+
+
+class MockFurhat:
+    def __init__(self, script: list = None, user_speech: float = 0.3, words_per_second: float = 15.0,
+                 speak_delay: float = 0.05, pause: float = 0.5, timeout: float = 15.0):
+        self.script = script or DEFAULT_SCRIPT
+        self.user_speech = user_speech              # seconds from hear_start to hear_end
+        self.words_per_second = words_per_second    # simulated speaking rate of the robot
+        self.speak_delay = speak_delay              # speak request to speak_start
+        self.pause = pause                          # robot silence before the user speaks again
+        self.timeout = timeout                      # give up on a turn without any speech
+        self.turns = []
+        self.done = asyncio.Event()
+        self.server = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 9000):
+        self.server = await serve(self._session, host, port)
+
+    async def close(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+
+    async def _session(self, ws):
+        session = _Session(self, ws)
+        driver = asyncio.create_task(session.drive())
+        try:
+            async for message in ws:
+                if isinstance(message, str):
+                    await session.handle(json.loads(message))
+        except ConnectionClosed:
+            pass
+        finally:
+            driver.cancel()
+            session.speaker.cancel()
+
+
+class _Session:
+    def __init__(self, mock: MockFurhat, ws):
+        self.mock = mock
+        self.ws = ws
+        self.listening = asyncio.Event()
+        self.partial = False
+        self.speak_queue = asyncio.Queue()
+        self.speaker = asyncio.create_task(self._speak_loop())
+        self.speaking = False
+        self.last_activity = time.monotonic()
+        self.turn = None
+
+    async def send(self, event: dict):
+        await self.ws.send(json.dumps(event))
+
+    async def handle(self, event: dict):
+        kind = event.get("type")
+        if kind == "request.auth":
+            await self.send({"type": "response.auth", "access": True, "scope": "mock", "request_id": event.get("request_id")})
+        elif kind == "request.listen.start":
+            self.partial = event.get("partial", False)
+            self.listening.set()
+        elif kind == "request.speak.text":
+            self.last_activity = time.monotonic()
+            if self.turn is not None:
+                self.turn.setdefault("speak_request", self.last_activity)
+            if event.get("abort"):
+                self.stop_speaking()
+            self.speak_queue.put_nowait(event.get("text", ""))
+        elif kind == "request.speak.stop":
+            self.stop_speaking()
+
+    def stop_speaking(self):
+        while not self.speak_queue.empty():
+            self.speak_queue.get_nowait()
+        if self.speaking:
+            self.speaker.cancel()
+            self.speaker = asyncio.create_task(self._speak_loop())
+            self.speaking = False
+
+    async def _speak_loop(self):
+        while True:
+            text = await self.speak_queue.get()
+            self.speaking = True
+            try:
+                await asyncio.sleep(self.mock.speak_delay)
+                await self.send({"type": "response.speak.start", "text": text})
+                if self.turn is not None:
+                    self.turn.setdefault("speak_start", time.monotonic())
+                await asyncio.sleep(len(text.split()) / self.mock.words_per_second)
+                await self.send({"type": "response.speak.end", "text": text, "aborted": False})
+                if self.turn is not None:
+                    self.turn["speak_end"] = time.monotonic()
+            finally:
+                self.speaking = False
+                self.last_activity = time.monotonic()
+
+    async def wait_quiet(self, deadline: float = None):
+        while True:
+            idle = not self.speaking and self.speak_queue.empty()
+            quiet_for = time.monotonic() - self.last_activity
+            if idle and quiet_for >= self.mock.pause:
+                return True
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            await asyncio.sleep(0.02)
+
+    async def drive(self):
+        await self.listening.wait()
+        await self.wait_quiet()     # let the greeting finish
+        for utterance in self.mock.script:
+            words = utterance.split()
+            await self.send({"type": "response.hear.start"})
+            for i in range(1, len(words) + 1):
+                await asyncio.sleep(self.mock.user_speech / len(words))
+                if self.partial and i < len(words):
+                    await self.send({"type": "response.hear.partial", "text": " ".join(words[:i])})
+
+            self.turn = {"text": utterance, "hear_end": time.monotonic()}
+            self.last_activity = self.turn["hear_end"]
+            await self.send({"type": "response.hear.end", "text": utterance})
+
+            # wait for the reply to start, then for the robot to go quiet
+            deadline = self.turn["hear_end"] + self.mock.timeout
+            while "speak_request" not in self.turn and time.monotonic() < deadline:
+                await asyncio.sleep(0.01)
+            await self.wait_quiet(deadline + self.mock.timeout)
+            self.turn["ok"] = "speak_start" in self.turn
+            self.mock.turns.append(self.turn)
+            self.turn = None
+        self.mock.done.set()
+
+
+class MockFurhatAudio:
+    """
+    Stand-in for a Furhat streaming audio, for the realtime bridges.
+
+    After request.audio.start, microphone audio is sent as response.audio.data
+    in real time: quiet, except that the user speaks (a loud tone) for `speech`
+    seconds starting `lead_silence` seconds after the microphone is opened or
+    the robot stops speaking. With `interrupt_after`, the user instead starts
+    speaking that many seconds into each robot utterance, and the time until
+    request.speak.stop is recorded as barge-in latency. Audio received through
+    request.speak.audio.* is "played" at its sample rate, followed by
+    speak_end; audio arriving after the robot ran out is counted as a stall. With request.camera.start, JPEG frames are sent at `camera_fps`.
+    """
+
+    def __init__(self, upstream, downstream, frame_seconds: float = 0.02, lead_silence: float = 0.2,
+                 speech: float = 1.5, camera_fps: float = 5.0, interrupt_after: float = None):
+        self.upstream = upstream            # AudioLedger for microphone frames
+        self.downstream = downstream        # AudioLedger for response audio
+        self.frame_seconds = frame_seconds
+        self.lead_silence = lead_silence
+        self.speech = speech
+        self.camera_fps = camera_fps
+        self.interrupt_after = interrupt_after
+        self.user_speech_at = None      # when the user next starts speaking
+        self.barge_in_latencies = []
+        self.stalls = 0
+        self.stall_seconds = 0.0
+        self.mic_frames = 0
+        self.camera_frames = 0
+        self.speak_requests = 0
+        self.server = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 9000):
+        self.server = await serve(self._session, host, port)
+
+    async def close(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+
+    async def _session(self, ws):
+        tasks = {}
+
+        async def send(event: dict):
+            await ws.send(json.dumps(event))
+
+        def restart(name, coro):
+            stop(name)
+            tasks[name] = asyncio.create_task(coro)
+
+        def stop(name):
+            task = tasks.pop(name, None)
+            if task:
+                task.cancel()
+
+        playback = {"start": None, "bytes": 0, "rate": SAMPLE_RATE}
+        tail = b""      # end of the previous audio message, for markers split across messages
+
+        async def finish_playback():
+            end = playback["start"] + playback["bytes"] / (2 * playback["rate"])
+            await asyncio.sleep(max(0.0, end - time.monotonic()))
+            playback["start"] = None
+            self.user_speech_at = time.monotonic() + self.lead_silence
+            await send({"type": "response.speak.end", "aborted": False})
+
+        try:
+            async for message in ws:
+                event = json.loads(message)
+                kind = event.get("type")
+                if kind == "request.auth":
+                    await send({"type": "response.auth", "access": True, "scope": "mock", "request_id": event.get("request_id")})
+                elif kind == "request.audio.start":
+                    if event.get("microphone", True):
+                        self.user_speech_at = time.monotonic() + self.lead_silence
+                        restart("mic", self._microphone(send, event.get("sample_rate", SAMPLE_RATE)))
+                elif kind == "request.audio.stop":
+                    stop("mic")
+                elif kind == "request.speak.audio.start":
+                    stop("playback")
+                    playback.update(start=time.monotonic(), bytes=0, rate=event.get("sample_rate", SAMPLE_RATE))
+                    # the user waits for the robot, or interrupts it
+                    self.user_speech_at = None if self.interrupt_after is None else playback["start"] + self.interrupt_after
+                    self.speak_requests += 1
+                    await send({"type": "response.speak.start"})
+                elif kind == "request.speak.audio.data":
+                    audio = base64.b64decode(event.get("audio", ""))
+                    self.downstream.receive(tail + audio, OUT_MARKER)
+                    tail = audio[-7:]
+                    if playback["start"] is not None and playback["bytes"]:
+                        gap = time.monotonic() - (playback["start"] + playback["bytes"] / (2 * playback["rate"]))
+                        if gap > 0:
+                            self.stalls += 1
+                            self.stall_seconds += gap
+                            playback["start"] += gap
+                    playback["bytes"] += len(audio)
+                elif kind == "request.speak.audio.end":
+                    if playback["start"] is not None:
+                        restart("playback", finish_playback())
+                elif kind == "request.speak.stop":
+                    if playback["start"] is not None:
+                        now = time.monotonic()
+                        heard = "mic" in tasks and self.user_speech_at is not None and now >= self.user_speech_at
+                        if self.interrupt_after is not None and heard:
+                            self.barge_in_latencies.append(now - self.user_speech_at)
+                        stop("playback")
+                        playback["start"] = None
+                        await send({"type": "response.speak.end", "aborted": True})
+                elif kind == "request.camera.start":
+                    restart("camera", self._camera(send))
+                elif kind == "request.camera.stop":
+                    stop("camera")
+                elif kind == "request.camera.once":
+                    self.camera_frames += 1
+                    await send({"type": "response.camera.data", "image": camera_image(), "request_id": event.get("request_id")})
+        except ConnectionClosed:
+            pass
+        finally:
+            for name in list(tasks):
+                stop(name)
+
+    async def _microphone(self, send, sample_rate: int):
+        quiet = tone(self.frame_seconds, 30, sample_rate=sample_rate)
+        loud = tone(self.frame_seconds, 6000, sample_rate=sample_rate)
+        start = time.monotonic()
+        for i in itertools.count():
+            # real-time pacing on an absolute schedule, so sleep jitter does not accumulate
+            await asyncio.sleep(max(0.0, start + i * self.frame_seconds - time.monotonic()))
+            now = time.monotonic()
+            speaking = self.user_speech_at is not None and self.user_speech_at <= now < self.user_speech_at + self.speech
+            frame = loud if speaking else quiet
+            audio = self.upstream.send(bytearray(frame), MIC_MARKER)
+            self.mic_frames += 1
+            await send({"type": "response.audio.data", "microphone": base64.b64encode(audio).decode()})
+
+    async def _camera(self, send):
+        image = camera_image()
+        while True:
+            await send({"type": "response.camera.data", "image": image})
+            self.camera_frames += 1
+            await asyncio.sleep(1.0 / self.camera_fps)
+
+
+def camera_image(width: int = 640, height: int = 480) -> str:
+    """A base64 JPEG test frame."""
+    import io
+    from PIL import Image
+    image = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=85)
+    return base64.b64encode(buffer.getvalue()).decode()
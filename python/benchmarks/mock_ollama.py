@@ -0,0 +1,134 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+
+# Local stand-in for an Ollama server: /api/chat (streamed or not), /api/generate
+# (model preload), /api/ps and /api/tags. Replies are canned text produced after
+# `ttft` seconds at `tokens_per_second`, one word per token.
+
+REPLIES = [
+    "That sounds lovely. I enjoy a good chat, especially about the weather and the people I meet here every day.",
+    "Good question! I am a social robot, so I mostly talk, listen and look at the people around me.",
+    "I see, thank you for telling me. Would you like to hear more about what I can do, or shall we talk about you?",
+    "Well, I think the best part of my day is meeting new people. Each conversation teaches me something new.",
+]
+
+
+class MockOllama:
+    def __init__(self, ttft: float = 0.2, tokens_per_second: float = 50.0, jitter: float = 0.1, seed: int = 0):
+        self.ttft = ttft
+        self.tokens_per_second = tokens_per_second
+        self.jitter = jitter
+        self.random = random.Random(seed)
+        self.loaded = set()
+        self.requests = 0
+        self.server = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> int:
+        self.server = await asyncio.start_server(self._handle, host, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        # HTTP/1.1 with keep-alive, enough for httpx
+        try:
+            while True:
+                request = await reader.readline()
+                if not request:
+                    break
+                method, path, _ = request.decode().split(" ", 2)
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    name, _, value = line.decode().partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                await self._route(method, path, json.loads(body) if body else {}, writer)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _route(self, method: str, path: str, request: dict, writer):
+        if path == "/api/chat":
+            self.requests += 1
+            await self._chat(request, writer)
+        elif path == "/api/generate":
+            await asyncio.sleep(self.ttft)
+            self.loaded.add(request.get("model"))
+            self._send_json(writer, {"model": request.get("model"), "response": "", "done": True, "load_duration": 0})
+        elif path == "/api/ps":
+            self._send_json(writer, {"models": [{"name": m, "model": m} for m in self.loaded]})
+        elif path == "/api/tags":
+            self._send_json(writer, {"models": [{"name": m} for m in self.loaded]})
+        else:
+            self._send(writer, "404 Not Found", b"not found", "text/plain")
+        await writer.drain()
+
+    async def _chat(self, request: dict, writer):
+        model = request.get("model")
+        self.loaded.add(model)
+        limit = request.get("options", {}).get("num_predict", 200)
+        words = self.random.choice(REPLIES).split()[:limit]
+        tokens = [w if i == 0 else " " + w for i, w in enumerate(words)]
+        prompt_tokens = sum(len(m.get("content", "")) for m in request.get("messages", [])) // 4
+
+        start = time.monotonic()
+        await asyncio.sleep(max(0.0, self.ttft * (1 + self.random.uniform(-self.jitter, self.jitter))))
+        interval = 1.0 / self.tokens_per_second
+        stats = {
+            "model": model,
+            "done": True,
+            "done_reason": "stop",
+            "prompt_eval_count": prompt_tokens,
+            "prompt_eval_duration": int(self.ttft * 1e9),
+            "eval_count": len(tokens),
+        }
+
+        if request.get("stream", True):
+            writer.write(
+                b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\nTransfer-Encoding: chunked\r\n\r\n"
+            )
+            for token in tokens:
+                self._send_chunk(writer, {"model": model, "message": {"role": "assistant", "content": token}, "done": False})
+                await writer.drain()
+                await asyncio.sleep(interval)
+            self._send_chunk(writer, {**stats, "message": {"role": "assistant", "content": ""}, "total_duration": int((time.monotonic() - start) * 1e9)})
+            writer.write(b"0\r\n\r\n")
+        else:
+            await asyncio.sleep(interval * len(tokens))
+            self._send_json(writer, {**stats, "message": {"role": "assistant", "content": "".join(tokens)}, "total_duration": int((time.monotonic() - start) * 1e9)})
+
+    def _send_chunk(self, writer, data: dict):
+        line = (json.dumps(data) + "\n").encode()
+        writer.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+
+    def _send_json(self, writer, data: dict):
+        self._send(writer, "200 OK", json.dumps(data).encode(), "application/json")
+
+    def _send(self, writer, status: str, body: bytes, content_type: str):
+        writer.write(f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body)
+
+
+async def main(args):
+    ollama = MockOllama(args.ttft, args.tokens_per_second)
+    port = await ollama.start(args.host, args.port)
+    print(f"Mock Ollama on http://{args.host}:{port} (TTFT {args.ttft:.2f}s, {args.tokens_per_second:.0f} tokens/s)")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--ttft", type=float, default=0.2, help="Seconds until the first token")
+    parser.add_argument("--tokens_per_second", type=float, default=50.0)
+    try:
+        asyncio.run(main(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,245 @@
+import array
+import asyncio
+import base64
+import itertools
+import json
+import math
+import random
+import struct
+import time
+from websockets.asyncio.server import serve
+from websockets.exceptions import ConnectionClosed
+
+# Local stand-in for the OpenAI Realtime websocket, covering the events the
+# Furhat bridges use. Server VAD is simulated from the audio level: the first
+# loud chunk sends speech_started, and `silence` seconds of quiet audio after
+# it speech_stopped, followed by a response of `response_audio` seconds of
+# PCM16 at 24 kHz, streamed `speedup` times faster than real time, with up to
+# `jitter` seconds of extra random delay before each delta. Speech
+# during a response cancels it, like the real server's interrupt_response.
+# Each session takes `handshake` seconds to open, and with `drop_every` the
+# connection is closed halfway through every drop_every-th response, to
+# exercise the bridges' reconnects. Conversation items are created for user
+# turns, responses and conversation.item.create, and can be deleted.
+#
+# Audio in both directions carries markers (see mark_frame), so the benchmark
+# can match what was sent with what arrived, however it was re-chunked. The
+# markers are four near-silent samples, so they do not trip a VAD.
+
+SAMPLE_RATE = 24000
+BYTES_PER_SECOND = SAMPLE_RATE * 2
+MIC_MARKER = struct.pack("<2h", 23, -23)
+OUT_MARKER = struct.pack("<2h", -29, 29)
+
+
+def tone(seconds: float, amplitude: int, frequency: float = 220.0, sample_rate: int = SAMPLE_RATE) -> bytearray:
+    """PCM16 test signal; amplitude 0 gives digital silence."""
+    n = int(seconds * sample_rate)
+    samples = (int(amplitude * math.sin(2 * math.pi * frequency * i / sample_rate)) for i in range(n))
+    return bytearray(struct.pack(f"<{n}h", *samples))
+
+
+def is_loud(audio: bytes, threshold: int = 1000) -> bool:
+    samples = array.array("h", audio[:len(audio) // 2 * 2])
+    return bool(samples) and (max(samples) > threshold or min(samples) < -threshold)
+
+
+def mark_frame(frame: bytearray, marker: bytes, seq: int) -> bytes:
+    frame[:8] = marker + struct.pack("<2H", seq & 0xFF, seq >> 8)
+    return bytes(frame)
+
+
+def find_markers(data: bytes, marker: bytes):
+    """Sequence numbers of all markers in `data`."""
+    start = data.find(marker)
+    while start != -1 and start + 8 <= len(data):
+        low, high = struct.unpack_from("<2H", data, start + 4)
+        yield low | high << 8
+        start = data.find(marker, start + 8)
+
+
+class AudioLedger:
+    """Send times of marked audio chunks, and the latency at which they arrived."""
+
+    def __init__(self):
+        self.sent = {}
+        self.latencies = []
+        self.bytes_sent = 0
+        self.seq = itertools.count()
+
+    def send(self, frame: bytearray, marker: bytes) -> bytes:
+        seq = next(self.seq)
+        self.sent[seq] = time.monotonic()
+        self.bytes_sent += len(frame)
+        return mark_frame(frame, marker, seq)
+
+    def receive(self, data: bytes, marker: bytes):
+        now = time.monotonic()
+        for seq in find_markers(data, marker):
+            sent = self.sent.pop(seq, None)
+            if sent is not None:
+                self.latencies.append(now - sent)
+
+
+class MockRealtime:
+    def __init__(self, turns: int = 5, silence: float = 0.5, response_audio: float = 2.0, delta_seconds: float = 0.1,
+                 speedup: float = 4.0, jitter: float = 0.0, downstream: AudioLedger = None, upstream: AudioLedger = None,
+                 seed: int = 0, handshake: float = 0.0, drop_every: int = 0):
+        self.turns = turns
+        self.silence = silence
+        self.response_audio = response_audio
+        self.delta_seconds = delta_seconds
+        self.speedup = speedup
+        self.jitter = jitter
+        self.random = random.Random(seed)
+        self.handshake = handshake
+        self.drop_every = drop_every
+        self.downstream = downstream or AudioLedger()   # response.audio.delta -> robot speaker
+        self.upstream = upstream or AudioLedger()       # robot microphone -> input_audio_buffer.append
+        self.responses = 0
+        self.cancelled = 0
+        self.dropped = 0
+        self.sessions = 0
+        self.truncations = []       # audio_end_ms of conversation.item.truncate
+        self.items = 0              # conversation items in the latest session
+        self.max_items = 0
+        self.events = {}
+        self.done = asyncio.Event()
+        self.ids = itertools.count(1)
+        self.server = None
+        self.port = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> int:
+        self.server = await serve(self._session, host, port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self.port
+
+    async def close(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+
+    def new_id(self, prefix: str) -> str:
+        return f"{prefix}_{next(self.ids):06d}"
+
+    def turn_done(self):
+        if self.responses + self.cancelled + self.dropped > self.turns:
+            self.done.set()
+
+    async def _session(self, ws):
+        received = 0.0          # seconds of audio in the input buffer
+        speaking = False
+        quiet = 0.0
+        responder = None
+        current = {}
+        items = set()
+        user_item = None
+
+        async def send(event: dict):
+            await ws.send(json.dumps(event))
+
+        async def create_item(item: dict):
+            item = {**item, "id": item.get("id") or self.new_id("item")}
+            items.add(item["id"])
+            self.items = len(items)
+            self.max_items = max(self.max_items, len(items))
+            await send({"type": "conversation.item.created", "item": item})
+            return item["id"]
+
+        async def respond():
+            response_id = self.new_id("resp")
+            item_id = self.new_id("item")
+            current.update(response_id=response_id)
+            await send({"type": "response.created", "response": {"id": response_id, "status": "in_progress"}})
+            await create_item({"id": item_id, "type": "message", "role": "assistant", "content": [{"type": "audio"}]})
+            chunk = tone(self.delta_seconds, 4000, 330.0)
+            deltas = int(self.response_audio / self.delta_seconds)
+            number = self.responses + self.cancelled + self.dropped + 1
+            for i in range(deltas):
+                if self.drop_every and number % self.drop_every == 0 and i == deltas // 2:
+                    self.dropped += 1
+                    self.turn_done()
+                    await ws.close()
+                    return
+                delta = self.downstream.send(bytearray(chunk), OUT_MARKER)
+                await send({
+                    "type": "response.audio.delta",
+                    "response_id": response_id,
+                    "item_id": item_id,
+                    "delta": base64.b64encode(delta).decode(),
+                })
+                await asyncio.sleep(self.delta_seconds / self.speedup + self.random.uniform(0.0, self.jitter))
+            await send({"type": "response.audio_transcript.done", "response_id": response_id, "item_id": item_id,
+                        "transcript": f"Robot response {number}."})
+            await send({"type": "response.audio.done", "response_id": response_id, "item_id": item_id})
+            await send({"type": "response.done", "response": {"id": response_id, "status": "completed"}})
+            self.responses += 1
+            self.turn_done()
+
+        async def cancel() -> bool:
+            nonlocal responder
+            if responder is None or responder.done():
+                return False
+            responder.cancel()
+            responder = None
+            self.cancelled += 1
+            await send({"type": "response.done", "response": {"id": current.get("response_id"), "status": "cancelled"}})
+            self.turn_done()
+            return True
+
+        await asyncio.sleep(self.handshake)
+        self.sessions += 1
+        await send({"type": "session.created", "session": {"id": self.new_id("sess")}})
+        try:
+            async for message in ws:
+                event = json.loads(message)
+                kind = event.get("type")
+                self.events[kind] = self.events.get(kind, 0) + 1
+
+                if kind == "conversation.item.create":
+                    item = event.get("item", {})
+                    content = [{key: value for key, value in part.items() if key != "image_url"} for part in item.get("content", [])]
+                    await create_item({**item, "content": content})
+                elif kind == "conversation.item.delete":
+                    if event.get("item_id") in items:
+                        items.discard(event.get("item_id"))
+                        self.items = len(items)
+                        await send({"type": "conversation.item.deleted", "item_id": event.get("item_id")})
+                    else:
+                        await send({"type": "error", "error": {"type": "invalid_request_error", "code": "item_not_found"}})
+                elif kind == "response.create":
+                    responder = asyncio.create_task(respond())
+                elif kind == "response.cancel":
+                    if not await cancel():
+                        await send({"type": "error", "error": {"type": "invalid_request_error", "code": "response_cancel_not_active"}})
+                elif kind == "conversation.item.truncate":
+                    self.truncations.append(event.get("audio_end_ms"))
+                    await send({"type": "conversation.item.truncated", "item_id": event.get("item_id"),
+                                "content_index": 0, "audio_end_ms": event.get("audio_end_ms")})
+                elif kind == "input_audio_buffer.append":
+                    audio = base64.b64decode(event.get("audio", ""))
+                    self.upstream.receive(audio, MIC_MARKER)
+                    seconds = len(audio) / BYTES_PER_SECOND
+                    received += seconds
+                    if is_loud(audio):
+                        quiet = 0.0
+                        if not speaking:
+                            speaking = True
+                            user_item = self.new_id("item")
+                            await send({"type": "input_audio_buffer.speech_started", "audio_start_ms": int(received * 1000), "item_id": user_item})
+                            await cancel()
+                    elif speaking:
+                        quiet += seconds
+                        if quiet >= self.silence:
+                            speaking = False
+                            await send({"type": "input_audio_buffer.speech_stopped", "audio_end_ms": int(received * 1000), "item_id": user_item})
+                            await send({"type": "input_audio_buffer.committed", "item_id": user_item})
+                            await create_item({"id": user_item, "type": "message", "role": "user", "content": [{"type": "input_audio"}]})
+                            responder = asyncio.create_task(respond())
+                            await send({"type": "conversation.item.input_audio_transcription.completed",
+                                        "item_id": user_item, "content_index": 0, "transcript": "User turn."})
+        except ConnectionClosed:
+            pass
+        finally:
+            if responder is not None:
+                responder.cancel()
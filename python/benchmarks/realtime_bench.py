@@ -0,0 +1,197 @@
+import argparse
+import asyncio
+import json
+import os
+import signal
+import sys
+import tempfile
+from mock_furhat import MockFurhatAudio
+from mock_realtime import AudioLedger, MockRealtime
+from run_bench import percentile
+
+# Benchmarks the audio path of the realtime bridges against a mock OpenAI
+# Realtime server and a mock Furhat streaming 24 kHz microphone audio in real
+# time. Reports microphone-to-upstream and delta-to-speaker latency, event
+# loop lag and CPU time per second of microphone audio. Run from python/:
+#
+#     python benchmarks/realtime_bench.py --turns 5
+#
+# With --interrupt_after, the mock user talks over every robot response, and
+# the time from the user's speech to the robot stopping is reported as
+# barge_in (try it with and without --barge_in).
+#
+# With --drop_every N, the mock server drops the connection halfway through
+# every Nth response; the bridge's start-up time and reconnect gaps are
+# reported (try it with and without --no_standby, and with --handshake_ms).
+#
+# The mock Furhat listens on 127.0.0.1:9000, so that port must be free.
+
+BRIDGES = ("openai_realtime", "openai_realtime_vision")
+RUNNER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "realtime_runner.py")
+
+
+def distribution(values: list) -> dict:
+    return {q: percentile(values, p) for q, p in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99), ("max", 1.0))}
+
+
+async def run_bridge(bridge: str, args) -> dict:
+    upstream, downstream = AudioLedger(), AudioLedger()
+    realtime = MockRealtime(turns=args.turns, response_audio=args.response_audio, speedup=args.speedup,
+                            jitter=args.delta_jitter, upstream=upstream, downstream=downstream,
+                            handshake=args.handshake_ms / 1000, drop_every=args.drop_every)
+    port = await realtime.start()
+    furhat = MockFurhatAudio(upstream, downstream, frame_seconds=args.frame_ms / 1000, camera_fps=args.camera_fps,
+                             interrupt_after=args.interrupt_after)
+    await furhat.start("127.0.0.1", 9000)
+
+    workdir = tempfile.mkdtemp(prefix=f"bench_{bridge}_")
+    stats_path = os.path.join(workdir, "stats.json")
+    log_path = os.path.join(workdir, "bridge.log")
+    env = {**os.environ, "OPENAI_REALTIME_URL": f"ws://127.0.0.1:{port}", "OPENAI_API_KEY": "mock"}
+    with open(log_path, "w") as log:
+        proc = await asyncio.create_subprocess_exec(
+            sys.executable, RUNNER, "--bridge", bridge, "--host", "127.0.0.1", "--stats", stats_path,
+            "--audio_window_ms", str(args.audio_window_ms), *(["--vad"] if args.vad else []),
+            *(["--barge_in"] if args.barge_in else []),
+            "--playout_ms", str(args.playout_ms), "--playout_lead_ms", str(args.playout_lead_ms),
+            "--playout_max_ms", str(args.playout_max_ms),
+            "--robot_sample_rate", str(args.robot_sample_rate),
+            "--camera_mode", args.camera_mode, "--camera_fps", str(args.bridge_camera_fps),
+            *(["--frame_bus", args.frame_bus] if args.frame_bus else []),
+            *(["--no_standby"] if args.no_standby else []),
+            "--context_turns", str(args.context_turns), "--context_images", str(args.context_images),
+            *(["--context_summary"] if args.context_summary else []),
+            cwd=workdir, env=env, stdin=asyncio.subprocess.DEVNULL, stdout=log, stderr=asyncio.subprocess.STDOUT,
+        )
+        done = asyncio.create_task(realtime.done.wait())
+        exited = asyncio.create_task(proc.wait())
+        try:
+            await asyncio.wait({done, exited}, timeout=args.max_time, return_when=asyncio.FIRST_COMPLETED)
+            if exited.done():
+                print(f"[{bridge}] exited with code {proc.returncode}, see {log_path}")
+            elif not done.done():
+                print(f"[{bridge}] did not finish within {args.max_time:.0f}s, see {log_path}")
+        finally:
+            done.cancel()
+            exited.cancel()
+            if proc.returncode is None:
+                proc.send_signal(signal.SIGINT)
+                try:
+                    await asyncio.wait_for(proc.wait(), timeout=5.0)
+                except asyncio.TimeoutError:
+                    proc.kill()
+                    await proc.wait()
+            await furhat.close()
+            await realtime.close()
+
+    stats = {"cpu_seconds": None, "loop_lag": [], "playout": {}, "session": {}, "context": {}}
+    if os.path.exists(stats_path):
+        with open(stats_path) as f:
+            stats = json.load(f)
+    mic_seconds = furhat.mic_frames * args.frame_ms / 1000
+    return {
+        "responses": realtime.responses,
+        "cancelled": realtime.cancelled,
+        "dropped": realtime.dropped,
+        "sessions": realtime.sessions,
+        "session": stats["session"],
+        "context": stats["context"],
+        "server_items": {"final": realtime.items, "max": realtime.max_items},
+        "truncations": realtime.truncations,
+        "barge_in": distribution(furhat.barge_in_latencies),
+        "mic_seconds": mic_seconds,
+        "mic_to_upstream": distribution(upstream.latencies),
+        "delta_to_speaker": distribution(downstream.latencies),
+        "loop_lag": distribution(stats["loop_lag"]),
+        "cpu_ms_per_audio_second": stats["cpu_seconds"] * 1000 / mic_seconds if stats["cpu_seconds"] and mic_seconds else None,
+        "upstream_frames": {"sent": furhat.mic_frames, "arrived": len(upstream.latencies)},
+        "downstream_chunks": {"sent": len(downstream.latencies) + len(downstream.sent), "arrived": len(downstream.latencies)},
+        "playout": stats["playout"],
+        "robot_stalls": {"count": furhat.stalls, "seconds": furhat.stall_seconds},
+        "camera_frames": furhat.camera_frames,
+        "events": realtime.events,
+    }
+
+
+def format_ms(value) -> str:
+    return "-" if value is None else f"{value * 1000:.1f}"
+
+
+def print_report(results: dict):
+    for bridge, r in results.items():
+        print(f"\n{bridge}: {r['responses']} responses, {r['cancelled']} cancelled, {r['mic_seconds']:.1f}s of microphone audio")
+        print(f"  {'(ms)':<20} {'p50':>7} {'p95':>7} {'p99':>7} {'max':>7}")
+        for name in ("mic_to_upstream", "delta_to_speaker", "barge_in", "loop_lag"):
+            d = r[name]
+            print(f"  {name:<20} {format_ms(d['p50']):>7} {format_ms(d['p95']):>7} {format_ms(d['p99']):>7} {format_ms(d['max']):>7}")
+        cpu = r["cpu_ms_per_audio_second"]
+        print(f"  CPU per audio second: {'-' if cpu is None else f'{cpu:.1f} ms'}")
+        up, down = r["upstream_frames"], r["downstream_chunks"]
+        print(f"  microphone frames {up['arrived']}/{up['sent']} forwarded in {r['events'].get('input_audio_buffer.append', 0)} messages, "
+              f"response chunks {down['arrived']}/{down['sent']} played")
+        p, stalls = r["playout"], r["robot_stalls"]
+        if p.get("frames"):
+            print(f"  playout: {p['frames']} frames, {p['underruns']} underruns, {p['overruns']} overruns "
+                  f"({p.get('dropped', 0) * 1000:.0f} ms dropped), latency avg {p['latency_avg'] * 1000:.0f} ms, max {p['latency_max'] * 1000:.0f} ms")
+        print(f"  robot stalls: {stalls['count']}, {stalls['seconds'] * 1000:.0f} ms of silence")
+        if r["camera_frames"]:
+            print(f"  camera frames sent by the robot: {r['camera_frames']}")
+        session = r["session"]
+        if session.get("startup") is not None:
+            gaps = session["reconnect_gaps"]
+            line = f"  session: ready {session['startup'] * 1000:.0f} ms after start, {r['sessions']} opened, {r['dropped']} dropped"
+            if gaps:
+                line += (f", reconnect gap avg {sum(gaps) / len(gaps) * 1000:.0f} ms, max {max(gaps) * 1000:.0f} ms, "
+                         f"{r['events'].get('conversation.item.create', 0)} items replayed")
+            print(line)
+        context, items = r["context"], r["server_items"]
+        if context:
+            print(f"  context: {items['final']} items on the server at the end (max {items['max']}), "
+                  f"bridge estimate {context['items']} items ~{context['tokens']} tokens "
+                  f"(max {context['max_items']} items ~{context['max_tokens']} tokens), {context['pruned']} pruned")
+        if r["truncations"]:
+            print(f"  {len(r['truncations'])} items truncated, at {sum(r['truncations']) / len(r['truncations']):.0f} ms on average")
+
+
+async def main(args):
+    results = {}
+    for bridge in args.bridges:
+        print(f"Running {bridge}...")
+        results[bridge] = await run_bridge(bridge, args)
+    print_report(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bridges", nargs="+", choices=BRIDGES, default=list(BRIDGES))
+    parser.add_argument("--turns", type=int, default=5, help="User turns after the greeting")
+    parser.add_argument("--frame_ms", type=float, default=20.0, help="Microphone frame length")
+    parser.add_argument("--response_audio", type=float, default=2.0, help="Seconds of audio per response")
+    parser.add_argument("--speedup", type=float, default=4.0, help="How much faster than real time responses are streamed")
+    parser.add_argument("--audio_window_ms", type=float, default=40, help="Bridge microphone merge window")
+    parser.add_argument("--vad", action="store_true", help="Run the bridges with the local voice gate")
+    parser.add_argument("--barge_in", action="store_true", help="Run the bridges with barge-in")
+    parser.add_argument("--interrupt_after", type=float, default=None, help="The user talks over each robot response after this many seconds")
+    parser.add_argument("--delta_jitter", type=float, default=0.0, help="Up to this many seconds of random delay before each response delta")
+    parser.add_argument("--playout_ms", type=float, default=100, help="Bridge playout buffer target")
+    parser.add_argument("--playout_lead_ms", type=float, default=200, help="Bridge playout lead")
+    parser.add_argument("--playout_max_ms", type=float, default=3000, help="Bridge playout maximum depth")
+    parser.add_argument("--robot_sample_rate", type=int, default=24000,
+                        help="Robot side audio rate (the latency markers do not survive resampling)")
+    parser.add_argument("--camera_fps", type=float, default=5.0, help="Mock camera stream rate")
+    parser.add_argument("--camera_mode", choices=("stream", "rate", "on_demand"), default="on_demand", help="Vision bridge camera mode")
+    parser.add_argument("--frame_bus", type=str, default=None, help="Vision bridge shared memory frame bus name")
+    parser.add_argument("--bridge_camera_fps", type=float, default=1.0, help="Vision bridge frame rate with --camera_mode rate")
+    parser.add_argument("--handshake_ms", type=float, default=0.0, help="Mock server delay before session.created")
+    parser.add_argument("--drop_every", type=int, default=0, help="Mock server drops the connection during every Nth response")
+    parser.add_argument("--no_standby", action="store_true", help="Run the bridges without a standby session")
+    parser.add_argument("--context_turns", type=int, default=0, help="Bridge conversation window in turns (0 keeps all)")
+    parser.add_argument("--context_images", type=int, default=0, help="Vision bridge images kept in the conversation (0 keeps all)")
+    parser.add_argument("--context_summary", action="store_true", help="Bridges keep a summary of deleted turns")
+    parser.add_argument("--max_time", type=float, default=120.0, help="Seconds before a bridge run is abandoned")
+    parser.add_argument("--output", type=str, default=None, help="Write the results as JSON to this file")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,74 @@
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import sys
+import time
+
+# Runs a realtime bridge in this process with an event loop lag probe, and
+# writes loop lag samples and CPU time to a JSON file when the bridge exits.
+# Started by realtime_bench.py.
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+async def probe_loop_lag(samples: list, interval: float = 0.01):
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, loop.time() - expected))
+
+
+async def main(args):
+    module = importlib.import_module(args.bridge)
+    options = {}
+    if args.bridge == "openai_realtime_vision":
+        options = {"camera_mode": args.camera_mode, "camera_fps": args.camera_fps, "frame_bus": args.frame_bus,
+                   "context_images": args.context_images}
+    bridge = module.OpenAIRealtimeFurhatBridge(args.host, audio_window=args.audio_window_ms / 1000, vad=args.vad,
+                                              barge_in=args.barge_in, playout_target=args.playout_ms / 1000,
+                                              playout_lead=args.playout_lead_ms / 1000, playout_max=args.playout_max_ms / 1000,
+                                              robot_sample_rate=args.robot_sample_rate,
+                                              standby=not args.no_standby, context_turns=args.context_turns,
+                                              context_summary=args.context_summary, **options)
+    lag = []
+    cpu_start = time.process_time()
+    wall_start = time.monotonic()
+    probe = asyncio.create_task(probe_loop_lag(lag))
+    try:
+        await bridge.run()
+    finally:
+        probe.cancel()
+        with open(args.stats, "w") as f:
+            json.dump({
+                "cpu_seconds": time.process_time() - cpu_start,
+                "wall_seconds": time.monotonic() - wall_start,
+                "loop_lag": lag,
+                "playout": bridge.playout.stats(),
+                "session": bridge.connector.stats(),
+                "context": bridge.context.stats(),
+            }, f)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bridge", choices=("openai_realtime", "openai_realtime_vision"), default="openai_realtime")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--stats", type=str, required=True)
+    parser.add_argument("--audio_window_ms", type=float, default=40)
+    parser.add_argument("--vad", action="store_true")
+    parser.add_argument("--barge_in", action="store_true")
+    parser.add_argument("--playout_ms", type=float, default=100)
+    parser.add_argument("--playout_lead_ms", type=float, default=200)
+    parser.add_argument("--playout_max_ms", type=float, default=3000)
+    parser.add_argument("--robot_sample_rate", type=int, default=24000)
+    parser.add_argument("--camera_mode", choices=("stream", "rate", "on_demand"), default="on_demand")
+    parser.add_argument("--camera_fps", type=float, default=1.0)
+    parser.add_argument("--frame_bus", type=str, default=None)
+    parser.add_argument("--no_standby", action="store_true")
+    parser.add_argument("--context_turns", type=int, default=0)
+    parser.add_argument("--context_images", type=int, default=0)
+    parser.add_argument("--context_summary", action="store_true")
+    asyncio.run(main(parser.parse_args()))
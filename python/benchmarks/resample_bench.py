@@ -0,0 +1,63 @@
+import argparse
+import base64
+import os
+import sys
+import time
+import numpy as np
+
+# Micro-benchmark for the streaming resampler (realtime_audio.StreamResampler)
+# used when the robot side runs at another rate than OpenAI's 24 kHz. Times
+# the microphone path (robot rate -> 24 kHz, base64 in and out) and the
+# speaker path (24 kHz frames -> robot rate), and checks that chunked output
+# matches resampling the whole stream at once. Run from the python/ directory:
+#
+#     python benchmarks/resample_bench.py --robot_rate 16000
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from realtime_audio import StreamResampler
+
+OPENAI_RATE = 24000
+
+
+def test_signal(seconds: float, rate: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * rate)) / rate
+    signal = 8000 * np.sin(2 * np.pi * 220 * t) + 3000 * np.sin(2 * np.pi * 1700 * t) + rng.normal(0, 300, len(t))
+    return signal.astype("<i2")
+
+
+def run_path(name: str, rate_in: int, rate_out: int, chunk_ms: float, args):
+    samples = test_signal(args.seconds, rate_in, args.seed)
+    size = int(rate_in * chunk_ms / 1000)
+    chunks = [base64.b64encode(samples[i:i + size].tobytes()).decode() for i in range(0, len(samples), size)]
+
+    resampler = StreamResampler(rate_in, rate_out, taps=args.taps)
+    cpu = time.process_time()
+    out = [resampler.process(chunk) for chunk in chunks]
+    cpu = time.process_time() - cpu
+
+    chunked = np.frombuffer(b"".join(base64.b64decode(chunk) for chunk in out), dtype="<i2")
+    whole = StreamResampler(rate_in, rate_out, taps=args.taps).process_samples(samples)
+    mismatch = int(np.abs(chunked.astype(np.int32) - whole.astype(np.int32)).max()) if len(chunked) == len(whole) else None
+
+    print(f"{name}: {rate_in} -> {rate_out} Hz in {chunk_ms:.0f} ms chunks")
+    print(f"  {cpu / len(chunks) * 1e6:.1f} us per chunk, {cpu / args.seconds * 1000:.2f} ms CPU per audio second "
+          f"({args.seconds / max(cpu, 1e-9):.0f}x real time)")
+    print(f"  chunked vs whole stream: {'length differs' if mismatch is None else f'max difference {mismatch}'}")
+
+
+def main(args):
+    run_path("microphone", args.robot_rate, OPENAI_RATE, args.mic_ms, args)
+    run_path("speaker", OPENAI_RATE, args.robot_rate, args.speaker_ms, args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--robot_rate", type=int, default=16000)
+    parser.add_argument("--seconds", type=float, default=60.0)
+    parser.add_argument("--mic_ms", type=float, default=20.0, help="Microphone chunk length")
+    parser.add_argument("--speaker_ms", type=float, default=40.0, help="Playout frame length")
+    parser.add_argument("--taps", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=0)
+    main(parser.parse_args())
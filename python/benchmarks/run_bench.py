@@ -0,0 +1,156 @@
+import argparse
+import asyncio
+import json
+import os
+import signal
+import sys
+import tempfile
+from mock_furhat import DEFAULT_SCRIPT, MockFurhat
+from mock_ollama import MockOllama
+
+# Drives the Ollama bridges through a scripted conversation against a mock
+# Furhat and a mock Ollama server, and reports turn latency percentiles as
+# measured on the robot side. Run from the python/ directory:
+#
+#     python benchmarks/run_bench.py --ttft 0.2 --tokens_per_second 50
+#
+# The mock Furhat listens on 127.0.0.1:9000, so that port must be free.
+
+PYTHON_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SYSTEM_PROMPT = "You are a friendly robot. Keep ALL responses under 15 words."
+
+BRIDGES = ("ollama_async", "v2_ollama_async", "furhat_ollama_streamchat")
+
+METRICS = {
+    "first_speak_request": ("hear_end", "speak_request"),
+    "response": ("hear_end", "speak_start"),
+    "turn": ("hear_end", "speak_end"),
+}
+
+
+def bridge_command(bridge: str, ollama_url: str, speculative: bool):
+    """Command line and extra environment for one bridge."""
+    env = {}
+    if bridge == "ollama_async":
+        cmd = ["ollama_async.py", "--host", "127.0.0.1", "--ollama_url", ollama_url, "--model", "mock",
+               "--metrics_port", "0", "--trace_file", ""]
+        if speculative:
+            cmd.append("--speculative")
+    elif bridge == "v2_ollama_async":
+        cmd = ["v2_ollama_async.py"]
+        env = {"FURHAT_HOST": "127.0.0.1", "OLLAMA_URLS": ollama_url, "OLLAMA_MODEL": "mock",
+               "METRICS_PORT": "0", "TURN_TRACE_FILE": "", "OLLAMA_SPECULATIVE": "1" if speculative else "0"}
+    else:
+        cmd = ["ui/furhat_ollama_streamchat.py", "--furhat_ip", "127.0.0.1", "--ollama_ip", ollama_url, "--model", "mock",
+               "--system_prompt", SYSTEM_PROMPT, "--metrics_port", "0", "--trace_file", ""]
+        if speculative:
+            cmd.append("--speculative")
+    return [sys.executable, os.path.join(PYTHON_DIR, cmd[0]), *cmd[1:]], env
+
+
+def percentile(values: list, q: float):
+    if not values:
+        return None
+    data = sorted(values)
+    return data[min(len(data) - 1, int(round(q * (len(data) - 1))))]
+
+
+def summarize(turns: list) -> dict:
+    result = {"turns": len(turns), "failed": sum(1 for t in turns if not t["ok"])}
+    for name, (start, end) in METRICS.items():
+        values = [t[end] - t[start] for t in turns if t["ok"] and end in t]
+        result[name] = {q: percentile(values, p) for q, p in (("p50", 0.5), ("p90", 0.9), ("p95", 0.95), ("p99", 0.99))}
+    return result
+
+
+async def run_bridge(bridge: str, args) -> dict:
+    ollama = MockOllama(args.ttft, args.tokens_per_second, seed=args.seed)
+    port = await ollama.start()
+    furhat = MockFurhat(
+        (args.script or DEFAULT_SCRIPT) * args.repeat,
+        user_speech=args.user_speech,
+        words_per_second=args.words_per_second,
+        pause=args.pause,
+    )
+    await furhat.start("127.0.0.1", 9000)
+
+    cmd, env = bridge_command(bridge, f"http://127.0.0.1:{port}", args.speculative)
+    workdir = tempfile.mkdtemp(prefix=f"bench_{bridge}_")
+    log_path = os.path.join(workdir, "bridge.log")
+    with open(log_path, "w") as log:
+        proc = await asyncio.create_subprocess_exec(
+            *cmd, cwd=workdir, env={**os.environ, **env}, stdout=log, stderr=asyncio.subprocess.STDOUT,
+        )
+        done = asyncio.create_task(furhat.done.wait())
+        exited = asyncio.create_task(proc.wait())
+        try:
+            await asyncio.wait({done, exited}, timeout=args.max_time, return_when=asyncio.FIRST_COMPLETED)
+            if exited.done():
+                print(f"[{bridge}] exited with code {proc.returncode}, see {log_path}")
+            elif not done.done():
+                print(f"[{bridge}] did not finish within {args.max_time:.0f}s, see {log_path}")
+        finally:
+            done.cancel()
+            exited.cancel()
+            if proc.returncode is None:
+                proc.send_signal(signal.SIGINT)
+                try:
+                    await asyncio.wait_for(proc.wait(), timeout=5.0)
+                except asyncio.TimeoutError:
+                    proc.kill()
+                    await proc.wait()
+            await furhat.close()
+            await ollama.close()
+
+    result = summarize(furhat.turns)
+    result["llm_requests"] = ollama.requests
+    return result
+
+
+def format_ms(value) -> str:
+    return "-" if value is None else f"{value * 1000:.0f}"
+
+
+def print_report(results: dict):
+    print(f"\n{'bridge':<26} {'metric':<20} {'p50':>7} {'p90':>7} {'p95':>7} {'p99':>7}   (ms)")
+    for bridge, result in results.items():
+        for i, name in enumerate(METRICS):
+            label = bridge if i == 0 else ""
+            p = result[name]
+            print(f"{label:<26} {name:<20} {format_ms(p['p50']):>7} {format_ms(p['p90']):>7} {format_ms(p['p95']):>7} {format_ms(p['p99']):>7}")
+        print(f"{'':<26} {result['turns']} turns, {result['failed']} failed, {result['llm_requests']} LLM requests")
+
+
+async def main(args):
+    results = {}
+    for bridge in args.bridges:
+        print(f"Running {bridge}...")
+        results[bridge] = await run_bridge(bridge, args)
+    print_report(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bridges", nargs="+", choices=BRIDGES, default=list(BRIDGES))
+    parser.add_argument("--ttft", type=float, default=0.2, help="Mock Ollama seconds until the first token")
+    parser.add_argument("--tokens_per_second", type=float, default=50.0, help="Mock Ollama generation speed")
+    parser.add_argument("--user_speech", type=float, default=0.3, help="Seconds from hear_start to hear_end")
+    parser.add_argument("--words_per_second", type=float, default=15.0, help="Simulated robot speaking rate")
+    parser.add_argument("--pause", type=float, default=0.5, help="Robot silence before the next user utterance")
+    parser.add_argument("--repeat", type=int, default=2, help="Times to repeat the conversation script")
+    parser.add_argument("--script", type=str, default=None, help="Text file with one user utterance per line")
+    parser.add_argument("--speculative", action="store_true", help="Run the bridges with speculative generation")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max_time", type=float, default=300.0, help="Seconds before a bridge run is abandoned")
+    parser.add_argument("--output", type=str, default=None, help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    if args.script:
+        with open(args.script) as f:
+            args.script = [line.strip() for line in f if line.strip()]
+
+    asyncio.run(main(args))
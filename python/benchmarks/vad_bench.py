@@ -0,0 +1,64 @@
+import argparse
+import base64
+import os
+import sys
+import time
+import numpy as np
+
+# Micro-benchmark for the local voice gate (realtime_audio.VoiceGate): feeds
+# synthetic 24 kHz microphone audio through it in Furhat-sized chunks and
+# reports processing cost and how much audio was suppressed. Run from the
+# python/ directory:
+#
+#     python benchmarks/vad_bench.py --seconds 120
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from realtime_audio import VoiceGate
+
+SAMPLE_RATE = 24000
+
+
+def synthetic_audio(seconds: float, speech: float, pause: float, noise_db: float, seed: int) -> np.ndarray:
+    """Alternating voiced 'utterances' and background noise, as PCM16."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    noise = rng.normal(0.0, 32768 * 10 ** (noise_db / 20), len(t))
+    # harmonics of a wandering pitch, syllable-rate amplitude modulation
+    pitch = 140 + 30 * np.sin(2 * np.pi * 0.7 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / SAMPLE_RATE
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 6)) * 5000 * (0.6 + 0.4 * np.sin(2 * np.pi * 4 * t))
+    talking = (t % (speech + pause)) < speech
+    return np.clip(noise + voiced * talking, -32768, 32767).astype("<i2"), talking
+
+
+def main(args):
+    audio, talking = synthetic_audio(args.seconds, args.speech, args.pause, args.noise_db, args.seed)
+    chunk = int(SAMPLE_RATE * args.chunk_ms / 1000)
+    chunks = [base64.b64encode(audio[i:i + chunk].tobytes()).decode() for i in range(0, len(audio), chunk)]
+
+    gate = VoiceGate(SAMPLE_RATE, threshold_db=args.threshold_db)
+    cpu = time.process_time()
+    wall = time.perf_counter()
+    sent = 0
+    for audio_chunk in chunks:
+        sent += len(gate.process(audio_chunk))
+    cpu = time.process_time() - cpu
+    wall = time.perf_counter() - wall
+
+    print(f"{args.seconds:.0f}s of audio in {len(chunks)} chunks of {args.chunk_ms:.0f} ms ({talking.mean():.0%} speech)")
+    print(f"  {wall / len(chunks) * 1e6:.1f} us per chunk, {cpu / args.seconds * 1000:.2f} ms CPU per audio second "
+          f"({args.seconds / max(cpu, 1e-9):.0f}x real time)")
+    print(f"  sent {sent} chunks, suppressed {gate.suppressed:.0%} of the audio")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=60.0)
+    parser.add_argument("--chunk_ms", type=float, default=20.0, help="Microphone chunk length")
+    parser.add_argument("--speech", type=float, default=2.0, help="Seconds per utterance")
+    parser.add_argument("--pause", type=float, default=3.0, help="Seconds of background noise between utterances")
+    parser.add_argument("--noise_db", type=float, default=-60.0, help="Background noise level in dBFS")
+    parser.add_argument("--threshold_db", type=float, default=-45.0)
+    parser.add_argument("--seed", type=int, default=0)
+    main(parser.parse_args())
@@ -0,0 +1,119 @@
+import asyncio
+
+
+SUMMARY_INSTRUCTION = (
+    "Update the running summary of a conversation between a user and a robot. "
+    "Keep names, facts, preferences and open questions; drop small talk. "
+    "Answer with the new summary only, in at most 120 words."
+)
+
+
+def estimate_tokens(text: str) -> int:
+    # roughly four characters per token for English text
+    return len(text) // 4 + 1
+
+
+def summary_request(summary: str, messages: list) -> str:
+    """Builds the user message for a summarization call."""
+    transcript = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+    return f"Current summary:\n{summary or '(none)'}\n\nNew conversation:\n{transcript}"
+
+
+class DialogHistory:
+    """
+    Dialog history bounded by a token budget.
+
+    Recent messages are kept verbatim up to `token_budget` estimated tokens.
+    Older messages are folded into a rolling summary by `summarize(summary, messages)`,
+    which runs in the background only while no live turn is in flight, and is
+    cancelled as soon as one starts. Until then they stay in the prompt as is,
+    up to `pending_budget` tokens (default `token_budget`); beyond that, the
+    oldest are dropped unsummarized.
+    """
+
+    def __init__(self, token_budget: int = 1500, summarize=None, idle_delay: float = 2.0, pending_budget: int = None):
+        self.token_budget = token_budget
+        self.pending_budget = token_budget if pending_budget is None else pending_budget
+        self.summarize = summarize
+        self.idle_delay = idle_delay
+        self.messages = []
+        self.pending = []       # evicted from the window, not yet summarized
+        self.summary = ""
+        self.dropped = 0
+        self.live = 0
+        self.task = None
+
+    def append(self, role: str, content: str, merge: bool = False):
+        if merge and self.messages and self.messages[-1]["role"] == role:
+            self.messages[-1]["content"] += " " + content
+        else:
+            self.messages.append({"role": role, "content": content})
+        self._enforce_budget()
+
+    def prompt(self, system_prompt: str, system_role: str = "system") -> list:
+        messages = [{"role": system_role, "content": system_prompt}]
+        if self.summary:
+            messages.append({"role": system_role, "content": "Summary of the earlier conversation: " + self.summary})
+        return messages + self.pending + self.messages
+
+    def user_turns(self) -> int:
+        """Earlier user turns in the prompt; a summary counts as one."""
+        turns = sum(1 for m in self.pending + self.messages if m["role"] == "user")
+        return turns + (1 if self.summary else 0)
+
+    def tokens(self) -> int:
+        return sum(estimate_tokens(m["content"]) for m in self.pending + self.messages) + estimate_tokens(self.summary)
+
+    def begin_turn(self):
+        """A live request started: stay out of its way."""
+        self.live += 1
+        if self.task and not self.task.done():
+            self.task.cancel()
+
+    def end_turn(self):
+        self.live = max(0, self.live - 1)
+        self._schedule()
+
+    def _enforce_budget(self):
+        while len(self.messages) > 2 and sum(estimate_tokens(m["content"]) for m in self.messages) > self.token_budget:
+            self.pending.append(self.messages.pop(0))
+        if self.summarize is None:
+            self.pending.clear()
+        while len(self.pending) > 1 and sum(estimate_tokens(m["content"]) for m in self.pending) > self.pending_budget:
+            self.pending.pop(0)
+            self.dropped += 1
+        self._schedule()
+
+    def _schedule(self):
+        if self.summarize is None or not self.pending or self.live:
+            return
+        if self.task and not self.task.done():
+            return
+        self.task = asyncio.create_task(self._compact())
+
+    async def _compact(self):
+        await asyncio.sleep(self.idle_delay)
+        if self.live or not self.pending:
+            return
+        batch = list(self.pending)
+        try:
+            summary = await self.summarize(self.summary, batch)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[History] summarization failed: {e}")
+            return
+        if summary:
+            self.summary = summary.strip()
+            # the oldest may have been dropped meanwhile
+            folded = {id(m) for m in batch}
+            self.pending[:] = [m for m in self.pending if id(m) not in folded]
+            print(f"[History] folded {len(batch)} messages into summary (~{self.tokens()} tokens in prompt)")
+
+    async def close(self):
+        if self.task and not self.task.done():
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
@@ -0,0 +1,133 @@
+import multiprocessing
+import struct
+import sys
+import time
+import numpy as np
+from multiprocessing import resource_tracker, shared_memory
+
+# Camera frames shared with other local processes through a shared memory
+# ring buffer, so a monitoring UI or a face-analysis process can see what the
+# bridge sees without its own camera subscription to the robot.
+#
+# Layout: a bus header (magic, version, slot count, slot size, latest
+# sequence number), then `slots` slots of a slot header (sequence number,
+# wall-clock timestamp, height, width, channels, byte count) followed by
+# the RGB pixels. A slot's sequence number is 0 while it is being written.
+
+MAGIC = b"FHFB"
+VERSION = 1
+BUS_HEADER = struct.Struct("<4sIIIQ")
+SLOT_HEADER = struct.Struct("<QdIIII")
+LATEST_OFFSET = 16
+
+
+class FrameBus:
+    """
+    Writer side: publishes RGB frames of up to `width` x `height` into a
+    named shared memory ring. Fails if the name is taken, since it may
+    belong to a running writer.
+    """
+
+    def __init__(self, name: str, width: int, height: int, channels: int = 3, slots: int = 4):
+        self.name = name
+        self.slots = slots
+        self.slot_bytes = width * height * channels
+        size = BUS_HEADER.size + slots * (SLOT_HEADER.size + self.slot_bytes)
+        try:
+            self.shm = shared_memory.SharedMemory(name, create=True, size=size)
+        except FileExistsError:
+            raise FileExistsError(f"shared memory '{name}' already exists: another frame bus is using it, or one "
+                                  f"that did not shut down cleanly left it behind (on Linux, remove /dev/shm/{name})")
+        self.seq = 0
+        self.published = 0
+        self.publish_time = 0.0
+        BUS_HEADER.pack_into(self.shm.buf, 0, MAGIC, VERSION, slots, self.slot_bytes, 0)
+
+    def publish(self, image: np.ndarray) -> bool:
+        """Copy an HxWxC uint8 frame into the next slot; False if it does not fit."""
+        if image.nbytes > self.slot_bytes:
+            return False
+        start = time.perf_counter()
+        seq = self.seq + 1
+        offset = BUS_HEADER.size + (seq % self.slots) * (SLOT_HEADER.size + self.slot_bytes)
+        height, width, channels = image.shape if image.ndim == 3 else (*image.shape, 1)
+        buf = self.shm.buf
+        SLOT_HEADER.pack_into(buf, offset, 0, 0.0, 0, 0, 0, 0)
+        pixels = np.ndarray(image.shape, dtype=np.uint8, buffer=buf, offset=offset + SLOT_HEADER.size)
+        np.copyto(pixels, image, casting="unsafe")
+        SLOT_HEADER.pack_into(buf, offset, seq, time.time(), height, width, channels, image.nbytes)
+        struct.pack_into("<Q", buf, LATEST_OFFSET, seq)
+        del pixels
+        self.seq = seq
+        self.published += 1
+        self.publish_time += time.perf_counter() - start
+        return True
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+    def summary(self) -> str:
+        avg = self.publish_time / self.published * 1000 if self.published else 0.0
+        return f"{self.published} frames published to shared memory '{self.name}', {avg:.2f} ms per frame"
+
+
+class FrameBusReader:
+    """
+    Reader side. latest() returns the newest frame as (seq, timestamp, image),
+    or None if there is nothing new. With copy=False the image is a view
+    into shared memory; it stays valid until the writer reuses the slot,
+    which valid(seq) tells. Drop such views before close().
+    """
+
+    def __init__(self, name: str):
+        if sys.version_info >= (3, 13):
+            self.shm = shared_memory.SharedMemory(name, track=False)
+        else:
+            self.shm = shared_memory.SharedMemory(name)
+            # readers must not remove the segment when they exit; child processes
+            # share their parent's tracker, where the writer may be registered
+            if multiprocessing.parent_process() is None:
+                resource_tracker.unregister(self.shm._name, "shared_memory")
+        magic, version, self.slots, self.slot_bytes, _ = BUS_HEADER.unpack_from(self.shm.buf, 0)
+        if magic != MAGIC or version != VERSION:
+            self.shm.close()
+            raise ValueError(f"shared memory '{name}' is not a frame bus")
+        self.last_seq = 0
+
+    def _offset(self, seq: int) -> int:
+        return BUS_HEADER.size + (seq % self.slots) * (SLOT_HEADER.size + self.slot_bytes)
+
+    def latest(self, copy: bool = True):
+        buf = self.shm.buf
+        for _ in range(3):
+            seq = struct.unpack_from("<Q", buf, LATEST_OFFSET)[0]
+            if seq == 0 or seq == self.last_seq:
+                return None
+            offset = self._offset(seq)
+            slot_seq, timestamp, height, width, channels, _ = SLOT_HEADER.unpack_from(buf, offset)
+            if slot_seq != seq:
+                continue        # overwritten while we looked
+            image = np.ndarray((height, width, channels), dtype=np.uint8, buffer=buf, offset=offset + SLOT_HEADER.size)
+            if copy:
+                image = image.copy()
+                if SLOT_HEADER.unpack_from(buf, offset)[0] != seq:
+                    continue
+            self.last_seq = seq
+            return seq, timestamp, image
+        return None
+
+    def valid(self, seq: int) -> bool:
+        return SLOT_HEADER.unpack_from(self.shm.buf, self._offset(seq))[0] == seq
+
+    def wait(self, timeout: float = 1.0, poll: float = 0.001, copy: bool = True):
+        """Block until a new frame is published, or return None after `timeout`."""
+        deadline = time.monotonic() + timeout
+        while True:
+            frame = self.latest(copy)
+            if frame is not None or time.monotonic() >= deadline:
+                return frame
+            time.sleep(poll)
+
+    def close(self):
+        self.shm.close()
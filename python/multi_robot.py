@@ -0,0 +1,287 @@
+import argparse
+import asyncio
+import itertools
+import json
+import time
+from collections import deque
+from contextlib import aclosing, asynccontextmanager
+from functools import partial
+from furhat_realtime_api import AsyncFurhatClient, Events
+from ollama_client import HedgedOllamaClient, OllamaPool, create_ollama_client, ollama_limits, parse_ollama_urls
+from ollama_residency import ResidencyGroup
+from speech_pipeline import SpeechPipeline
+from dialog_history import DialogHistory, SUMMARY_INSTRUCTION, summary_request
+from response_cache import ResponseCache
+
+# Serves several Furhat robots from one process. The robots and the shared
+# LLM settings are listed in a JSON config file, see robots.sample.json.
+
+
+class FairScheduler:
+    """
+    Shares a fixed number of concurrent LLM requests among robots.
+
+    A free slot goes to the waiting robot that was served least recently,
+    so a robot that talks a lot cannot keep the others waiting. Background
+    requests (history summaries) only get a slot when no live turn is
+    waiting, and do not count towards fairness.
+    """
+
+    def __init__(self, slots: int = 4):
+        self.free = slots
+        self.waiting = {}       # (robot, ticket) -> future
+        self.background = {}    # ticket -> future, served first come first served
+        self.last_served = {}   # robot -> ticket of its last grant
+        self.tickets = itertools.count()
+        self.waits = deque(maxlen=500)
+
+    @asynccontextmanager
+    async def slot(self, robot: str, background: bool = False):
+        start = time.monotonic()
+        queue = self.background if background else self.waiting
+        if self.free > 0 and not self.waiting and not queue:
+            self.free -= 1
+        else:
+            key = next(self.tickets) if background else (robot, next(self.tickets))
+            future = asyncio.get_running_loop().create_future()
+            queue[key] = future
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    self._release()     # granted just as we were cancelled
+                else:
+                    queue.pop(key, None)
+                raise
+        if not background:
+            self.last_served[robot] = next(self.tickets)
+            self.waits.append(time.monotonic() - start)
+        try:
+            yield
+        finally:
+            self._release()
+
+    def _release(self):
+        if self.waiting:
+            key = min(self.waiting, key=lambda k: (self.last_served.get(k[0], -1), k[1]))
+            self.waiting.pop(key).set_result(None)
+        elif self.background:
+            self.background.pop(min(self.background)).set_result(None)
+        else:
+            self.free += 1
+
+    def summary(self) -> str:
+        if not self.waits:
+            return "no requests"
+        waits = sorted(self.waits)
+        p50 = waits[len(waits) // 2]
+        p95 = waits[min(len(waits) - 1, int(0.95 * len(waits)))]
+        return (f"slot wait p50 {p50 * 1000:.0f} ms, p95 {p95 * 1000:.0f} ms, {len(self.waiting)} waiting, "
+                f"{len(self.background)} background waiting")
+
+
+class RobotSession:
+    """Connection and dialog state for one robot."""
+
+    __slots__ = ("name", "host", "system_prompt", "furhat", "speech", "history", "task", "turns")
+
+    def __init__(self, name: str, host: str, system_prompt: str, auth_key=None, history_budget: int = 400, summarize=None):
+        self.name = name
+        self.host = host
+        self.system_prompt = system_prompt
+        self.furhat = AsyncFurhatClient(host, auth_key=auth_key)
+        self.speech = SpeechPipeline(self.furhat)
+        self.history = DialogHistory(history_budget, summarize=summarize)
+        self.task = None
+        self.turns = 0
+
+    def cancel(self):
+        if self.task and not self.task.done():
+            self.task.cancel()
+
+
+class MultiRobotHost:
+    """
+    One process, many robots: a RobotSession per robot, one shared Ollama
+    pool and HTTP connection pool, and a FairScheduler in front of the LLM.
+    """
+
+    def __init__(self, config: dict):
+        self.model = config.get("model", "llama3.2:3b")
+        self.system_prompt = config.get("system_prompt", "You are a friendly robot. Keep ALL responses under 15 words.")
+        self.greeting = config.get("greeting", "Hi! How can I help you today?")
+        history_budget = config.get("history_budget", 400)
+        base_urls = parse_ollama_urls(config.get("ollama_urls", "http://127.0.0.1:11434"))
+        llm_slots = config.get("llm_slots", 4)
+
+        # servers added through the pool file later need max_servers
+        self.http = create_ollama_client(ollama_limits(llm_slots, max(len(base_urls), config.get("max_servers", 0))))
+        self.pool = OllamaPool(self.http, base_urls, model=self.model, pool_file=config.get("ollama_pool_file"))
+        self.ollama = HedgedOllamaClient(self.http, base_urls, hedge_delay=config.get("hedge_delay", 0.5), pool=self.pool)
+        self.residency = ResidencyGroup(self.http, self.pool, self.model, keep_alive=config.get("keep_alive", 1800.0))
+        self.scheduler = FairScheduler(llm_slots)
+        self.cache = None
+        if config.get("cache"):
+            self.cache = ResponseCache(path=config.get("cache_file"), max_context=config.get("cache_context", 0))
+
+        self.sessions = []
+        for robot in config["robots"]:
+            name = robot.get("name", robot["host"])
+            self.sessions.append(RobotSession(
+                name,
+                robot["host"],
+                robot.get("system_prompt", self.system_prompt),
+                auth_key=robot.get("auth_key"),
+                history_budget=history_budget,
+                summarize=partial(self.summarize, name),
+            ))
+        self.stop_event = asyncio.Event()
+
+    async def on_hear_start(self, session: RobotSession, event):
+        if session.speech.heard_start():
+            session.cancel()
+            session.speech.clear()
+
+    async def on_hear_end(self, session: RobotSession, event):
+        held = session.speech.held
+        user_text = event.get("text", "")
+        if not session.speech.heard_end(user_text) or not user_text.strip():
+            return
+        print(f"[{session.name}] User: {user_text}")
+        session.cancel()
+        if held:
+            session.speech.clear()
+        session.task = asyncio.create_task(self.respond(session, user_text))
+
+    async def stream_response(self, session: RobotSession, user_text: str):
+        cacheable = self.cache is not None and self.cache.cacheable(session.history.user_turns())
+        if cacheable:
+            cached = self.cache.get(user_text, session.system_prompt, self.model)
+            if cached is not None:
+                yield cached
+                return
+
+        payload = {
+            "model": self.model,
+            "messages": [*session.history.prompt(session.system_prompt), {"role": "user", "content": user_text}],
+            "stream": True,
+            "keep_alive": self.residency.keep_alive,
+            "options": {"temperature": 0.7, "num_predict": 150, "top_k": 20, "top_p": 0.9},
+        }
+
+        full_response = ""
+        session.history.begin_turn()
+        try:
+            async with self.scheduler.slot(session.name):
+                async with aclosing(self.ollama.stream_chat(payload)) as stream:
+                    async for chunk in stream:
+                        if content := chunk.get("message", {}).get("content"):
+                            full_response += content
+                            yield content
+        finally:
+            session.history.end_turn()
+
+        self.residency.touch(self.ollama.last_endpoints)
+        if cacheable:
+            self.cache.put(user_text, session.system_prompt, self.model, full_response.strip())
+
+    async def respond(self, session: RobotSession, user_text: str):
+        try:
+            session.speech.begin()
+            async with aclosing(self.stream_response(session, user_text)) as stream:
+                async for chunk in stream:
+                    await session.speech.feed(chunk)
+            await session.speech.finish()
+
+            response = await session.speech.wait_idle()
+            print(f"[{session.name}] Furhat: {response}")
+            session.history.append("user", user_text)
+            session.history.append("assistant", response)
+            session.turns += 1
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            print(f"[{session.name}] Error: {e}")
+            await session.speech.say("Sorry, I had trouble answering that.")
+
+    async def summarize(self, robot: str, summary: str, messages: list) -> str:
+        payload = {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": SUMMARY_INSTRUCTION},
+                {"role": "user", "content": summary_request(summary, messages)},
+            ],
+            "stream": False,
+            "keep_alive": self.residency.keep_alive,
+            "options": {"num_predict": 150},
+        }
+        async with self.scheduler.slot(robot, background=True):
+            response = await self.ollama.chat(payload, hedge=False)
+        return response.get("message", {}).get("content", "")
+
+    async def start_session(self, session: RobotSession) -> bool:
+        try:
+            await session.furhat.connect()
+        except Exception as e:
+            print(f"[{session.name}] Failed to connect to Furhat at {session.host}: {e}")
+            return False
+
+        session.furhat.add_handler(Events.response_hear_start, partial(self.on_hear_start, session))
+        session.furhat.add_handler(Events.response_hear_end, partial(self.on_hear_end, session))
+        session.speech.attach()
+
+        await session.furhat.request_attend_user()
+        await session.furhat.request_speak_text(self.greeting)
+        await session.furhat.request_listen_start(
+            concat=True,
+            stop_robot_start=True,
+            resume_robot_end=True,
+            end_speech_timeout=0.4,
+        )
+        print(f"[{session.name}] Connected to Furhat at {session.host}")
+        return True
+
+    async def stop_session(self, session: RobotSession):
+        session.cancel()
+        await session.speech.close()
+        await session.history.close()
+        try:
+            await session.furhat.disconnect()
+        except Exception:
+            pass
+
+    async def run(self):
+        # Load the model while the robots are being connected
+        warmup = asyncio.gather(self.ollama.start(), self.residency.start())
+        connected = await asyncio.gather(*(self.start_session(s) for s in self.sessions))
+        print(f"Serving {sum(connected)}/{len(self.sessions)} robots with {self.model}")
+        print("Press Ctrl+C to stop\n")
+
+        try:
+            await self.stop_event.wait()
+        finally:
+            warmup.cancel()
+            await asyncio.gather(*(self.stop_session(s) for s, ok in zip(self.sessions, connected) if ok))
+            for session in self.sessions:
+                print(f"[{session.name}] {session.turns} turns")
+            print(f"[Scheduler] {self.scheduler.summary()}")
+            print(f"[Ollama] {self.ollama.summary()}")
+            if self.cache:
+                self.cache.close()
+            await self.residency.stop()
+            await self.ollama.close()
+            await self.http.aclose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--config", type=str, default="robots.json", help="JSON file listing the robots and the shared LLM settings")
+    args = parser.parse_args()
+
+    with open(args.config) as f:
+        config = json.load(f)
+
+    try:
+        asyncio.run(MultiRobotHost(config).run())
+    except KeyboardInterrupt:
+        print("\nShutting down...")
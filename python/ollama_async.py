@@ -3,32 +3,72 @@ import argparse
 import signal
 import httpx
 from furhat_realtime_api import AsyncFurhatClient, Events
+from ollama_client import HedgedOllamaClient, OllamaPool, parse_ollama_urls
+from ollama_residency import ResidencyGroup
+from speculative import SpeculativeTurn
+from dialog_history import DialogHistory, SUMMARY_INSTRUCTION, summary_request
+from response_cache import ResponseCache
+from turn_metrics import TurnMetrics, TurnTracker
+
+
+class PromptEvalStats:
+    """Per-turn prompt evaluation cost, as reported by Ollama."""
+
+    def __init__(self):
+        self.turns = []
+
+    def record(self, data: dict, num_messages: int):
+        # prompt_eval_count only covers tokens that were not served from the KV cache
+        count = data.get("prompt_eval_count", 0)
+        seconds = data.get("prompt_eval_duration", 0) / 1e9
+        self.turns.append((num_messages, count, seconds))
+        avg = sum(t[2] for t in self.turns) / len(self.turns)
+        print(f"[Ollama] prompt eval: {count} tokens in {seconds * 1000:.0f} ms "
+              f"({num_messages} messages, session avg {avg * 1000:.0f} ms over {len(self.turns)} turns)")
+
 
 class Chatbot:
-    def __init__(self, system_prompt: str, model: str = "llama3.1", base_url: str = "http://127.0.0.1:11434"):
+    def __init__(self, system_prompt: str, model: str = "llama3.1", base_url: str = "http://127.0.0.1:11434", keep_alive: float = 1800.0, history_budget: int = 1500, cache: ResponseCache = None, hedge_delay: float = 0.5,
+                 pool_file: str = None):
         self.system_prompt = system_prompt
         self.model = model
-        self.base_url = base_url
-        self.dialog_history = []
+        self.cache = cache
+        # One or more Ollama servers, comma-separated
+        self.base_urls = parse_ollama_urls(base_url)
+        # Append-only within the token budget, so each prompt extends the previous one
+        # and Ollama can reuse its KV cache; older turns are summarized in the background
+        self.dialog_history = DialogHistory(history_budget, summarize=self.summarize)
         self.current_user_utt = None
+        self.pending_robot_text = None
+        self.prompt_stats = PromptEvalStats()
+        self.tracker = None
         self.llm_task = None
         self.shutting_down = False
         self.http = httpx.AsyncClient(timeout=httpx.Timeout(30.0, read=30.0))
+        # Health-checked; with pool_file, servers can be added without a restart
+        self.pool = OllamaPool(self.http, self.base_urls, model=model, pool_file=pool_file)
+        self.ollama = HedgedOllamaClient(self.http, self.base_urls, hedge_delay=hedge_delay, pool=self.pool)
+        self.residency = ResidencyGroup(self.http, self.pool, model, keep_alive=keep_alive)
 
     def commit_user(self):
         if self.current_user_utt is None:
             return
-        self.dialog_history.append({"role": "user", "content": self.current_user_utt})
+        self.dialog_history.append("user", self.current_user_utt)
         self.current_user_utt = None
 
     def commit_robot(self, message: str):
-        self.dialog_history.append({"role": "assistant", "content": message})
-
-    def initiate_request(self, text, callback):
+        # Prefer the model's exact output over the spoken text, so the next
+        # prompt starts with the same tokens Ollama generated and cached
+        if self.pending_robot_text is not None and self.pending_robot_text.split() == message.split():
+            message = self.pending_robot_text
+        self.pending_robot_text = None
+        self.dialog_history.append("assistant", message)
+
+    def initiate_request(self, text, callback, on_error=None):
         if self.shutting_down:
             return
         self.current_user_utt = text
-        self.llm_task = asyncio.create_task(self.make_request(callback))
+        self.llm_task = asyncio.create_task(self.make_request(callback, on_error))
 
     def cancel_request(self):
         self.current_user_utt = None
@@ -36,23 +76,41 @@ class Chatbot:
             print("[Ollama] Cancelling request...")
             self.llm_task.cancel()
 
-    async def make_request(self, callback):
+    async def make_request(self, callback, on_error=None):
+        self.dialog_history.begin_turn()
         try:
-            # Ollama supports roles: system, user, assistant
-            messages = [{"role": "system", "content": self.system_prompt}] + \
-                       self.dialog_history + \
-                       [{"role": "user", "content": self.current_user_utt}]
-            print("[Ollama] request:", messages)
-
-            payload = {
-                "model": self.model,
-                "messages": messages,
-                "stream": False
-            }
-            resp = await self.http.post(f"{self.base_url}/api/chat", json=payload)
-            resp.raise_for_status()
-            data = resp.json()
-            robot_text = data.get("message", {}).get("content", "")
+            user_text = self.current_user_utt
+            # Repeated questions with little preceding context are answered from the cache
+            cacheable = self.cache is not None and self.cache.cacheable(self.dialog_history.user_turns())
+            robot_text = self.cache.get(user_text, self.system_prompt, self.model) if cacheable else None
+
+            if robot_text is not None and self.tracker:
+                self.tracker.mark("first_token", cached=True)
+            if robot_text is None:
+                # Ollama supports roles: system, user, assistant
+                messages = self.dialog_history.prompt(self.system_prompt) + \
+                           [{"role": "user", "content": user_text}]
+                print("[Ollama] request:", messages)
+
+                payload = {
+                    "model": self.model,
+                    "messages": messages,
+                    "stream": False,
+                    "keep_alive": self.residency.keep_alive
+                }
+                if self.tracker:
+                    self.tracker.mark("request_sent")
+                data = await self.ollama.chat(payload)
+                if self.tracker:
+                    # not streamed: the first token arrives with the whole reply
+                    self.tracker.mark("first_token")
+                self.residency.touch(self.ollama.last_endpoints)
+                self.prompt_stats.record(data, len(messages))
+                robot_text = data.get("message", {}).get("content", "")
+                if cacheable:
+                    self.cache.put(user_text, self.system_prompt, self.model, robot_text)
+
+            self.pending_robot_text = robot_text
             print("[Ollama] response:", robot_text)
 
             if not self.shutting_down:
@@ -62,8 +120,37 @@ class Chatbot:
             return None
         except Exception as e:
             print(f"[Ollama] error: {e}")
+            if on_error is not None:
+                await on_error()
+        finally:
+            self.dialog_history.end_turn()
+
+    async def summarize(self, summary: str, messages: list) -> str:
+        payload = {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": SUMMARY_INSTRUCTION},
+                {"role": "user", "content": summary_request(summary, messages)}
+            ],
+            "stream": False,
+            "keep_alive": self.residency.keep_alive,
+            "options": {"num_predict": 200}
+        }
+        # Background work: no duplicate requests
+        data = await self.ollama.chat(payload, hedge=False)
+        return data.get("message", {}).get("content", "")
+
+    async def start(self):
+        """Start health checks and load the model."""
+        await self.ollama.start()
+        await self.residency.start()
 
     async def aclose(self):
+        if self.cache:
+            self.cache.close()
+        await self.dialog_history.close()
+        await self.residency.stop()
+        await self.ollama.close()
         await self.http.aclose()
 
     def set_shutting_down(self, value):
@@ -71,7 +158,9 @@ class Chatbot:
 
 
 class OllamaAsyncFurhatBridge:
-    def __init__(self, host: str = "172.27.8.18", auth_key=None, model: str = "llama3.1:8b", system_prompt: str = "You are a friendly robot looking for a nice little chat."):
+    def __init__(self, host: str = "172.27.8.18", auth_key=None, model: str = "llama3.1:8b", system_prompt: str = "You are a friendly robot looking for a nice little chat.", keep_alive: float = 1800.0, speculative: bool = False, similarity: float = 0.9, history_budget: int = 1500, cache: ResponseCache = None,
+                 ollama_url: str = "http://127.0.0.1:11434", hedge_delay: float = 0.5, pool_file: str = None,
+                 metrics_port: int = 9464, trace_file: str = "turn_trace.jsonl"):
         self.system_prompt = system_prompt
         self.conversation_starter = "Hello, I am Furhat. How are you today?"
         self.stop_event = asyncio.Event()
@@ -80,7 +169,19 @@ class OllamaAsyncFurhatBridge:
 
         # Connect to the Furhat Realtime API
         self.furhat = AsyncFurhatClient(host, auth_key=auth_key)
-        self.chatbot = Chatbot(system_prompt=self.system_prompt, model=model)
+        self.chatbot = Chatbot(system_prompt=self.system_prompt, model=model, keep_alive=keep_alive, history_budget=history_budget, cache=cache,
+                               base_url=ollama_url, hedge_delay=hedge_delay, pool_file=pool_file)
+
+        # Per-turn latency timeline: Prometheus histograms and a JSONL trace
+        self.metrics_port = metrics_port
+        self.metrics = TurnMetrics("ollama_async")
+        self.tracker = TurnTracker(self.metrics, trace_file)
+        self.chatbot.tracker = self.tracker
+
+        # Optionally start generating on partial hearing results
+        self.speculation = None
+        if speculative:
+            self.speculation = SpeculativeTurn(self.start_speculative, self.chatbot.cancel_request, threshold=similarity)
 
     def setup_signal_handlers(self):
         def signal_handler(signum, frame):
@@ -112,26 +213,59 @@ class OllamaAsyncFurhatBridge:
     # User started speaking — cancel any ongoing LLM request
     async def on_hear_start(self, event):
         if not self.shutting_down:
+            self.tracker.begin()
+            if self.speculation:
+                self.speculation.abandon()
             self.chatbot.cancel_request()
 
-    # User stopped speaking — send to LLM
+    # Partial transcript — start generating before the user has finished
+    async def on_hear_partial(self, event):
+        if not self.shutting_down:
+            self.speculation.on_partial(event.get("text", ""))
+
+    # User stopped speaking — keep the speculative request or send to LLM
     async def on_hear_end(self, event):
         if not self.shutting_down:
+            self.tracker.mark("hear_end")
+            if self.speculation and self.speculation.on_final(event["text"]):
+                self.chatbot.current_user_utt = event["text"]
+                return
             self.chatbot.initiate_request(event["text"], self.on_chatbot_response_ready)
 
+    # Speculative request — hold the response until the final transcript confirms it
+    def start_speculative(self, text, confirmed):
+        async def on_ready(robot_text: str):
+            if not robot_text.strip():
+                await on_error()    # nothing to say
+                return
+            self.speculation.mark_ready(confirmed)
+            if await confirmed:
+                await self.on_chatbot_response_ready(robot_text)
+
+        # a failed or empty speculative request falls back to a normal one on the final transcript
+        async def on_error():
+            if self.speculation.fail(confirmed) and self.chatbot.current_user_utt:
+                self.chatbot.initiate_request(self.chatbot.current_user_utt, self.on_chatbot_response_ready)
+
+        self.chatbot.initiate_request(text, on_ready, on_error)
+
     # LLM response is ready — speak it
     async def on_chatbot_response_ready(self, text: str):
         if not self.shutting_down:
+            self.tracker.mark("speak_request")
             await self.furhat.request_speak_text(text)
 
     # Robot starts speaking — commit user text to history
     async def on_speak_start(self, event):
         if not self.shutting_down:
+            self.tracker.mark("speak_start")
             self.chatbot.commit_user()
 
     # Robot finished speaking — commit robot text to history
     async def on_speak_end(self, event):
         if not self.shutting_down:
+            self.tracker.mark("speak_end")
+            self.tracker.finish()
             self.chatbot.commit_robot(event["text"])
 
     async def run(self):
@@ -139,15 +273,23 @@ class OllamaAsyncFurhatBridge:
         print("Starting dialog...")
         print("Press Ctrl+C to stop gracefully")
 
+        # Load the model while the Furhat connection is being set up
+        warmup = asyncio.create_task(self.chatbot.start())
         try:
             await self.furhat.connect()
         except Exception:
             print(f"Failed to connect to Furhat on {self.host}.")
+            warmup.cancel()
+            await self.chatbot.aclose()
             return
 
+        await self.metrics.serve(self.metrics_port)
+
         # Register event handlers
         self.furhat.add_handler(Events.response_hear_start, self.on_hear_start)
         self.furhat.add_handler(Events.response_hear_end, self.on_hear_end)
+        if self.speculation:
+            self.furhat.add_handler(Events.response_hear_partial, self.on_hear_partial)
         self.furhat.add_handler(Events.response_speak_start, self.on_speak_start)
         self.furhat.add_handler(Events.response_speak_end, self.on_speak_end)
 
@@ -156,6 +298,7 @@ class OllamaAsyncFurhatBridge:
 
         # Start listening continuously with sane defaults
         await self.furhat.request_listen_start(
+            partial=self.speculation is not None,
             concat=True,
             stop_no_speech=False,
             stop_user_end=False,
@@ -166,6 +309,7 @@ class OllamaAsyncFurhatBridge:
 
         await self.stop_event.wait()
         print("Shutting down...")
+        await self.metrics.close()
         await self.furhat.disconnect()
 
 
@@ -174,7 +318,27 @@ if __name__ == "__main__":
     parser.add_argument("--host", type=str, default="172.27.8.18", help="Furhat robot IP address")
     parser.add_argument("--auth_key", type=str, default=None, help="Authentication key for Realtime API")
     parser.add_argument("--model", type=str, default="llama3.1:8b", help="Ollama model name")
+    parser.add_argument("--ollama_url", type=str, default="http://127.0.0.1:11434", help="One or more Ollama servers, comma-separated")
+    parser.add_argument("--ollama_pool_file", type=str, default=None, help="File listing Ollama servers, one per line; re-read while running")
+    parser.add_argument("--hedge_delay", type=float, default=0.5, help="Seconds without a first token before a duplicate request goes to another server")
     parser.add_argument("--system_prompt", type=str, default="You are a friendly robot looking for a nice little chat.", help="System prompt for the LLM")
+    parser.add_argument("--keep_alive", type=float, default=1800.0, help="Seconds Ollama keeps the model loaded between turns")
+    parser.add_argument("--speculative", action="store_true", help="Start generating on partial hearing results")
+    parser.add_argument("--similarity", type=float, default=0.9, help="Minimum similarity between partial and final transcript to keep a speculative response")
+    parser.add_argument("--history_budget", type=int, default=1500, help="Token budget for verbatim dialog history; older turns are summarized")
+    parser.add_argument("--cache", action="store_true", help="Answer repeated questions from a response cache")
+    parser.add_argument("--cache_file", type=str, default=None, help="SQLite file to persist the response cache")
+    parser.add_argument("--cache_ttl", type=float, default=24 * 3600, help="Seconds a cached response stays valid")
+    parser.add_argument("--cache_context", type=int, default=0, help="Max earlier user turns for a turn to be cacheable")
+    parser.add_argument("--metrics_port", type=int, default=9464, help="Port for Prometheus turn latency metrics, 0 to disable")
+    parser.add_argument("--trace_file", type=str, default="turn_trace.jsonl", help="JSONL file for per-turn latency timelines")
     args = parser.parse_args()
 
-    asyncio.run(OllamaAsyncFurhatBridge(args.host, auth_key=args.auth_key, model=args.model, system_prompt=args.system_prompt).run())
\ No newline at end of file
+    cache = None
+    if args.cache:
+        cache = ResponseCache(ttl=args.cache_ttl, path=args.cache_file, max_context=args.cache_context)
+
+    asyncio.run(OllamaAsyncFurhatBridge(args.host, auth_key=args.auth_key, model=args.model, system_prompt=args.system_prompt, keep_alive=args.keep_alive,
+                                        speculative=args.speculative, similarity=args.similarity, history_budget=args.history_budget, cache=cache,
+                                        ollama_url=args.ollama_url, hedge_delay=args.hedge_delay, pool_file=args.ollama_pool_file,
+                                        metrics_port=args.metrics_port, trace_file=args.trace_file).run())
\ No newline at end of file
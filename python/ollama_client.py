@@ -0,0 +1,471 @@
+import asyncio
+import json
+import os
+import time
+from collections import deque
+from contextlib import aclosing
+from urllib.parse import urlparse
+import httpx
+
+
+OLLAMA_LIMITS = httpx.Limits(
+    max_connections=4,
+    max_keepalive_connections=2,
+    keepalive_expiry=120.0,
+)
+
+OLLAMA_TIMEOUT = httpx.Timeout(
+    connect=5.0,
+    read=60.0,   # max gap between streamed lines, not total generation time
+    write=10.0,
+    pool=5.0,
+)
+
+# TTFT recorded for a failed request, so a broken endpoint ranks last
+FAILURE_PENALTY = 10.0
+
+
+def normalize_ollama_url(ip_or_url: str) -> str:
+    if not ip_or_url.startswith("http"):
+        ip_or_url = "http://" + ip_or_url
+    parsed = urlparse(ip_or_url)
+    host = parsed.hostname
+    port = parsed.port or 11434
+    return f"http://{host}:{port}".rstrip("/")
+
+
+def parse_ollama_urls(value) -> list:
+    """Accepts one address, a comma-separated string or a list of them."""
+    if isinstance(value, str):
+        value = value.split(",")
+    return [normalize_ollama_url(v.strip()) for v in value if v.strip()]
+
+
+def normalize_model_name(name: str) -> str:
+    """Ollama reports untagged models as name:latest."""
+    return name if not name or ":" in name.rsplit("/", 1)[-1] else name + ":latest"
+
+
+def ollama_limits(streams: int, servers: int) -> httpx.Limits:
+    """Room for `streams` hedged chats (two requests each) and a probe and a keep-warm request per server."""
+    connections = max(OLLAMA_LIMITS.max_connections, 2 * streams + 2 * servers)
+    return httpx.Limits(
+        max_connections=connections,
+        max_keepalive_connections=connections,
+        keepalive_expiry=OLLAMA_LIMITS.keepalive_expiry,
+    )
+
+
+def create_ollama_client(limits: httpx.Limits = OLLAMA_LIMITS) -> httpx.AsyncClient:
+    return httpx.AsyncClient(limits=limits, timeout=OLLAMA_TIMEOUT)
+
+
+class ConnectionStats:
+    """
+    Connection reuse and pool-wait statistics, fed by httpcore's trace extension.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.reused = 0
+        self.pool_wait_total = 0.0
+        self.pool_wait_max = 0.0
+
+    def tracer(self):
+        """Returns a trace callback for a single request."""
+        started = time.perf_counter()
+        state = {"connect_start": None, "connect_time": 0.0, "new_connection": False}
+
+        async def trace(event: str, info: dict):
+            now = time.perf_counter()
+            if event.endswith((".connect_tcp.started", ".start_tls.started")):
+                state["new_connection"] = True
+                state["connect_start"] = now
+            elif event.endswith((".connect_tcp.complete", ".start_tls.complete")):
+                state["connect_time"] += now - state["connect_start"]
+            elif event.endswith(".send_request_headers.started"):
+                wait = max(0.0, now - started - state["connect_time"])
+                self.requests += 1
+                if not state["new_connection"]:
+                    self.reused += 1
+                self.pool_wait_total += wait
+                self.pool_wait_max = max(self.pool_wait_max, wait)
+
+        return trace
+
+    @property
+    def reuse_rate(self) -> float:
+        return self.reused / self.requests if self.requests else 0.0
+
+    @property
+    def avg_pool_wait(self) -> float:
+        return self.pool_wait_total / self.requests if self.requests else 0.0
+
+    def summary(self) -> str:
+        return (
+            f"reuse {self.reuse_rate:.0%} ({self.reused}/{self.requests}), "
+            f"pool wait avg {self.avg_pool_wait * 1000:.1f} ms, "
+            f"max {self.pool_wait_max * 1000:.1f} ms"
+        )
+
+
+class EndpointStats:
+    """Time-to-first-token samples and health state for one Ollama server."""
+
+    def __init__(self, window: int = 100):
+        self.ttft = deque(maxlen=window)
+        self.requests = 0
+        self.wins = 0
+        self.failures = 0
+        self.outstanding = 0
+        self.consecutive_failures = 0
+        self.ejected_until = None
+        self.model_loaded = None      # unknown until probed
+        self.probe_latency = None
+
+    def percentile(self, q: float):
+        if not self.ttft:
+            return None
+        data = sorted(self.ttft)
+        return data[min(len(data) - 1, int(round(q * (len(data) - 1))))]
+
+
+class OllamaPool:
+    """
+    Health-checked set of Ollama servers.
+
+    Routes by least outstanding requests, preferring servers that are up and
+    have the model loaded, then by p50 time-to-first-token, servers without
+    samples yet coming after measured ones. A background task probes /api/ps
+    every `probe_interval` seconds. Servers are ejected after `max_failures`
+    consecutive failures, or when their p50 TTFT is more than `slow_factor`
+    times that of the others, and re-admitted by the first successful probe
+    after `eject_time` seconds. With `pool_file` (one address per line) the
+    member list is re-read on every probe, so servers can be added or removed
+    without a restart; add_listener() callbacks are called whenever the member
+    list changes.
+    """
+
+    def __init__(self, http: httpx.AsyncClient, base_urls: list, model: str = None, probe_interval: float = 5.0,
+                 max_failures: int = 3, eject_time: float = 30.0, slow_factor: float = 3.0, pool_file: str = None):
+        self.http = http
+        self.model = model
+        self.probe_interval = probe_interval
+        self.max_failures = max_failures
+        self.eject_time = eject_time
+        self.slow_factor = slow_factor
+        self.pool_file = pool_file
+        self.pool_file_mtime = None
+        self.stats = {}
+        self.task = None
+        self.listeners = []
+        self.set_members(base_urls)
+
+    @property
+    def base_urls(self) -> list:
+        return list(self.stats)
+
+    def add_listener(self, callback):
+        self.listeners.append(callback)
+
+    def set_members(self, base_urls: list):
+        changed = False
+        for url in base_urls:
+            if url not in self.stats:
+                self.stats[url] = EndpointStats()
+                changed = True
+                if self.task:
+                    print(f"[Pool] added {url}")
+        for url in [u for u in self.stats if u not in base_urls]:
+            del self.stats[url]
+            changed = True
+            print(f"[Pool] removed {url}")
+        if changed:
+            for callback in self.listeners:
+                callback()
+
+    def is_ejected(self, url: str) -> bool:
+        return self.stats[url].ejected_until is not None
+
+    def ranked(self) -> list:
+        """Candidate servers, best first; ejected ones only if nothing else is left."""
+        def key(url):
+            s = self.stats[url]
+            p50 = s.percentile(0.5)
+            return (s.model_loaded is False, s.outstanding, p50 is None, p50 or 0.0)
+        if self.task is None:
+            # no health checks running: give ejected servers another try once their time is up
+            now = time.monotonic()
+            for url, s in self.stats.items():
+                if s.ejected_until is not None and now >= s.ejected_until:
+                    self.readmit(url)
+        healthy = sorted((u for u in self.stats if not self.is_ejected(u)), key=key)
+        return healthy or sorted(self.stats, key=lambda u: self.stats[u].ejected_until)
+
+    def acquire(self, url: str):
+        s = self.stats.get(url)
+        if s:
+            s.requests += 1
+            s.outstanding += 1
+
+    def release(self, url: str, ok):
+        """`ok` is None for a request that was cancelled before it showed either way."""
+        s = self.stats.get(url)
+        if not s:
+            return
+        s.outstanding -= 1
+        if ok:
+            s.consecutive_failures = 0
+        elif ok is False:
+            self.record_failure(url)
+
+    def record_failure(self, url: str):
+        s = self.stats[url]
+        s.failures += 1
+        s.consecutive_failures += 1
+        if s.consecutive_failures >= self.max_failures:
+            self.eject(url, f"{s.consecutive_failures} consecutive failures")
+
+    def eject(self, url: str, reason: str):
+        s = self.stats[url]
+        if s.ejected_until is None and len(self.stats) > 1:
+            print(f"[Pool] ejecting {url}: {reason}")
+        s.ejected_until = time.monotonic() + self.eject_time
+
+    def readmit(self, url: str):
+        s = self.stats[url]
+        s.ejected_until = None
+        s.consecutive_failures = 0
+        s.ttft.clear()      # start over rather than being judged on old samples
+        print(f"[Pool] re-admitted {url}")
+
+    def check_slow(self):
+        p50s = {u: self.stats[u].percentile(0.5) for u in self.stats if not self.is_ejected(u)}
+        p50s = {u: v for u, v in p50s.items() if v is not None}
+        if len(p50s) < 2:
+            return
+        for url, p50 in p50s.items():
+            others = sorted(v for u, v in p50s.items() if u != url)
+            median = others[len(others) // 2]
+            if p50 > self.slow_factor * median:
+                self.eject(url, f"p50 TTFT {p50 * 1000:.0f} ms vs {median * 1000:.0f} ms")
+
+    async def probe(self, url: str):
+        s = self.stats[url]
+        start = time.monotonic()
+        try:
+            resp = await self.http.get(f"{url}/api/ps", timeout=2.0)
+            resp.raise_for_status()
+            models = resp.json().get("models", [])
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            if url in self.stats:
+                self.record_failure(url)
+                if s.ejected_until is not None:
+                    s.ejected_until = time.monotonic() + self.eject_time
+            return
+        s.probe_latency = time.monotonic() - start
+        if self.model:
+            model = normalize_model_name(self.model)
+            s.model_loaded = any(model in (normalize_model_name(m.get("name")), normalize_model_name(m.get("model")))
+                                 for m in models)
+        if s.ejected_until is not None and time.monotonic() >= s.ejected_until:
+            self.readmit(url)
+
+    def reload_pool_file(self):
+        try:
+            mtime = os.path.getmtime(self.pool_file)
+            if mtime == self.pool_file_mtime:
+                return
+            with open(self.pool_file) as f:
+                urls = parse_ollama_urls([line for line in f if line.strip() and not line.startswith("#")])
+        except OSError as e:
+            print(f"[Pool] cannot read {self.pool_file}: {e}")
+            return
+        self.pool_file_mtime = mtime
+        if urls:
+            self.set_members(urls)
+
+    async def start(self):
+        if self.pool_file:
+            self.reload_pool_file()
+        if self.task is None:
+            self.task = asyncio.create_task(self._health_loop())
+
+    async def _health_loop(self):
+        while True:
+            if self.pool_file:
+                self.reload_pool_file()
+            await asyncio.gather(*(self.probe(url) for url in list(self.stats)))
+            self.check_slow()
+            await asyncio.sleep(self.probe_interval)
+
+    async def stop(self):
+        if self.task and not self.task.done():
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        self.task = None
+
+    def summary(self) -> str:
+        parts = []
+        for url, s in self.stats.items():
+            p50, p95 = s.percentile(0.5), s.percentile(0.95)
+            state = "ejected" if s.ejected_until is not None else "up"
+            ttft = "no samples" if p50 is None else f"TTFT p50 {p50 * 1000:.0f} ms, p95 {p95 * 1000:.0f} ms"
+            parts.append(f"{url} ({state}, {s.outstanding} in flight): {ttft}, won {s.wins}/{s.requests}")
+        return "; ".join(parts)
+
+
+class HedgedOllamaClient:
+    """
+    Streams /api/chat from the fastest of several Ollama servers.
+
+    Each request goes to the best server of the pool (see OllamaPool.ranked).
+    If no token has arrived after `hedge_delay` seconds and fewer than two
+    requests are in flight, a duplicate goes to the next one; whichever
+    produces the first token is streamed and the other request is cancelled.
+    A failed server is replaced by the next one, which is hedged in turn.
+    """
+
+    def __init__(self, http: httpx.AsyncClient, base_urls: list, hedge_delay: float = 0.5, connection_stats: ConnectionStats = None, pool: OllamaPool = None):
+        self.http = http
+        self.pool = pool or OllamaPool(http, base_urls)
+        self.hedge_delay = hedge_delay
+        self.connection_stats = connection_stats
+        self.hedges = 0
+        self.last_endpoints = []
+
+    @property
+    def stats(self) -> dict:
+        return self.pool.stats
+
+    def ranked(self) -> list:
+        return self.pool.ranked()
+
+    async def start(self):
+        """Start the pool's health checks."""
+        await self.pool.start()
+
+    async def close(self):
+        await self.pool.stop()
+
+    async def stream_chat(self, payload: dict, hedge: bool = True):
+        """Yields the parsed JSON lines of the winning response."""
+        order = self.ranked()
+        backups = order[1:]
+        queue = asyncio.Queue()
+        tasks = {}
+        failed = set()
+        winner = None
+        timer = None
+
+        def launch(url):
+            tasks[url] = asyncio.create_task(self._pump(url, payload, queue))
+            arm(url)
+
+        def arm(url):
+            nonlocal timer
+            if hedge and backups and len(tasks) - len(failed) < 2:
+                if timer:
+                    timer.cancel()
+                timer = asyncio.get_running_loop().call_later(self.hedge_delay, hedge_now, url)
+
+        def hedge_now(url):
+            if winner is None and backups and len(tasks) - len(failed) < 2:
+                self.hedges += 1
+                print(f"[Ollama] no token from {url} after {self.hedge_delay:.2f}s, hedging to {backups[0]}")
+                launch(backups.pop(0))
+
+        launch(order[0])
+
+        try:
+            while True:
+                url, item = await queue.get()
+                if winner is not None and url != winner:
+                    continue
+
+                if isinstance(item, Exception):
+                    failed.add(url)
+                    print(f"[Ollama] {url} failed: {item}")
+                    if winner is None and len(failed) == len(tasks) and backups:
+                        launch(backups.pop(0))
+                        continue
+                    if winner is not None or len(failed) == len(tasks):
+                        raise item
+                    arm(next(u for u in tasks if u not in failed))
+                    continue
+
+                if winner is None:
+                    winner = url
+                    if url in self.stats:
+                        self.stats[url].wins += 1
+                    if timer:
+                        timer.cancel()
+                    for other, task in tasks.items():
+                        if other != url:
+                            task.cancel()
+
+                if item is None:
+                    return
+                yield item
+        finally:
+            if timer:
+                timer.cancel()
+            for task in tasks.values():
+                task.cancel()
+            self.last_endpoints = list(tasks)
+
+    async def chat(self, payload: dict, hedge: bool = True) -> dict:
+        """Non-streaming equivalent of /api/chat, built on the hedged stream."""
+        content = ""
+        final = {}
+        async with aclosing(self.stream_chat(dict(payload, stream=True), hedge)) as stream:
+            async for data in stream:
+                content += data.get("message", {}).get("content", "")
+                if data.get("done"):
+                    final = data
+        return {**final, "message": {"role": "assistant", "content": content}}
+
+    async def _pump(self, url: str, payload: dict, queue: asyncio.Queue):
+        stats = self.stats[url]
+        self.pool.acquire(url)
+        ok = True
+        start = time.monotonic()
+        first = True
+        extensions = {"trace": self.connection_stats.tracer()} if self.connection_stats else None
+        try:
+            async with self.http.stream("POST", f"{url}/api/chat", json=payload, extensions=extensions) as resp:
+                resp.raise_for_status()
+                # read through the final "done" line so the connection
+                # is returned to the pool instead of being closed
+                async for line in resp.aiter_lines():
+                    if not line:
+                        continue
+                    try:
+                        data = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if first:
+                        first = False
+                        stats.ttft.append(time.monotonic() - start)
+                    await queue.put((url, data))
+            await queue.put((url, None))
+        except asyncio.CancelledError:
+            if first:
+                # lost the race: its TTFT is at least this long, but it has not failed
+                stats.ttft.append(time.monotonic() - start)
+                ok = None
+            raise
+        except Exception as e:
+            ok = False
+            stats.ttft.append(FAILURE_PENALTY)
+            await queue.put((url, e))
+        finally:
+            self.pool.release(url, ok)
+
+    def summary(self) -> str:
+        return self.pool.summary() + f"; hedges {self.hedges}"
@@ -0,0 +1,143 @@
+import asyncio
+import time
+import httpx
+from ollama_client import normalize_model_name
+
+
+class ModelResidency:
+    """
+    Keeps an Ollama model loaded between turns.
+
+    The model is preloaded at start-up, every chat request carries the same
+    keep_alive value, and the model is re-warmed shortly before Ollama would
+    unload it, so an idle robot never pays the cold-start cost on its next turn.
+    """
+
+    def __init__(self, http: httpx.AsyncClient, base_url: str, model: str, keep_alive: float = 1800.0, rewarm_margin: float = 60.0):
+        self.http = http
+        self.base_url = base_url
+        self.model = model
+        self.keep_alive = keep_alive          # seconds, as sent to Ollama
+        self.rewarm_margin = rewarm_margin    # re-warm this long before expiry
+        self.expires_at = None                # monotonic time Ollama will unload the model
+        self.last_used = None
+        self.task = None
+
+    def touch(self):
+        """Call after every request that carried `keep_alive`."""
+        now = time.monotonic()
+        self.last_used = now
+        self.expires_at = now + self.keep_alive
+
+    async def warm(self, reason: str = "preload"):
+        # an empty generate request loads the model without producing tokens
+        start = time.monotonic()
+        resp = await self.http.post(
+            f"{self.base_url}/api/generate",
+            json={"model": self.model, "keep_alive": self.keep_alive},
+            timeout=httpx.Timeout(10.0, read=300.0),
+        )
+        resp.raise_for_status()
+        data = resp.json()
+        elapsed = time.monotonic() - start
+        load = data.get("load_duration", 0) / 1e9
+        print(f"[Residency] {reason}: {self.model} on {self.base_url} ready in {elapsed:.2f}s (model load {load:.2f}s)")
+        self.expires_at = time.monotonic() + self.keep_alive
+
+    async def is_loaded(self) -> bool:
+        resp = await self.http.get(f"{self.base_url}/api/ps")
+        resp.raise_for_status()
+        model = normalize_model_name(self.model)
+        for entry in resp.json().get("models", []):
+            if model in (normalize_model_name(entry.get("name")), normalize_model_name(entry.get("model"))):
+                return True
+        return False
+
+    async def start(self):
+        """Preload the model, then keep it warm in the background."""
+        try:
+            await self.warm("preload")
+        except Exception as e:
+            print(f"[Residency] preload failed: {e}")
+        if self.task is None:
+            self.task = asyncio.create_task(self._keep_warm())
+
+    async def _keep_warm(self):
+        while True:
+            if self.expires_at is not None:
+                delay = self.expires_at - self.rewarm_margin - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                    continue
+
+            try:
+                if not await self.is_loaded():
+                    idle = time.monotonic() - self.last_used if self.last_used else 0.0
+                    print(f"[Residency] {self.model} was evicted from {self.base_url} ({idle:.0f}s since last turn)")
+                await self.warm("re-warm")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[Residency] re-warm failed: {e}")
+                self.expires_at = None
+                await asyncio.sleep(self.rewarm_margin)
+
+    async def stop(self):
+        if self.task and not self.task.done():
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        self.task = None
+
+
+class ResidencyGroup:
+    """
+    Model residency across the servers of an OllamaPool. Members follow the
+    pool, so servers added later (e.g. through its pool file) are preloaded
+    and kept warm too, and removed ones are let go.
+    """
+
+    def __init__(self, http: httpx.AsyncClient, pool, model: str, keep_alive: float = 1800.0, rewarm_margin: float = 60.0):
+        self.http = http
+        self.pool = pool
+        self.model = model
+        self.keep_alive = keep_alive
+        self.rewarm_margin = rewarm_margin
+        self.members = {}
+        self.started = False
+        self.tasks = set()
+        self.sync()
+        pool.add_listener(self.sync)
+
+    def sync(self):
+        urls = self.pool.base_urls
+        for url in urls:
+            if url not in self.members:
+                member = ModelResidency(self.http, url, self.model, self.keep_alive, self.rewarm_margin)
+                self.members[url] = member
+                if self.started:
+                    self._spawn(member.start())
+        for url in [u for u in self.members if u not in urls]:
+            member = self.members.pop(url)
+            if self.started:
+                self._spawn(member.stop())
+
+    def _spawn(self, coro):
+        task = asyncio.get_running_loop().create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    def touch(self, base_urls: list = None):
+        for url in base_urls or self.members:
+            if url in self.members:
+                self.members[url].touch()
+
+    async def start(self):
+        self.started = True
+        await asyncio.gather(*(m.start() for m in list(self.members.values())))
+
+    async def stop(self):
+        self.started = False
+        await asyncio.gather(*(m.stop() for m in list(self.members.values())))
@@ -6,29 +6,38 @@ import argparse
 import signal
 from dotenv import load_dotenv
 from furhat_realtime_api import AsyncFurhatClient, Events
+from speech_pipeline import SpeechPipeline
+from dialog_history import DialogHistory, SUMMARY_INSTRUCTION, summary_request
+from response_cache import ResponseCache
+from turn_metrics import TurnMetrics, TurnTracker
 
 class Chatbot:
-    def __init__(self, system_prompt: str):
+    def __init__(self, system_prompt: str, history_budget: int = 1500, cache: ResponseCache = None):
         self.system_prompt = system_prompt
-        self.dialog_history = []
+        self.model = "gpt-4o-mini"
+        self.cache = cache
+        # Recent turns verbatim, older ones summarized in the background
+        self.dialog_history = DialogHistory(history_budget, summarize=self.summarize)
         self.current_user_utt = None
         self.openai_task = None
         self.shutting_down = False
+        self.tracker = None
 
     def commit_user(self):
         if self.current_user_utt is None:
             return
-        self.dialog_history.append({"role": "user", "content": self.current_user_utt})
+        self.dialog_history.append("user", self.current_user_utt)
         self.current_user_utt = None
 
     def commit_robot(self, message: str):
-        self.dialog_history.append({"role": "assistant", "content": message})
+        # A streamed reply is spoken as several utterances; keep it as one message
+        self.dialog_history.append("assistant", message, merge=True)
 
-    def initiate_request(self, text, callback):
+    def initiate_request(self, text, callback, on_chunk=None):
         if self.shutting_down:
             return
         self.current_user_utt = text
-        self.openai_task = asyncio.create_task(self.make_request(callback))
+        self.openai_task = asyncio.create_task(self.make_request(callback, on_chunk))
 
     def cancel_request(self):
         self.current_user_utt = None
@@ -36,18 +45,69 @@ class Chatbot:
             print("[OpenAI] Cancelling request...")
             self.openai_task.cancel()
 
-    async def make_request(self, callback):
+    async def make_request(self, callback, on_chunk=None):
+        self.dialog_history.begin_turn()
+        robot_text = ""
         try:
-            messages = [{"role": "developer", "content": self.system_prompt}] + self.dialog_history + [{"role": "user", "content": self.current_user_utt}]
-            print("[OpenAI] request:", messages)
-            response = await self.client.chat.completions.create(model="gpt-4o-mini", messages=messages)
-            robot_text = response.choices[0].message.content
+            user_text = self.current_user_utt
+            # Repeated questions with little preceding context are answered from the cache
+            cacheable = self.cache is not None and self.cache.cacheable(self.dialog_history.user_turns())
+            robot_text = self.cache.get(user_text, self.system_prompt, self.model) if cacheable else None
+
+            if robot_text is not None:
+                if self.tracker:
+                    self.tracker.mark("first_token", cached=True)
+                if on_chunk is not None:
+                    await on_chunk(robot_text)
+            else:
+                messages = self.dialog_history.prompt(self.system_prompt, system_role="developer") + [{"role": "user", "content": user_text}]
+                print("[OpenAI] request:", messages)
+                if self.tracker:
+                    self.tracker.mark("request_sent")
+                if on_chunk is None:
+                    response = await self.client.chat.completions.create(model=self.model, messages=messages)
+                    if self.tracker:
+                        # not streamed: the first token arrives with the whole reply
+                        self.tracker.mark("first_token")
+                    robot_text = response.choices[0].message.content
+                else:
+                    # Stream the reply and hand each delta on as it arrives
+                    robot_text = ""
+                    stream = await self.client.chat.completions.create(model=self.model, messages=messages, stream=True)
+                    async with stream:
+                        async for chunk in stream:
+                            delta = chunk.choices[0].delta.content if chunk.choices else None
+                            if delta and not self.shutting_down:
+                                if self.tracker:
+                                    self.tracker.mark("first_token")
+                                robot_text += delta
+                                await on_chunk(delta)
+                if cacheable:
+                    self.cache.put(user_text, self.system_prompt, self.model, robot_text)
             print("[OpenAI] response:", robot_text)
             if not self.shutting_down:
                 await callback(robot_text)
         except asyncio.CancelledError:
             print("[OpenAI] request was aborted.")
             return None
+        except Exception as e:
+            print(f"[OpenAI] request failed: {e}")
+            if on_chunk is not None and not self.shutting_down:
+                # end the streamed reply, so the speech pipeline lets the robot listen again
+                await callback(robot_text)
+        finally:
+            self.dialog_history.end_turn()
+
+    async def summarize(self, summary: str, messages: list) -> str:
+        response = await self.client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "developer", "content": SUMMARY_INSTRUCTION},
+                {"role": "user", "content": summary_request(summary, messages)}
+            ],
+            max_tokens=200
+        )
+        return response.choices[0].message.content
 
     def set_client(self, client):
         self.client = client
@@ -57,7 +117,8 @@ class Chatbot:
 
 
 class OpenAIAsyncFurhatBridge:
-    def __init__(self, host: str = "127.0.0.1", auth_key=None):
+    def __init__(self, host: str = "127.0.0.1", auth_key=None, stream: bool = False, history_budget: int = 1500, cache: ResponseCache = None,
+                 metrics_port: int = 9464, trace_file: str = "turn_trace.jsonl"):
         load_dotenv(override=True)
         
         self.client = AsyncOpenAI(
@@ -69,11 +130,19 @@ class OpenAIAsyncFurhatBridge:
         self.stop_event = asyncio.Event()
         self.shutting_down = False
         self.host = host
+        self.stream = stream
         
         # Connect to the Furhat Realtime API
         self.furhat = AsyncFurhatClient(host, auth_key=auth_key)
-        self.chatbot = Chatbot(self.system_prompt)
+        # Per-turn latency timeline: Prometheus histograms and a JSONL trace
+        self.metrics_port = metrics_port
+        self.metrics = TurnMetrics("openai_async")
+        self.tracker = TurnTracker(self.metrics, trace_file)
+        # Speaks streamed replies clause by clause
+        self.speech = SpeechPipeline(self.furhat, tracker=self.tracker)
+        self.chatbot = Chatbot(self.system_prompt, history_budget=history_budget, cache=cache)
         self.chatbot.set_client(self.client)
+        self.chatbot.tracker = self.tracker
 
     def setup_signal_handlers(self):
         """Setup signal handlers for graceful shutdown"""
@@ -104,31 +173,67 @@ class OpenAIAsyncFurhatBridge:
         except Exception as e:
             print(f"Error during shutdown: {e}")
         
+        self.speech.clear()
         self.stop_event.set()
 
-    # The user has started speaking, so we should cancel any ongoing LLM request
+    # The user has started speaking, so we should cancel any ongoing LLM request and queued speech
+    # (unless it is held: right after an utterance of a streamed reply, it may be echo)
     async def on_hear_start(self, event):
-        if not self.shutting_down:
-            self.chatbot.cancel_request()
+        if not self.shutting_down and self.speech.heard_start():
+            self.interrupt()
+
+    def interrupt(self):
+        self.tracker.begin()
+        self.chatbot.cancel_request()
+        self.speech.clear()
 
     # The user has stopped speaking, initiate the LLM request
     async def on_hear_end(self, event):
-        if not self.shutting_down:
-            self.chatbot.initiate_request(event["text"], self.on_chatbot_response_ready)
+        held = self.speech.held
+        if not self.shutting_down and self.speech.heard_end(event["text"]):
+            if held:
+                self.interrupt()
+            self.tracker.mark("hear_end")
+            if self.stream:
+                self.speech.begin()
+                self.chatbot.initiate_request(event["text"], self.on_chatbot_stream_done, on_chunk=self.on_chatbot_response_chunk)
+            else:
+                self.chatbot.initiate_request(event["text"], self.on_chatbot_response_ready)
 
     # The chatbot has a response, prepare to speak it out
     async def on_chatbot_response_ready(self, text: str):
         if not self.shutting_down:
+            self.tracker.mark("speak_request")
             await self.furhat.request_speak_text(text)
 
+    # The chatbot streamed more text, speak each complete clause
+    async def on_chatbot_response_chunk(self, text: str):
+        if not self.shutting_down:
+            await self.speech.feed(text)
+
+    # The chatbot stream ended, speak whatever is left
+    async def on_chatbot_stream_done(self, text: str):
+        if not self.shutting_down:
+            await self.speech.finish()
+            asyncio.create_task(self.finish_turn(self.tracker.current))
+
+    # The streamed reply has been spoken in full, record the turn
+    async def finish_turn(self, turn):
+        await self.speech.wait_idle()
+        self.tracker.finish(turn)
+
     # The robot starts speaking, so we can commit the user's text to history
     async def on_speak_start(self, event):
         if not self.shutting_down:
+            self.tracker.mark("speak_start")
             self.chatbot.commit_user()
 
     # The robot stopped speaking, so we can commit the robot's text to history
     async def on_speak_end(self, event):
         if not self.shutting_down:
+            if not self.stream:
+                self.tracker.mark("speak_end")
+                self.tracker.finish()
             self.chatbot.commit_robot(event["text"])
 
     # Main dialog loop
@@ -143,11 +248,14 @@ class OpenAIAsyncFurhatBridge:
             print(f"Failed to connect to Furhat on {self.host}.")
             exit(0)
 
+        await self.metrics.serve(self.metrics_port)
+
         # Register event handlers
         self.furhat.add_handler(Events.response_hear_start, self.on_hear_start)
         self.furhat.add_handler(Events.response_hear_end, self.on_hear_end)
         self.furhat.add_handler(Events.response_speak_start, self.on_speak_start)
         self.furhat.add_handler(Events.response_speak_end, self.on_speak_end)
+        self.speech.attach()
 
         await self.furhat.request_attend_user()
 
@@ -170,6 +278,11 @@ class OpenAIAsyncFurhatBridge:
         await self.stop_event.wait()
 
         print("Shutting down...")
+        await self.chatbot.dialog_history.close()
+        if self.chatbot.cache:
+            self.chatbot.cache.close()
+        await self.speech.close()
+        await self.metrics.close()
         await self.furhat.disconnect()
 
 
@@ -177,6 +290,19 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--host", type=str, default="127.0.0.1", help="Furhat robot IP address")
     parser.add_argument("--auth_key", type=str, default=None, help="Authentication key for Realtime API")
+    parser.add_argument("--stream", action="store_true", help="Stream the reply and speak it clause by clause")
+    parser.add_argument("--history_budget", type=int, default=1500, help="Token budget for verbatim dialog history; older turns are summarized")
+    parser.add_argument("--cache", action="store_true", help="Answer repeated questions from a response cache")
+    parser.add_argument("--cache_file", type=str, default=None, help="SQLite file to persist the response cache")
+    parser.add_argument("--cache_ttl", type=float, default=24 * 3600, help="Seconds a cached response stays valid")
+    parser.add_argument("--cache_context", type=int, default=0, help="Max earlier user turns for a turn to be cacheable")
+    parser.add_argument("--metrics_port", type=int, default=9464, help="Port for Prometheus turn latency metrics, 0 to disable")
+    parser.add_argument("--trace_file", type=str, default="turn_trace.jsonl", help="JSONL file for per-turn latency timelines")
     args = parser.parse_args()
 
-    asyncio.run(OpenAIAsyncFurhatBridge(args.host, auth_key=args.auth_key).run())
\ No newline at end of file
+    cache = None
+    if args.cache:
+        cache = ResponseCache(ttl=args.cache_ttl, path=args.cache_file, max_context=args.cache_context)
+
+    asyncio.run(OpenAIAsyncFurhatBridge(args.host, auth_key=args.auth_key, stream=args.stream, history_budget=args.history_budget, cache=cache,
+                                       metrics_port=args.metrics_port, trace_file=args.trace_file).run())
\ No newline at end of file
@@ -1,17 +1,29 @@
 import os
 import json
+import time
 import asyncio
-import websockets
 import signal
 from dotenv import load_dotenv
 from furhat_realtime_api import AsyncFurhatClient, Events
 import argparse
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from realtime_events import EventStats, dispatch_events
+from frame_bus import FrameBus
+from realtime_vision import FrameProcessor, FrameSlot, decode_frame
+from realtime_audio import PlaybackClock, PlayoutBuffer, StreamResampler, UpstreamAudioSender, VoiceGate
+from realtime_session import ConversationContext, RealtimeConnector, Transcript
 
 class OpenAIRealtimeFurhatBridge:
-    def __init__(self, host: str = "127.0.0.1", auth_key = None):
+    def __init__(self, host: str = "127.0.0.1", auth_key = None, audio_window: float = 0.04, audio_backlog: float = 1.0,
+                 vad: bool = False, vad_threshold_db: float = -45.0, barge_in: bool = False,
+                 playout_target: float = 0.1, playout_lead: float = 0.2, playout_frame: float = 0.04, playout_max: float = 3.0,
+                 robot_sample_rate: int = 24000, image_size: int = 512, image_quality: int = 70, image_distance: int = 4,
+                 camera_mode: str = "on_demand", camera_fps: float = 1.0, frame_bus: str = None, frame_bus_size: tuple = (1280, 720),
+                 standby: bool = True, replay_turns: int = 6, context_turns: int = 0, context_images: int = 0,
+                 context_summary: bool = False):
         load_dotenv(override=True)
-        self.url = "wss://api.openai.com/v1/realtime?model=gpt-realtime"
+        self.url = os.environ.get("OPENAI_REALTIME_URL", "wss://api.openai.com/v1/realtime?model=gpt-realtime")
         self.headers = {
             "Authorization": "Bearer " + os.environ.get("OPENAI_API_KEY"),
             "OpenAI-Beta": "realtime=v1"
@@ -23,12 +35,75 @@ class OpenAIRealtimeFurhatBridge:
         self.instruction = "You are a friendly robot speaking English, looking for a nice little chat."
         self.stop_event = asyncio.Event()
         self.shutting_down = False
-        self.camera_image = None
+        # stream: the robot sends frames continuously; rate: one frame every 1/camera_fps seconds;
+        # on_demand: one frame when the user starts speaking
+        self.camera = FrameSlot()
+        self.camera_mode = camera_mode
+        self.camera_fps = camera_fps
+        self.camera_task = None
+        # The image for a user turn is fetched and prepared in its own task, so events are not held up
+        self.image_task = None
+        self.committed = {}     # user audio item id -> the item before it
+        # Decoded frames can be shared with local processes, see frame_bus.py
+        self.frame_bus_name = frame_bus
+        self.frame_bus_size = frame_bus_size
+        self.frame_bus = None
+        self.frame_bus_executor = None
+        self.publishing = False
+        # Camera frames are downscaled off the event loop, and unchanged scenes are not sent again
+        self.frames = FrameProcessor(max_size=image_size, quality=image_quality, max_distance=image_distance)
         self.furhat = AsyncFurhatClient(self.host, auth_key=auth_key)
         #self.furhat.set_logging_level(logging.DEBUG)
         self.furhat.add_handler(Events.response_speak_end, self.furhat_speak_end)
         self.furhat.add_handler(Events.response_audio_data, self.furhat_microphone_data)
         self.furhat.add_handler(Events.response_camera_data, self.furhat_camera_data)
+        self.handlers = {
+            "response.created": self.response_created,
+            "response.audio.delta": self.response_audio_delta,
+            "response.audio.done": self.response_audio_done,
+            "response.done": self.response_done,
+            "input_audio_buffer.speech_started": self.user_speech_started,
+            "input_audio_buffer.committed": self.user_audio_committed,
+            "conversation.item.input_audio_transcription.completed": self.user_transcript,
+            "response.audio_transcript.done": self.response_transcript,
+            "conversation.item.created": self.context_event,
+            "conversation.item.deleted": self.context_event,
+            "conversation.item.truncated": self.context_event,
+            "input_audio_buffer.speech_stopped": self.context_event,
+            "error": self.openai_error,
+        }
+        # Per-event-type counts and handler timings, printed on shutdown
+        self.event_stats = EventStats()
+        # Microphone audio is merged and sent from its own task, see realtime_audio.py
+        self.upstream = UpstreamAudioSender(sample_rate=24000, window=audio_window, max_backlog=audio_backlog)
+        # Optional local VAD, so silence between user utterances is not sent upstream
+        self.vad = VoiceGate(sample_rate=24000, threshold_db=vad_threshold_db) if vad else None
+        # OpenAI audio is 24 kHz; on slow robot links the robot side can run at e.g. 16 kHz
+        self.robot_rate = robot_sample_rate
+        self.mic_resampler = StreamResampler(robot_sample_rate, 24000) if robot_sample_rate != 24000 else None
+        self.speaker_resampler = StreamResampler(24000, robot_sample_rate) if robot_sample_rate != 24000 else None
+        # With barge-in, the microphone stays open while the robot speaks and user speech interrupts it
+        self.barge_in = barge_in
+        self.playback = PlaybackClock(sample_rate=robot_sample_rate)
+        self.response_id = None
+        self.interrupted_response = None
+        self.interruptions = 0
+        # Response audio goes to the robot in paced, fixed-size frames
+        self.playout = PlayoutBuffer(self.speak_audio_data, self.furhat.request_speak_audio_end, sample_rate=24000,
+                                     frame=playout_frame, target=playout_target, lead=playout_lead, max_depth=playout_max,
+                                     resampler=self.speaker_resampler)
+        # Sessions are opened (and re-opened, with a standby ready) by the connector,
+        # and the recent conversation is replayed into a new session as text (without images)
+        self.connector = RealtimeConnector(self.url, self.headers, {
+            "instructions": self.instruction,
+            "input_audio_transcription": {"model": "whisper-1"},
+            #"turn_detection": {
+            #    "type": "semantic_vad"
+            #}
+        }, standby=standby)
+        self.transcript = Transcript(max_turns=replay_turns)
+        # The server-side conversation, pruned to the last `context_turns` turns and `context_images` images after each response
+        self.context = ConversationContext(max_turns=context_turns, max_images=context_images, summary=context_summary)
 
     def setup_signal_handlers(self):
         """Setup signal handlers for graceful shutdown"""
@@ -58,23 +133,106 @@ class OpenAIRealtimeFurhatBridge:
     async def furhat_speak_end(self, data):
         # This is called when Furhat finishes speaking
         self.user_turn = True
-        await self.furhat.request_audio_start(sample_rate=24000, microphone=True, speaker=False)
+        self.playback.stop()
+        if self.barge_in:
+            return      # the microphone is already open
+        if self.vad:
+            self.vad.reset()
+        await self.start_microphone()
+
+    async def start_microphone(self):
+        if self.mic_resampler:
+            self.mic_resampler.reset()
+        await self.furhat.request_audio_start(sample_rate=self.robot_rate, microphone=True, speaker=False)
 
     async def furhat_microphone_data(self, data):
         # This is called when Furhat received user audio
-        # We only send audio data to OpenAI if it's the user's turn and not shutting down
-        if self.user_turn and self.ws and not self.shutting_down:
+        # We only send audio data to OpenAI if it's the user's turn (or always, with barge-in) and not shutting down
+        if (self.user_turn or self.barge_in) and self.ws and not self.shutting_down:
+            audio = data.get("microphone")
+            if self.mic_resampler and audio:
+                audio = self.mic_resampler.process(audio)
+            if self.vad is None:
+                self.upstream.push(audio)
+                return
+            for chunk in self.vad.process(audio):
+                self.upstream.push(chunk)
+            if self.barge_in and self.vad.onset and self.playback.active:
+                # the local detector is quicker than waiting for the server's speech_started
+                await self.interrupt()
+
+    async def interrupt(self):
+        """Stop the robot, cancel the response and cut the item off at what was played"""
+        item_id = self.playback.item_id
+        played_ms = self.playback.played_ms()
+        self.playback.stop()
+        self.output_started = False
+        self.user_turn = True
+        self.interruptions += 1
+        self.playout.clear()
+        await self.furhat.request_speak_stop()
+        if self.response_id:
+            self.interrupted_response = self.response_id
+            await self.ws.send(json.dumps({"type": "response.cancel"}))
+        if item_id:
             await self.ws.send(json.dumps({
-                "type": "input_audio_buffer.append",
-                "audio": data.get("microphone")
+                "type": "conversation.item.truncate",
+                "item_id": item_id,
+                "content_index": 0,
+                "audio_end_ms": played_ms
             }))
 
     async def furhat_camera_data(self, data):
-        self.camera_image = data.get("image")
+        self.camera.put(data.get("image"))
+        if self.frame_bus and self.camera.image and not self.publishing:
+            # skip frames that arrive while the previous one is still being published;
+            # on its own thread, so turn images are not held up behind it
+            self.publishing = True
+            asyncio.get_running_loop().run_in_executor(self.frame_bus_executor, self.publish_frame, self.camera.image)
 
-    async def user_speech_started(self):
-        if self.camera_image:
-            await self.ws.send(json.dumps({
+    def publish_frame(self, image):
+        try:
+            pixels = decode_frame(image)
+            if not self.frame_bus.publish(pixels):
+                print(f"Camera frame {pixels.shape} is larger than the frame bus slots (--frame_bus_size)")
+        except Exception as e:
+            print(f"Error publishing camera frame: {e}")
+        finally:
+            self.publishing = False
+
+    async def request_camera_frame(self):
+        try:
+            # the reply also reaches furhat_camera_data, which stores it
+            await asyncio.wait_for(self.furhat.request_camera_once(), 1.0)
+        except asyncio.TimeoutError:
+            print("No camera frame from Furhat within 1s")
+
+    async def poll_camera(self):
+        while True:
+            await self.request_camera_frame()
+            await asyncio.sleep(1.0 / self.camera_fps)
+
+    async def user_speech_started(self, data):
+        self.context.handle(data)
+        if self.barge_in and self.playback.active:
+            await self.interrupt()
+        if self.image_task and not self.image_task.done():
+            self.image_task.cancel()    # the previous turn's image is stale now
+        self.image_task = asyncio.create_task(self.send_image(data.get("item_id")))
+
+    async def user_audio_committed(self, data):
+        self.committed = {data.get("item_id"): data.get("previous_item_id") or "root"}
+
+    async def send_image(self, audio_item_id):
+        """Send a camera frame for the user turn whose audio is `audio_item_id`"""
+        try:
+            if self.camera_mode == "on_demand":
+                await self.request_camera_frame()
+            frame = self.camera.take()
+            image = await self.frames.prepare(frame) if frame else None
+            if not image or self.ws is None:
+                return
+            event = {
                 "type": "conversation.item.create",
                 "item": {
                     "type": "message",
@@ -82,47 +240,109 @@ class OpenAIRealtimeFurhatBridge:
                     "content": [
                         {
                             "type": "input_image",
-                            "image_url": "data:image/jpg;base64," + self.camera_image
+                            "image_url": "data:image/jpg;base64," + image
                         }
                     ]
                 }
-            }))
+            }
+            if audio_item_id in self.committed:
+                # a short utterance was committed first; put the image before it
+                event["previous_item_id"] = self.committed[audio_item_id]
+            await self.ws.send(json.dumps(event))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Error sending camera frame: {e}")
 
-    async def session_created(self):
-        # This is called when the OpenAI session is created
+    async def start_conversation(self):
+        # This is called once the first OpenAI session is ready (and configured by the connector)
         # We ask OpenAI to create the initial response
-        await self.ws.send(json.dumps({
-            "type": "session.update",
-            "session": {
-                "instructions": self.instruction,
-                #"turn_detection": {
-                #    "type": "semantic_vad"
-                #}
-            }
-        }))
         await self.furhat.request_attend_user()
+        if self.barge_in:
+            await self.start_microphone()
         await self.ws.send(json.dumps({
             "type": "response.create"
         }))
 
+    async def resume_conversation(self):
+        # This is called when a new session replaces a dropped one
+        self.context.reset()
+        if self.context.summary_text:
+            await self.ws.send(json.dumps(self.context.summary_item()))
+        for item in self.transcript.items():
+            await self.ws.send(json.dumps(item))
+        # a response cut off with the old session: let the robot finish what it got
+        if self.output_started:
+            self.playout.end()
+            self.output_started = False
+        elif not self.user_turn and not self.playback.active:
+            # it was cut off before any audio; give the turn back to the user
+            self.user_turn = True
+            if not self.barge_in:
+                await self.start_microphone()
+        self.response_id = None
+        # the new session has not seen any image yet
+        self.frames.reset()
+
+    async def user_transcript(self, data):
+        self.context.transcript(data.get("item_id"), data.get("transcript"))
+        self.transcript.add("user", data.get("transcript"))
+
+    async def response_transcript(self, data):
+        self.context.transcript(data.get("item_id"), data.get("transcript"))
+        if self.interrupted_response and data.get("response_id") == self.interrupted_response:
+            return
+        self.transcript.add("assistant", data.get("transcript"))
+
     async def response_created(self, data):
         # This is called when OpenAI has created a response and is ready to speak
-        await self.furhat.request_audio_stop()
+        self.response_id = data.get("response", {}).get("id")
+        if not self.barge_in:
+            await self.furhat.request_audio_stop()
         self.user_turn = False
 
+    async def response_done(self, data):
+        if data.get("response", {}).get("id") == self.response_id:
+            self.response_id = None
+        images = self.context.images
+        for event in self.context.prune():
+            await self.ws.send(json.dumps(event))
+        if images and not self.context.images:
+            # the server no longer has the last image sent; send the next one even if the scene is unchanged
+            self.frames.reset()
+
+    async def context_event(self, data):
+        self.context.handle(data)
+
     async def response_audio_delta(self, data):
         # This is called when OpenAI sends a delta of audio data
+        self.context.add_audio(data.get("item_id"), len(data.get("delta") or "") * 3 // 4)
+        if self.interrupted_response and data.get("response_id") == self.interrupted_response:
+            return      # still in flight when the user interrupted
         if not self.output_started:
-            await self.furhat.request_speak_audio_start(sample_rate=24000, lipsync=True)
+            if self.speaker_resampler:
+                self.speaker_resampler.reset()
+            await self.furhat.request_speak_audio_start(sample_rate=self.robot_rate, lipsync=True)
             self.output_started = True
-        delta = data.get("delta")
-        await self.furhat.request_speak_audio_data(delta)
+            self.playback.start(data.get("item_id"))
+        self.playout.push(data.get("delta"), data.get("response_id"))
+
+    async def speak_audio_data(self, audio):
+        self.playback.add(len(audio) * 3 // 4)
+        await self.furhat.request_speak_audio_data(audio)
 
     async def response_audio_done(self, data):
         # This is called when OpenAI has finished sending audio data
-        await self.furhat.request_speak_audio_end()
+        if self.interrupted_response and data.get("response_id") == self.interrupted_response:
+            return
+        self.playout.end(data.get("response_id"))
         self.output_started = False
 
+    async def openai_error(self, data):
+        if data.get("error", {}).get("code") == "response_cancel_not_active":
+            return      # the server had already cancelled the response on barge-in
+        print("Error from OpenAI:", data)
+
     async def monitor_input(self):
         """Monitor for Enter key press to stop the program"""
         loop = asyncio.get_event_loop()
@@ -132,59 +352,130 @@ class OpenAIRealtimeFurhatBridge:
         await self.furhat.request_speak_stop()
         self.stop_event.set()
 
-    async def websocket_handler(self):
-        """Handle Realtime connection"""
-        async with websockets.connect(
-            self.url,
-            additional_headers=self.headers
-        ) as ws:
+    async def websocket_handler(self, ws):
+        """Handle Realtime connection, reconnecting when it drops"""
+        resume = False
+        while ws is not None:
             self.ws = ws
-            while not self.stop_event.is_set():
-                try:
-                    message = await asyncio.wait_for(ws.recv(), timeout=0.1)
-                    data = json.loads(message)
-                    #print("Received event:", data.get("type"))
-                    if data.get("type") == "session.created":
-                        await self.session_created()
-                    elif data.get("type") == "response.created":
-                        await self.response_created(data)
-                    elif data.get("type") == "response.audio.delta":
-                        await self.response_audio_delta(data)
-                    elif data.get("type") == "response.audio.done":
-                        await self.response_audio_done(data)
-                    elif data.get("type") == "input_audio_buffer.speech_started":
-                        await self.user_speech_started()
-                    elif data.get("type") == "error":
-                        print("Error from OpenAI:", data)
-                except asyncio.TimeoutError:
-                    continue
-                except websockets.exceptions.ConnectionClosed:
-                    break
+            self.upstream.start(ws)
+            try:
+                if resume:
+                    await self.resume_conversation()
+                else:
+                    await self.start_conversation()
+                await dispatch_events(ws, self.handlers, self.stop_event, self.event_stats)
+            finally:
+                await self.upstream.stop()
+                await ws.close()
+            if self.stop_event.is_set() or self.shutting_down:
+                return
+            print("Realtime connection lost, reconnecting...")
+            dropped = time.monotonic()
+            ws = await self.connector.connect(self.stop_event)
+            if ws is not None:
+                self.connector.gaps.append(time.monotonic() - dropped)
+            resume = True
 
     async def run(self):
         self.setup_signal_handlers()
         print("Starting OpenAI Realtime Furhat Bridge...")
         print("Press Ctrl+C to stop gracefully")
         
+        # The Realtime handshake runs while Furhat connects
+        if self.frame_bus_name:
+            width, height = self.frame_bus_size
+            try:
+                self.frame_bus = FrameBus(self.frame_bus_name, width, height)
+            except FileExistsError as e:
+                print(e)
+                exit(0)
+            self.frame_bus_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="frame_bus")
+
+        start = time.monotonic()
+        session = asyncio.create_task(self.connector.connect(self.stop_event))
         try:
             await self.furhat.connect()
         except Exception as e:
+            session.cancel()
             print(f"Failed to connect to Furhat on {self.host}.")
             exit(0)
 
-        await self.furhat.request_camera_start()
+        if self.camera_mode == "stream":
+            await self.furhat.request_camera_start()
+        elif self.camera_mode == "rate":
+            self.camera_task = asyncio.create_task(self.poll_camera())
 
+        self.playout.start()
         try:
-            await self.websocket_handler()
+            ws = await session
+            if ws is not None:
+                self.connector.startup = time.monotonic() - start
+            self.connector.start_standby()
+            await self.websocket_handler(ws)
         except Exception as e:
             print(f"Error in main loop: {e}")
         finally:
             print("Shutting down...")
+            await self.playout.stop()
+            await self.connector.close()
+            print("[Session] " + self.connector.summary())
+            print("[Realtime] events:\n" + self.event_stats.summary())
+            print("[Upstream] " + self.upstream.summary())
+            print("[Playout] " + self.playout.summary())
+            print("[Context] " + self.context.summary())
+            if self.vad:
+                print("[VAD] " + self.vad.summary())
+            if self.barge_in:
+                print(f"[Barge-in] {self.interruptions} interruptions")
+            if self.camera_task:
+                self.camera_task.cancel()
+            if self.image_task:
+                self.image_task.cancel()
+            print("[Camera] " + self.camera.summary() + "; " + self.frames.summary())
+            self.frames.close()
+            if self.frame_bus:
+                self.frame_bus_executor.shutdown(wait=True, cancel_futures=True)
+                print("[Frame bus] " + self.frame_bus.summary())
+                self.frame_bus.close()
             await self.furhat.disconnect()
        
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--host", type=str, default="127.0.0.1", help="Furhat robot IP address")
     parser.add_argument("--auth_key", type=str, default=None, help="Authentication key for Realtime API")
+    parser.add_argument("--audio_window_ms", type=float, default=40, help="Merge microphone audio sent to OpenAI over this many ms")
+    parser.add_argument("--audio_backlog_ms", type=float, default=1000, help="Drop the oldest microphone audio when more than this many ms are waiting to be sent")
+    parser.add_argument("--vad", action="store_true", help="Only send microphone audio around detected speech")
+    parser.add_argument("--vad_threshold_db", type=float, default=-45.0, help="Speech energy threshold in dBFS for --vad")
+    parser.add_argument("--barge_in", action="store_true", help="Let the user interrupt the robot (needs echo cancellation or a headset)")
+    parser.add_argument("--playout_ms", type=float, default=100, help="Response audio to buffer before the robot starts playing it")
+    parser.add_argument("--playout_lead_ms", type=float, default=200, help="How far ahead of playback response audio is sent to the robot")
+    parser.add_argument("--playout_max_ms", type=float, default=3000, help="Response audio buffered beyond this is dropped, oldest first")
+    parser.add_argument("--robot_sample_rate", type=int, default=24000, help="Audio sample rate on the robot side, e.g. 16000 for slow links")
+    parser.add_argument("--camera_mode", choices=("stream", "rate", "on_demand"), default="on_demand",
+                        help="Stream camera frames, fetch them at --camera_fps, or fetch one when the user starts speaking")
+    parser.add_argument("--camera_fps", type=float, default=1.0, help="Frames per second with --camera_mode rate")
+    parser.add_argument("--frame_bus", type=str, default=None,
+                        help="Publish decoded camera frames to this shared memory name for local readers (see frame_bus.py)")
+    parser.add_argument("--frame_bus_size", type=str, default="1280x720", help="Largest camera frame the frame bus holds, WIDTHxHEIGHT")
+    parser.add_argument("--image_size", type=int, default=512, help="Longest side of images sent to OpenAI")
+    parser.add_argument("--image_quality", type=int, default=70, help="JPEG quality of images sent to OpenAI")
+    parser.add_argument("--image_distance", type=int, default=4, help="Skip images within this many hash bits of the last one sent (-1 never skips)")
+    parser.add_argument("--no_standby", action="store_true", help="Do not keep a standby Realtime session for fast reconnects")
+    parser.add_argument("--replay_turns", type=int, default=6, help="Recent turns replayed as text into a new session after a reconnect")
+    parser.add_argument("--context_turns", type=int, default=0, help="Delete conversation items older than this many turns from the session (0 keeps all)")
+    parser.add_argument("--context_images", type=int, default=0, help="Delete all but this many of the latest images from the session (0 keeps all)")
+    parser.add_argument("--context_summary", action="store_true", help="Keep a text summary of deleted turns at the start of the conversation")
     args = parser.parse_args()
-    asyncio.run(OpenAIRealtimeFurhatBridge(args.host, auth_key=args.auth_key).run())
\ No newline at end of file
+    asyncio.run(OpenAIRealtimeFurhatBridge(args.host, auth_key=args.auth_key,
+                                            audio_window=args.audio_window_ms / 1000, audio_backlog=args.audio_backlog_ms / 1000,
+                                            vad=args.vad, vad_threshold_db=args.vad_threshold_db, barge_in=args.barge_in,
+                                            playout_target=args.playout_ms / 1000, playout_lead=args.playout_lead_ms / 1000,
+                                            playout_max=args.playout_max_ms / 1000,
+                                            robot_sample_rate=args.robot_sample_rate, image_size=args.image_size,
+                                            image_quality=args.image_quality, image_distance=args.image_distance,
+                                            camera_mode=args.camera_mode, camera_fps=args.camera_fps,
+                                            frame_bus=args.frame_bus, frame_bus_size=tuple(int(v) for v in args.frame_bus_size.split("x")),
+                                            standby=not args.no_standby,
+                                            replay_turns=args.replay_turns, context_turns=args.context_turns,
+                                            context_images=args.context_images, context_summary=args.context_summary).run())
\ No newline at end of file
@@ -0,0 +1,489 @@
+import asyncio
+import base64
+import math
+import time
+from collections import deque
+import numpy as np
+import websockets
+
+
+def encode_append(audio: str) -> str:
+    # base64 needs no JSON escaping, so a template is enough and skips json.dumps
+    return '{"type":"input_audio_buffer.append","audio":"' + audio + '"}'
+
+
+def join_base64(parts: list) -> str:
+    """Concatenate base64 audio chunks, decoding only if some chunk is padded."""
+    if all(not part.endswith("=") for part in parts[:-1]):
+        return "".join(parts)
+    return base64.b64encode(b"".join(base64.b64decode(part) for part in parts)).decode()
+
+
+class UpstreamAudioSender:
+    """
+    Sends microphone audio to the Realtime API from its own task.
+
+    push() never blocks: chunks go on a backlog that the sender drains into
+    one input_audio_buffer.append per `window` seconds. If the socket falls
+    behind by more than `max_backlog` seconds of audio, the oldest audio is
+    dropped, counted and reported, so latency stays bounded. The backlog
+    gauge is the audio waiting when each message is sent.
+    """
+
+    def __init__(self, sample_rate: int = 24000, window: float = 0.04, max_backlog: float = 1.0):
+        self.bytes_per_second = sample_rate * 2
+        self.window = window
+        self.max_backlog = max_backlog
+        self.chunks = deque()
+        self.backlog = 0            # bytes of audio waiting
+        self.wakeup = asyncio.Event()
+        self.task = None
+        self.messages = 0
+        self.chunks_sent = 0
+        self.dropped = 0
+        self.dropped_bytes = 0
+        self.backlog_total = 0      # bytes waiting, summed over messages
+        self.backlog_max = 0
+        self.last_warning = 0.0
+
+    def start(self, ws):
+        self.task = asyncio.create_task(self._run(ws))
+
+    async def stop(self):
+        if self.task and not self.task.done():
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        self.task = None
+        self.chunks.clear()
+        self.backlog = 0
+
+    def push(self, audio: str):
+        if not audio or self.task is None:
+            return
+        self.chunks.append(audio)
+        self.backlog += len(audio) * 3 // 4
+        while self.backlog > self.max_backlog * self.bytes_per_second and len(self.chunks) > 1:
+            size = len(self.chunks.popleft()) * 3 // 4
+            self.backlog -= size
+            self.dropped += 1
+            self.dropped_bytes += size
+            self._warn_backpressure()
+        self.wakeup.set()
+
+    def _warn_backpressure(self):
+        now = time.monotonic()
+        if now - self.last_warning >= 1.0:
+            self.last_warning = now
+            print(f"[Upstream] socket more than {self.max_backlog:.1f}s behind, dropping oldest audio "
+                  f"({self.dropped_bytes / self.bytes_per_second:.2f}s dropped so far)")
+
+    async def _run(self, ws):
+        while True:
+            await self.wakeup.wait()
+            if self.window > 0:
+                await asyncio.sleep(self.window)
+            self.wakeup.clear()
+            parts = list(self.chunks)
+            waiting = self.backlog
+            self.chunks.clear()
+            self.backlog = 0
+            if not parts:
+                continue
+            self.messages += 1
+            self.chunks_sent += len(parts)
+            self.backlog_total += waiting
+            self.backlog_max = max(self.backlog_max, waiting)
+            try:
+                await ws.send(encode_append(join_base64(parts)))
+            except websockets.exceptions.ConnectionClosed:
+                return      # the receiving side notices too and reconnects
+
+    def summary(self) -> str:
+        per_message = self.chunks_sent / self.messages if self.messages else 0.0
+        backlog = self.backlog_total / self.messages / self.bytes_per_second * 1000 if self.messages else 0.0
+        return (
+            f"{self.messages} messages for {self.chunks_sent} chunks ({per_message:.1f} per message), "
+            f"backlog avg {backlog:.0f} ms, max {self.backlog_max / self.bytes_per_second * 1000:.0f} ms, "
+            f"dropped {self.dropped} chunks "
+            f"({self.dropped_bytes / self.bytes_per_second:.2f}s)"
+        )
+
+
+class PlayoutBuffer:
+    """
+    Jitter buffer between response audio deltas and the robot's speaker.
+
+    Deltas are collected until `target` seconds are buffered (or the
+    response ends), then sent on as `frame`-second messages paced against
+    the monotonic clock, keeping the robot `lead` seconds ahead of what it
+    is playing. An underrun is the buffer running dry before the robot
+    does, after which it buffers up to `target` again. An overrun is more
+    than `max_depth` seconds waiting; the oldest audio above that is
+    dropped. The end of each response is tracked by its id, so `finish`
+    is called right after its last audio even if the next response's
+    deltas are already buffered. With a `resampler`, frames are converted
+    to the robot's rate as sent. The latency gauge is the time audio
+    arriving now will take to play: what is waiting here plus what the
+    robot has queued.
+    """
+
+    def __init__(self, send, finish, sample_rate: int = 24000, frame: float = 0.04, target: float = 0.1,
+                 lead: float = 0.2, max_depth: float = 3.0, resampler=None):
+        self.send = send            # coroutine function taking a base64 frame
+        self.finish = finish        # coroutine function, called when a response has been sent
+        self.bytes_per_second = sample_rate * 2
+        self.frame_bytes = int(frame * sample_rate) * 2
+        self.target_bytes = int(target * sample_rate) * 2
+        self.max_bytes = int(max_depth * sample_rate) * 2
+        self.lead = lead
+        self.resampler = resampler
+        self.buffer = bytearray()
+        self.pushed = 0             # bytes pushed since the last clear()
+        self.taken = 0              # bytes taken from the buffer (sent or dropped)
+        self.last = {}              # response id -> offset after its last audio
+        self.ends = deque()         # offsets at which ended responses finish
+        self.generation = 0         # bumped by clear(), so a stream in progress stops
+        self.wakeup = asyncio.Event()
+        self.task = None
+        self.frames = 0
+        self.underruns = 0
+        self.overruns = 0
+        self.dropped_bytes = 0
+        self.latency = 0.0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def start(self):
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task and not self.task.done():
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        self.task = None
+
+    def push(self, audio: str, response_id: str = None):
+        data = base64.b64decode(audio)
+        self.buffer += data
+        self.pushed += len(data)
+        if response_id is not None:
+            self.last[response_id] = self.pushed
+        self.wakeup.set()
+
+    def end(self, response_id: str = None):
+        """The response has no more audio; send what is left of it, then finish. No id: all pushed so far."""
+        if response_id is None:
+            offset = self.pushed
+            self.last.clear()
+        elif response_id in self.last:
+            offset = self.last.pop(response_id)
+        else:
+            return      # no audio was pushed for it
+        self.ends.append(max(offset, self.ends[-1] if self.ends else 0))
+        self.wakeup.set()
+
+    def clear(self):
+        """Drop buffered audio without finishing, e.g. on barge-in."""
+        self.buffer.clear()
+        self.pushed = self.taken = 0
+        self.last.clear()
+        self.ends.clear()
+        self.generation += 1
+        self.wakeup.set()
+
+    async def _wait(self, timeout: float = None):
+        try:
+            await asyncio.wait_for(self.wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self.wakeup.clear()
+
+    def _available(self) -> int:
+        """Bytes up to the end of the response being sent, if it has ended."""
+        return self.ends[0] - self.taken if self.ends else len(self.buffer)
+
+    def _take(self, partial: bool) -> bytes:
+        size = min(self.frame_bytes, self._available())
+        if size == 0 or (size < self.frame_bytes and not partial):
+            return b""
+        frame = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        self.taken += size
+        return frame
+
+    def _drop_overrun(self):
+        excess = min(len(self.buffer) - self.max_bytes, self._available())
+        excess -= excess % 2
+        if excess > 0:
+            del self.buffer[:excess]
+            self.taken += excess
+            self.overruns += 1
+            self.dropped_bytes += excess
+
+    async def _run(self):
+        while True:
+            while not self.ends and len(self.buffer) < max(self.target_bytes, 1):
+                await self._wait()
+            generation = self.generation
+            clock = time.monotonic()
+            sent = 0.0              # seconds sent since the clock started
+            while generation == self.generation:
+                ahead = clock + sent - time.monotonic()     # seconds queued on the robot
+                if ahead >= self.lead:
+                    await self._wait(ahead - self.lead)
+                    continue
+                self._drop_overrun()
+                ended = bool(self.ends)
+                frame = self._take(partial=ended or ahead <= 0)
+                if frame:
+                    if ahead < 0:
+                        # nothing was queued on the robot, start the clock again
+                        clock, sent, ahead = time.monotonic(), 0.0, 0.0
+                    seconds = len(frame) / self.bytes_per_second
+                    sent += seconds
+                    self._record_latency(ahead + seconds + len(self.buffer) / self.bytes_per_second)
+                    if self.resampler is not None:
+                        frame = self.resampler.process_samples(np.frombuffer(frame, dtype="<i2"))
+                    await self.send(base64.b64encode(frame).decode())
+                elif ended:
+                    self.ends.popleft()
+                    await self.finish()
+                    break
+                elif ahead <= 0:
+                    self.underruns += 1
+                    break
+                else:
+                    await self._wait(ahead)
+
+    def _record_latency(self, seconds: float):
+        self.frames += 1
+        self.latency = seconds
+        self.latency_total += seconds
+        self.latency_max = max(self.latency_max, seconds)
+
+    def stats(self) -> dict:
+        return {
+            "frames": self.frames,
+            "underruns": self.underruns,
+            "overruns": self.overruns,
+            "dropped": self.dropped_bytes / self.bytes_per_second,
+            "latency_avg": self.latency_total / self.frames if self.frames else None,
+            "latency_max": self.latency_max,
+        }
+
+    def summary(self) -> str:
+        avg = self.latency_total / self.frames * 1000 if self.frames else 0.0
+        return (
+            f"{self.frames} frames, {self.underruns} underruns, {self.overruns} overruns "
+            f"({self.dropped_bytes / self.bytes_per_second:.2f}s dropped), "
+            f"playout latency avg {avg:.0f} ms, max {self.latency_max * 1000:.0f} ms"
+        )
+
+
+class PlaybackClock:
+    """
+    How much of the current response the robot has played: the audio sent
+    to it, capped by the time since the first of it was sent (the playout
+    buffer holds audio back until it has enough). Used to truncate the
+    conversation item when the user barges in.
+    """
+
+    def __init__(self, sample_rate: int = 24000):
+        self.bytes_per_second = sample_rate * 2
+        self.item_id = None
+        self.started = None
+        self.bytes = 0
+
+    @property
+    def active(self) -> bool:
+        return self.item_id is not None
+
+    def start(self, item_id: str):
+        self.item_id = item_id
+        self.started = None
+        self.bytes = 0
+
+    def add(self, size: int):
+        """`size` bytes are being sent to the robot."""
+        if self.started is None:
+            self.started = time.monotonic()
+        self.bytes += size
+
+    def played_ms(self) -> int:
+        if self.started is None:
+            return 0
+        return int(min(time.monotonic() - self.started, self.bytes / self.bytes_per_second) * 1000)
+
+    def stop(self):
+        self.item_id = None
+        self.started = None
+        self.bytes = 0
+
+
+class StreamResampler:
+    """
+    Streaming PCM16 resampler for a rational rate ratio, e.g. between a
+    robot at 16 kHz and OpenAI at 24 kHz.
+
+    A polyphase windowed-sinc filter with `taps` taps per phase. The input
+    samples still needed by the next chunk and the filter phase are carried
+    over, so chunked output is the same as resampling the whole stream at
+    once. Chunks are decoded straight into a reused float buffer, and
+    output goes through a reused int16 buffer.
+    """
+
+    def __init__(self, rate_in: int, rate_out: int, taps: int = 16):
+        g = math.gcd(rate_in, rate_out)
+        self.up, self.down = rate_out // g, rate_in // g
+        self.taps = taps
+        # filter bank: bank[phase, k] weighs input sample (window start + k)
+        cutoff = 0.95 * min(1.0, self.up / self.down)     # in cycles per input sample, times 2
+        k = np.arange(taps)
+        distance = (np.arange(self.up)[:, None] / self.up) + (taps // 2 - 1 - k)[None, :]
+        window = np.where(np.abs(distance) < taps / 2,
+                          0.42 + 0.5 * np.cos(2 * np.pi * distance / taps) + 0.08 * np.cos(4 * np.pi * distance / taps), 0.0)
+        bank = cutoff * np.sinc(cutoff * distance) * window
+        self.bank = (bank / bank.sum(axis=1, keepdims=True)).astype(np.float32)
+        self.work = np.zeros(4096, dtype=np.float32)
+        self.out = np.zeros(4096, dtype=np.int16)
+        self.reset()
+
+    def reset(self):
+        self.held = self.taps // 2 - 1      # samples carried over, initially zeros
+        self.work[:self.held] = 0.0
+        self.phase = 0                      # position of the next output, in 1/up input samples
+
+    def process(self, audio: str) -> str:
+        """Resample one base64 PCM16 chunk."""
+        raw = base64.b64decode(audio)
+        out = self.process_samples(np.frombuffer(raw, dtype="<i2", count=len(raw) // 2))
+        return base64.b64encode(out).decode()
+
+    def process_samples(self, samples) -> np.ndarray:
+        """Resample int16 samples; the result is a view into a reused buffer."""
+        total = self.held + len(samples)
+        if total > len(self.work):
+            work = np.zeros(2 * total, dtype=np.float32)
+            work[:self.held] = self.work[:self.held]
+            self.work = work
+        work = self.work
+        work[self.held:total] = samples
+        # outputs whose whole window is available: start + taps <= total
+        available = total - self.taps + 1
+        n = max(0, (available * self.up - self.phase + self.down - 1) // self.down) if available > 0 else 0
+        if n:
+            positions = self.phase + np.arange(n) * self.down
+            starts, phases = np.divmod(positions, self.up)
+            windows = work[starts[:, None] + np.arange(self.taps)]
+            values = np.einsum("ij,ij->i", windows, self.bank[phases])
+            if n > len(self.out):
+                self.out = np.zeros(2 * n, dtype=np.int16)
+            out = self.out[:n]
+            np.clip(np.rint(values), -32768, 32767, out=values)
+            out[:] = values
+        else:
+            out = self.out[:0]
+        # carry over what the next outputs need
+        position = self.phase + n * self.down
+        consumed = min(position // self.up, total)
+        self.phase = position - consumed * self.up
+        self.held = total - consumed
+        work[:self.held] = work[consumed:total]
+        return out
+
+
+class VoiceGate:
+    """
+    Local voice activity gate for PCM16 microphone audio.
+
+    Each chunk is split into 10 ms frames; a frame counts as speech when its
+    energy is above `threshold_db` (dBFS) and its zero-crossing rate is low
+    enough to be voiced, or when it is `loud_db` louder than the threshold.
+    Once speech is seen the gate stays open for `hangover` seconds, and the
+    `pre_roll` seconds before it are sent too, so word onsets are not clipped.
+    The hangover must be longer than the server VAD's silence duration
+    (500 ms by default), or the server never sees the end of a turn.
+    """
+
+    def __init__(self, sample_rate: int = 24000, threshold_db: float = -45.0, zcr_max: float = 0.25,
+                 loud_db: float = 15.0, hangover: float = 0.8, pre_roll: float = 0.3):
+        self.sample_rate = sample_rate
+        self.frame = sample_rate // 100
+        self.threshold = (32768 * 10 ** (threshold_db / 20)) ** 2
+        self.loud = self.threshold * 10 ** (loud_db / 10)
+        self.zcr_max = zcr_max
+        self.hangover = hangover
+        self.pre_roll = pre_roll
+        self.buffered = deque()     # (audio, seconds) held back while the gate is closed
+        self.buffered_seconds = 0.0
+        self.open_for = 0.0
+        self.onset = False          # the last chunk opened the gate
+        self.total_seconds = 0.0
+        self.sent_seconds = 0.0
+        self.process_time = 0.0
+
+    def reset(self):
+        self.buffered.clear()
+        self.buffered_seconds = 0.0
+        self.open_for = 0.0
+        self.onset = False
+
+    def is_speech(self, samples) -> bool:
+        size = min(self.frame, len(samples))
+        if size < 2:
+            return False
+        n = len(samples) // size
+        frames = samples[:n * size].reshape(n, size).astype(np.float32)
+        energy = np.mean(frames * frames, axis=1)
+        signs = np.signbit(frames)
+        zcr = np.mean(signs[:, 1:] != signs[:, :-1], axis=1)
+        return bool(np.any((energy > self.threshold) & ((zcr < self.zcr_max) | (energy > self.loud))))
+
+    def process(self, audio: str) -> list:
+        """Base64 chunks to send upstream for one base64 microphone chunk."""
+        if not audio:
+            return []
+        start = time.perf_counter()
+        raw = base64.b64decode(audio)
+        seconds = len(raw) / (2 * self.sample_rate)
+        self.total_seconds += seconds
+        out = []
+        speech = self.is_speech(np.frombuffer(raw, dtype="<i2", count=len(raw) // 2))
+        self.onset = speech and self.open_for <= 0
+        if speech:
+            out = [chunk for chunk, _ in self.buffered]
+            self.sent_seconds += self.buffered_seconds
+            self.buffered.clear()
+            self.buffered_seconds = 0.0
+            self.open_for = self.hangover
+            out.append(audio)
+        elif self.open_for > 0:
+            self.open_for -= seconds
+            out.append(audio)
+        else:
+            self.buffered.append((audio, seconds))
+            self.buffered_seconds += seconds
+            while self.buffered_seconds > self.pre_roll and len(self.buffered) > 1:
+                self.buffered_seconds -= self.buffered.popleft()[1]
+        if out:
+            self.sent_seconds += seconds
+        self.process_time += time.perf_counter() - start
+        return out
+
+    @property
+    def suppressed(self) -> float:
+        """Fraction of microphone audio that was not sent."""
+        return max(0.0, 1.0 - self.sent_seconds / self.total_seconds) if self.total_seconds else 0.0
+
+    def summary(self) -> str:
+        per_second = self.process_time / self.total_seconds * 1000 if self.total_seconds else 0.0
+        return (
+            f"suppressed {self.suppressed:.0%} of {self.total_seconds:.1f}s of microphone audio, "
+            f"{per_second:.2f} ms per audio second"
+        )
@@ -0,0 +1,62 @@
+import asyncio
+import json
+import time
+import websockets
+
+
+class EventStats:
+    """Per-event-type message counts and handler time."""
+
+    def __init__(self):
+        self.counts = {}
+        self.handler_time = {}
+        self.handler_max = {}
+
+    def record(self, kind: str, seconds: float = None):
+        self.counts[kind] = self.counts.get(kind, 0) + 1
+        if seconds is not None:
+            self.handler_time[kind] = self.handler_time.get(kind, 0.0) + seconds
+            self.handler_max[kind] = max(self.handler_max.get(kind, 0.0), seconds)
+
+    def summary(self) -> str:
+        lines = []
+        for kind, count in sorted(self.counts.items(), key=lambda item: -item[1]):
+            line = f"  {kind}: {count}"
+            if kind in self.handler_time:
+                avg = self.handler_time[kind] / count
+                line += f", handler avg {avg * 1000:.2f} ms, max {self.handler_max[kind] * 1000:.2f} ms"
+            lines.append(line)
+        return "\n".join(lines)
+
+
+async def dispatch_events(ws, handlers: dict, stop_event: asyncio.Event, stats: EventStats = None):
+    """
+    Dispatch JSON events from `ws` to `handlers[event["type"]]` until the
+    connection closes or `stop_event` is set. Handlers are awaited in order.
+    """
+    async def receive():
+        try:
+            async for message in ws:
+                data = json.loads(message)
+                kind = data.get("type")
+                handler = handlers.get(kind)
+                if handler is None:
+                    if stats:
+                        stats.record(kind)
+                    continue
+                start = time.perf_counter()
+                await handler(data)
+                if stats:
+                    stats.record(kind, time.perf_counter() - start)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    receiver = asyncio.create_task(receive())
+    stopper = asyncio.create_task(stop_event.wait())
+    try:
+        await asyncio.wait({receiver, stopper}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        stopper.cancel()
+        receiver.cancel()
+    if receiver.done() and not receiver.cancelled():
+        receiver.result()   # re-raise handler errors
@@ -0,0 +1,305 @@
+import asyncio
+import json
+import time
+from collections import deque
+import websockets
+
+
+class Transcript:
+    """The last `max_turns` user and assistant utterances, as text, for replay into a new session."""
+
+    def __init__(self, max_turns: int = 6, max_chars: int = 300):
+        self.messages = deque(maxlen=2 * max_turns)
+        self.max_chars = max_chars
+
+    def add(self, role: str, text: str):
+        text = (text or "").strip()
+        if text:
+            self.messages.append((role, text[:self.max_chars]))
+
+    def items(self) -> list:
+        """conversation.item.create events recreating the recent conversation."""
+        return [{
+            "type": "conversation.item.create",
+            "item": {
+                "type": "message",
+                "role": role,
+                "content": [{"type": "input_text" if role == "user" else "text", "text": text}]
+            }
+        } for role, text in self.messages]
+
+
+# Rough token costs, for the context size estimate
+USER_AUDIO_TOKENS_PER_SECOND = 10
+ASSISTANT_AUDIO_TOKENS_PER_SECOND = 20
+IMAGE_TOKENS = 255
+CHARS_PER_TOKEN = 4
+
+
+class ConversationContext:
+    """
+    The server-side conversation, tracked from conversation.item.* events,
+    and pruned to keep sessions small.
+
+    A turn is a run of user items (e.g. an image and the audio after it)
+    and the items that follow until the next user item. prune() returns the
+    events that delete everything before the last `max_turns` turns, and
+    all but the last `max_images` images (0 keeps everything). With
+    `summary`, the transcripts of deleted items are kept, up to
+    `summary_chars`, in a system message at the start of the conversation.
+    """
+
+    def __init__(self, max_turns: int = 0, max_images: int = 0, summary: bool = False, summary_chars: int = 1000):
+        self.max_turns = max_turns
+        self.max_images = max_images
+        self.summary_enabled = summary
+        self.summary_chars = summary_chars
+        self.items = {}         # item id -> {"role", "kind", "text"}, in conversation order
+        self.audio_ms = {}      # item id -> milliseconds of audio
+        self.speech_start = {}
+        self.summary_text = ""
+        self.summary_id = None
+        self.summaries = 0
+        self.pruned = 0
+        self.max_count = 0
+        self.max_tokens = 0
+        self.handlers = {
+            "conversation.item.created": self.item_created,
+            "conversation.item.deleted": self.item_deleted,
+            "conversation.item.truncated": self.item_truncated,
+            "input_audio_buffer.speech_started": self.speech_started,
+            "input_audio_buffer.speech_stopped": self.speech_stopped,
+        }
+
+    def handle(self, event: dict):
+        handler = self.handlers.get(event.get("type"))
+        if handler:
+            handler(event)
+
+    def reset(self):
+        """A new session starts with an empty conversation."""
+        self.items.clear()
+        self.audio_ms.clear()
+        self.speech_start.clear()
+        self.summary_id = None
+
+    def item_created(self, data):
+        item = data.get("item", {})
+        content = item.get("content") or []
+        types = {part.get("type") for part in content}
+        if "input_image" in types:
+            kind = "image"
+        elif types & {"input_audio", "audio"}:
+            kind = "audio"
+        elif item.get("type") == "message":
+            kind = "text"
+        else:
+            kind = item.get("type", "other")
+        text = " ".join(part.get("text") or part.get("transcript") or "" for part in content).strip()
+        self.items[item.get("id")] = {"role": item.get("role"), "kind": kind, "text": text}
+        self.max_count = max(self.max_count, len(self.items))
+        self.max_tokens = max(self.max_tokens, self.tokens)
+
+    def item_deleted(self, data):
+        self.items.pop(data.get("item_id"), None)
+        self.audio_ms.pop(data.get("item_id"), None)
+
+    def item_truncated(self, data):
+        self.audio_ms[data.get("item_id")] = data.get("audio_end_ms", 0)
+
+    def speech_started(self, data):
+        self.speech_start[data.get("item_id")] = data.get("audio_start_ms", 0)
+
+    def speech_stopped(self, data):
+        item_id = data.get("item_id")
+        start = self.speech_start.pop(item_id, None)
+        if start is not None:
+            self.audio_ms[item_id] = max(0, data.get("audio_end_ms", 0) - start)
+
+    def add_audio(self, item_id: str, size: int, sample_rate: int = 24000):
+        """`size` bytes of PCM16 response audio for `item_id`."""
+        self.audio_ms[item_id] = self.audio_ms.get(item_id, 0) + size * 500 // sample_rate
+
+    def transcript(self, item_id: str, text: str):
+        item = self.items.get(item_id)
+        if item is not None and text:
+            item["text"] = text.strip()
+
+    @property
+    def count(self) -> int:
+        return len(self.items)
+
+    @property
+    def images(self) -> int:
+        return sum(1 for item in self.items.values() if item["kind"] == "image")
+
+    @property
+    def tokens(self) -> int:
+        """Estimated size of the conversation in tokens."""
+        total = 0
+        for item_id, item in self.items.items():
+            if item["kind"] == "image":
+                total += IMAGE_TOKENS
+            elif item["kind"] == "audio":
+                rate = USER_AUDIO_TOKENS_PER_SECOND if item["role"] == "user" else ASSISTANT_AUDIO_TOKENS_PER_SECOND
+                total += self.audio_ms.get(item_id, 0) * rate // 1000
+            else:
+                total += len(item["text"]) // CHARS_PER_TOKEN
+        return total
+
+    def prune(self) -> list:
+        """Events deleting items outside the window, and replacing the summary, if any."""
+        self.max_tokens = max(self.max_tokens, self.tokens)
+        ids = [item_id for item_id in self.items if item_id != self.summary_id]
+        delete = []
+        if self.max_turns:
+            starts = [i for i, item_id in enumerate(ids) if self.items[item_id]["role"] == "user"
+                      and (i == 0 or self.items[ids[i - 1]]["role"] != "user")]
+            if len(starts) > self.max_turns:
+                delete = ids[:starts[-self.max_turns]]
+        if self.max_images:
+            images = [item_id for item_id in ids[len(delete):] if self.items[item_id]["kind"] == "image"]
+            delete += images[:-self.max_images]
+        if not delete:
+            return []
+
+        events = []
+        if self.summary_enabled:
+            lines = [f"{'User' if self.items[item_id]['role'] == 'user' else 'You'}: {self.items[item_id]['text']}"
+                     for item_id in delete if self.items[item_id]["text"]]
+            if lines:
+                self.summary_text = "\n".join(filter(None, [self.summary_text, *lines]))[-self.summary_chars:]
+                if self.summary_id:
+                    delete.append(self.summary_id)
+                events.append(self.summary_item())
+        for item_id in delete:
+            self.items.pop(item_id, None)
+            self.audio_ms.pop(item_id, None)
+            events.append({"type": "conversation.item.delete", "item_id": item_id})
+        self.pruned += len(delete)
+        return events
+
+    def summary_item(self) -> dict:
+        """An event inserting the summary at the start of the conversation."""
+        self.summaries += 1
+        self.summary_id = f"summary_{self.summaries:06d}"
+        return {
+            "type": "conversation.item.create",
+            "previous_item_id": "root",
+            "item": {
+                "id": self.summary_id,
+                "type": "message",
+                "role": "system",
+                "content": [{"type": "input_text", "text": "Earlier in this conversation:\n" + self.summary_text}]
+            }
+        }
+
+    def stats(self) -> dict:
+        return {"items": self.count, "tokens": self.tokens, "max_items": self.max_count,
+                "max_tokens": self.max_tokens, "pruned": self.pruned}
+
+    def summary(self) -> str:
+        return (f"{self.count} items (~{self.tokens} tokens), max {self.max_count} items (~{self.max_tokens} tokens), "
+                f"{self.pruned} pruned")
+
+
+class RealtimeConnector:
+    """
+    Opens Realtime sessions: connect, wait for session.created, send the
+    session configuration. With `standby`, a second, configured session is
+    kept open (and renewed before `standby_max_age`), so a dropped
+    connection can be replaced without a handshake. Otherwise, and when the
+    standby is gone too, connect() retries with exponential backoff.
+    """
+
+    def __init__(self, url: str, headers: dict, session: dict, standby: bool = True,
+                 standby_max_age: float = 20 * 60, timeout: float = 10.0):
+        self.url = url
+        self.headers = headers
+        self.session = session
+        self.standby_enabled = standby
+        self.standby_max_age = standby_max_age
+        self.timeout = timeout
+        self.standby = None
+        self.standby_opened = 0.0
+        self.standby_task = None
+        self.handshakes = []
+        self.startup = None
+        self.gaps = []
+
+    async def open(self):
+        start = time.monotonic()
+        ws = await websockets.connect(self.url, additional_headers=self.headers, open_timeout=self.timeout)
+        try:
+            event = json.loads(await asyncio.wait_for(ws.recv(), self.timeout))
+            if event.get("type") != "session.created":
+                raise ConnectionError(f"Expected session.created, got {event.get('type')}: {event}")
+            await ws.send(json.dumps({"type": "session.update", "session": self.session}))
+        except BaseException:
+            await ws.close()
+            raise
+        self.handshakes.append(time.monotonic() - start)
+        return ws
+
+    async def connect(self, stop_event: asyncio.Event):
+        """A ready session, the standby if there is one; None if stopped first."""
+        delay = 0.5
+        while not stop_event.is_set():
+            standby, self.standby = self.standby, None
+            if standby is not None and standby.close_code is None:
+                return standby
+            try:
+                return await self.open()
+            except (OSError, asyncio.TimeoutError, ConnectionError, websockets.exceptions.WebSocketException) as e:
+                print(f"[Realtime] connection failed ({e}), retrying in {delay:.1f}s")
+                try:
+                    await asyncio.wait_for(stop_event.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                delay = min(delay * 2, 30.0)
+        return None
+
+    def start_standby(self):
+        if self.standby_enabled and self.standby_task is None:
+            self.standby_task = asyncio.create_task(self._keep_standby())
+
+    async def _keep_standby(self):
+        delay = 1.0
+        while True:
+            stale = self.standby is not None and (
+                self.standby.close_code is not None or time.monotonic() - self.standby_opened > self.standby_max_age)
+            if stale:
+                old, self.standby = self.standby, None
+                await old.close()
+            if self.standby is None:
+                try:
+                    ws = await self.open()
+                except (OSError, asyncio.TimeoutError, ConnectionError, websockets.exceptions.WebSocketException) as e:
+                    print(f"[Realtime] standby session failed ({e})")
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, 60.0)
+                    continue
+                self.standby, self.standby_opened, delay = ws, time.monotonic(), 1.0
+            await asyncio.sleep(1.0)
+
+    async def close(self):
+        if self.standby_task:
+            self.standby_task.cancel()
+            try:
+                await self.standby_task
+            except asyncio.CancelledError:
+                pass
+        if self.standby is not None:
+            await self.standby.close()
+            self.standby = None
+
+    def stats(self) -> dict:
+        return {"startup": self.startup, "handshakes": self.handshakes, "reconnect_gaps": self.gaps}
+
+    def summary(self) -> str:
+        handshake = sum(self.handshakes) / len(self.handshakes) * 1000 if self.handshakes else 0.0
+        line = f"ready {self.startup * 1000:.0f} ms after start, " if self.startup is not None else ""
+        line += f"{len(self.handshakes)} handshakes (avg {handshake:.0f} ms), {len(self.gaps)} reconnects"
+        if self.gaps:
+            line += f" (gap avg {sum(self.gaps) / len(self.gaps) * 1000:.0f} ms, max {max(self.gaps) * 1000:.0f} ms)"
+        return line
@@ -0,0 +1,130 @@
+import asyncio
+import base64
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from PIL import Image
+
+
+def dhash(image: Image.Image, size: int = 8) -> int:
+    """64-bit difference hash: brightness gradients of a tiny grayscale copy."""
+    small = image.convert("L").resize((size + 1, size), Image.Resampling.BILINEAR)
+    pixels = small.tobytes()
+    bits = 0
+    for row in range(size):
+        offset = row * (size + 1)
+        for col in range(size):
+            bits = (bits << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return bits
+
+
+def decode_frame(image: str) -> np.ndarray:
+    """A base64 JPEG as an HxWx3 uint8 array."""
+    return np.asarray(Image.open(io.BytesIO(base64.b64decode(image))).convert("RGB"))
+
+
+class FrameSlot:
+    """
+    The latest camera frame, kept as the base64 payload it arrived as; it
+    is only decoded (by FrameProcessor) if it is used.
+    """
+
+    def __init__(self):
+        self.image = None
+        self.received_at = None
+        self.received = 0
+        self.used = 0
+
+    def put(self, image: str):
+        if image and image is not self.image:
+            self.image = image
+            self.received_at = time.monotonic()
+            self.received += 1
+
+    def take(self):
+        if self.image is not None:
+            self.used += 1
+        return self.image
+
+    def summary(self) -> str:
+        return f"{self.received} frames received, {self.used} used"
+
+
+class FrameProcessor:
+    """
+    Prepares camera frames for upload to the vision model.
+
+    Frames stay base64 JPEG as received; only the one about to be sent is
+    decoded, on a worker thread. It is downscaled to fit `max_size`,
+    re-encoded at `quality`, and skipped if its perceptual hash is within
+    `max_distance` bits of the last image sent (the scene has not changed).
+    """
+
+    def __init__(self, max_size: int = 512, quality: int = 70, max_distance: int = 4):
+        self.max_size = max_size
+        self.quality = quality
+        self.max_distance = max_distance
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="frames")
+        self.last_image = None      # the base64 frame last processed
+        self.last_hash = None       # hash of the image last sent
+        self.frames = 0
+        self.processed = 0
+        self.sent = 0
+        self.skipped = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.process_time = 0.0
+        self.process_max = 0.0
+
+    async def prepare(self, image: str):
+        """The base64 JPEG to send for this frame, or None if it can be skipped."""
+        self.frames += 1
+        self.bytes_in += len(image)
+        if image is self.last_image:
+            self.skipped += 1
+            return None
+        self.last_image = image
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        prepared, frame_hash = await loop.run_in_executor(self.executor, self._process, image)
+        elapsed = time.perf_counter() - start
+        self.processed += 1
+        self.process_time += elapsed
+        self.process_max = max(self.process_max, elapsed)
+        if prepared is None:
+            self.skipped += 1
+            return None
+        self.last_hash = frame_hash
+        self.sent += 1
+        self.bytes_out += len(prepared)
+        return prepared
+
+    def reset(self):
+        """Forget the last image sent, e.g. for a new session that has not seen it."""
+        self.last_image = None
+        self.last_hash = None
+
+    def _process(self, image: str):
+        frame = Image.open(io.BytesIO(base64.b64decode(image)))
+        # let the JPEG decoder do most of the downscaling
+        frame.draft("RGB", (self.max_size, self.max_size))
+        frame_hash = dhash(frame)
+        if self.last_hash is not None and bin(frame_hash ^ self.last_hash).count("1") <= self.max_distance:
+            return None, frame_hash
+        frame = frame.convert("RGB")
+        frame.thumbnail((self.max_size, self.max_size))
+        buffer = io.BytesIO()
+        frame.save(buffer, format="JPEG", quality=self.quality)
+        return base64.b64encode(buffer.getvalue()).decode(), frame_hash
+
+    def close(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def summary(self) -> str:
+        avg = self.process_time / self.processed * 1000 if self.processed else 0.0
+        return (
+            f"{self.sent} of {self.frames} frames sent ({self.skipped} unchanged), "
+            f"{self.bytes_in - self.bytes_out} of {self.bytes_in} bytes saved, "
+            f"{avg:.1f} ms per frame (max {self.process_max * 1000:.1f} ms)"
+        )
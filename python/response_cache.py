@@ -0,0 +1,99 @@
+import hashlib
+import re
+import sqlite3
+import time
+from collections import OrderedDict
+
+
+FILLER_WORDS = {"um", "uh", "erm", "er", "hmm", "mm"}
+
+
+def normalize_utterance(text: str) -> str:
+    """Lowercase, drop punctuation and filler words, collapse whitespace."""
+    words = re.sub(r"[^\w\s]", "", text.lower()).split()
+    return " ".join(w for w in words if w not in FILLER_WORDS)
+
+
+class ResponseCache:
+    """
+    Cache of LLM responses for repeated questions.
+
+    Keyed on the normalized user text, system prompt and model. Entries are
+    evicted least-recently-used beyond `max_entries` and expire after `ttl`
+    seconds. With `path`, entries are also written to a local SQLite file and
+    reloaded on start-up. Only turns with at most `max_context` earlier user
+    turns in the dialog are looked up or stored.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl: float = 24 * 3600, path: str = None, max_context: int = 0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_context = max_context
+        self.entries = OrderedDict()    # key -> (created, response)
+        self.hits = 0
+        self.misses = 0
+
+        self.db = None
+        if path:
+            self.db = sqlite3.connect(path)
+            self.db.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, response TEXT, created REAL)")
+            self.db.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.ttl,))
+            self.db.commit()
+            rows = self.db.execute(
+                "SELECT key, response, created FROM responses ORDER BY created DESC LIMIT ?", (self.max_entries,)
+            ).fetchall()
+            for key, response, created in reversed(rows):
+                self.entries[key] = (created, response)
+
+    def cacheable(self, context_turns: int) -> bool:
+        return context_turns <= self.max_context
+
+    def key(self, user_text: str, system_prompt: str, model: str) -> str:
+        raw = "\x1f".join((normalize_utterance(user_text), system_prompt, model))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, user_text: str, system_prompt: str, model: str):
+        key = self.key(user_text, system_prompt, model)
+        entry = self.entries.get(key)
+        if entry is not None and time.time() - entry[0] > self.ttl:
+            self._remove(key)
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        print(f"[Cache] hit ({self.summary()})")
+        return entry[1]
+
+    def put(self, user_text: str, system_prompt: str, model: str, response: str):
+        if not response or not normalize_utterance(user_text):
+            return
+        key = self.key(user_text, system_prompt, model)
+        created = time.time()
+        self.entries[key] = (created, response)
+        self.entries.move_to_end(key)
+        if self.db:
+            self.db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?)", (key, response, created))
+            self.db.commit()
+        while len(self.entries) > self.max_entries:
+            self._remove(next(iter(self.entries)))
+
+    def _remove(self, key: str):
+        self.entries.pop(key, None)
+        if self.db:
+            self.db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self.db.commit()
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def summary(self) -> str:
+        return f"hits {self.hits}, misses {self.misses}, hit rate {self.hit_rate:.0%}, {len(self.entries)} entries"
+
+    def close(self):
+        if self.db:
+            self.db.close()
+            self.db = None
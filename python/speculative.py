@@ -0,0 +1,120 @@
+import asyncio
+import difflib
+import re
+import time
+
+
+def similarity(a: str, b: str) -> float:
+    """Word-level similarity between two transcripts, from 0.0 to 1.0."""
+    wa = re.findall(r"\w+", a.lower())
+    wb = re.findall(r"\w+", b.lower())
+    if not wa and not wb:
+        return 1.0
+    return difflib.SequenceMatcher(None, wa, wb).ratio()
+
+
+class SpeculativeTurn:
+    """
+    Starts generating on partial hearing results, before the user has finished.
+
+    `start(text, confirmed)` launches a request on the partial text; the bridge
+    must hold back the response until `confirmed` resolves. When the final
+    transcript arrives the in-flight request is either kept (confirmed=True),
+    or abandoned through `cancel()` (confirmed=False) so the bridge can restart.
+    """
+
+    def __init__(self, start, cancel, threshold: float = 0.9, min_words: int = 3):
+        self.start = start
+        self.cancel = cancel
+        self.threshold = threshold
+        self.min_words = min_words
+
+        self.text = None
+        self.confirmed = None
+        self.started_at = None
+        self.ready_at = None
+
+        self.turns = 0
+        self.hits = 0
+        self.saved_total = 0.0
+        self.last_saved = 0.0
+
+    def on_partial(self, text: str):
+        if len(text.split()) < self.min_words:
+            return
+        if self.text is not None and similarity(text, self.text) >= self.threshold:
+            return
+        self.abandon()
+        self.text = text
+        self.started_at = time.monotonic()
+        self.confirmed = asyncio.get_running_loop().create_future()
+        self.start(text, self.confirmed)
+
+    def mark_ready(self, confirmed):
+        """Called by the bridge when the speculative response is ready to speak."""
+        if confirmed is self.confirmed and self.ready_at is None:
+            self.ready_at = time.monotonic()
+
+    def on_final(self, text: str) -> bool:
+        """Returns True if the in-flight speculative response was kept."""
+        self.turns += 1
+        if self.text is None:
+            return False
+
+        if similarity(text, self.text) < self.threshold:
+            print(f"[Speculative] miss: '{self.text}' -> '{text}' ({self.summary()})")
+            self.abandon()
+            return False
+
+        now = time.monotonic()
+        saved = min(now, self.ready_at or now) - self.started_at
+        self.hits += 1
+        self.saved_total += saved
+        self.last_saved = saved
+        self.confirmed.set_result(True)
+        self._reset()
+        print(f"[Speculative] hit, saved {saved:.2f}s ({self.summary()})")
+        return True
+
+    def fail(self, confirmed) -> bool:
+        """
+        Called by the bridge when a speculative request failed or produced no
+        text. Before the final transcript, the speculation is dropped, so
+        on_final() falls back to a normal request. Returns True if it had
+        already been confirmed, in which case the bridge must answer the final
+        transcript itself.
+        """
+        if confirmed is self.confirmed:
+            if not confirmed.done():
+                confirmed.set_result(False)
+            self._reset()
+            return False
+        if confirmed.done() and confirmed.result():
+            self.hits -= 1      # not a hit after all
+            self.saved_total -= self.last_saved
+            return True
+        return False
+
+    def abandon(self):
+        """Drop the in-flight speculative request, if any."""
+        if self.confirmed is not None and not self.confirmed.done():
+            self.confirmed.set_result(False)
+            self.cancel()
+        self._reset()
+
+    def _reset(self):
+        self.text = None
+        self.confirmed = None
+        self.started_at = None
+        self.ready_at = None
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.turns if self.turns else 0.0
+
+    @property
+    def avg_saved(self) -> float:
+        return self.saved_total / self.hits if self.hits else 0.0
+
+    def summary(self) -> str:
+        return f"hit rate {self.hit_rate:.0%} ({self.hits}/{self.turns}), avg saved {self.avg_saved:.2f}s"
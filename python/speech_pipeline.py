@@ -0,0 +1,234 @@
+import asyncio
+import re
+import time
+from furhat_realtime_api import Events
+
+
+# Words that end in "." without ending the sentence
+ABBREVIATIONS = {
+    "mr", "mrs", "ms", "dr", "prof", "sr", "jr", "st", "mt", "vs", "etc",
+    "e.g", "i.e", "a.m", "p.m", "u.s", "u.k", "approx", "inc", "ltd", "co", "dept",
+}
+
+# Words that only act as abbreviations in front of a number ("No. 5", "p. 12")
+NUMBER_PREFIXES = {"no", "nr", "vol", "p", "pp", "ch", "fig"}
+
+# Sentence terminator followed by optional closing quotes/brackets and whitespace.
+# Decimals ("3.14") and thousands ("1,000") never match, since they have no space.
+SENTENCE_END = re.compile(r"[.!?…]+[\"')\]]*\s+")
+CLAUSE_END = re.compile(r"(?:[,;:]|\s[—–-])(?=\s)")
+
+
+class SentenceSegmenter:
+    """
+    Splits streamed LLM text into speakable sentences.
+
+    The first segment of a response may be cut at a clause boundary
+    (after at least `first_clause_words` words) so speech can start early;
+    later segments are whole sentences, unless they grow beyond `max_chars`.
+    """
+
+    def __init__(self, first_clause_words: int = 4, max_chars: int = 200):
+        self.first_clause_words = first_clause_words
+        self.max_chars = max_chars
+        self.reset()
+
+    def reset(self):
+        self.buffer = ""
+        self.emitted = 0
+
+    def feed(self, text: str) -> list:
+        self.buffer += text
+        segments = []
+        while True:
+            end = self._sentence_end()
+            if end is None and (self.emitted == 0 or len(self.buffer) > self.max_chars):
+                end = self._clause_end()
+            if end is None:
+                break
+            segment = self.buffer[:end].strip()
+            self.buffer = self.buffer[end:]
+            if segment:
+                segments.append(segment)
+                self.emitted += 1
+        return segments
+
+    def flush(self) -> list:
+        rest = self.buffer.strip()
+        self.reset()
+        return [rest] if rest else []
+
+    def _sentence_end(self):
+        for m in SENTENCE_END.finditer(self.buffer):
+            boundary = self._is_boundary(m)
+            if boundary is None:
+                return None     # undecided until more text arrives
+            if boundary:
+                return m.end()
+        return None
+
+    def _is_boundary(self, m):
+        if m.group().rstrip("\"')] \t\r\n") != ".":
+            return True
+        words = self.buffer[:m.start()].split()
+        if not words:
+            return False
+        word = words[-1].lstrip("\"'([").lower()
+        if word in ABBREVIATIONS:
+            return False
+        if len(word) == 1 and word.isalpha():
+            return False    # initials, "J. R. R. Tolkien"
+        if word in NUMBER_PREFIXES:
+            following = self.buffer[m.end():m.end() + 1]
+            if not following:
+                return None
+            if following.isdigit():
+                return False
+        if word.isdigit() and len(words) == 1:
+            return False    # list marker, "1. "
+        return True
+
+    def _clause_end(self):
+        for m in CLAUSE_END.finditer(self.buffer):
+            if len(self.buffer[:m.start()].split()) >= self.first_clause_words:
+                return m.end()
+        return None
+
+
+class SpeechPipeline:
+    """
+    Streaming speech stage between an LLM token stream and Furhat.
+
+    Text is segmented into sentences and put on a bounded queue. A single
+    worker speaks one utterance at a time and waits for Furhat's speak_end
+    before sending the next; segments that queued up meanwhile are merged
+    into one request. With a `tracker` (turn_metrics.TurnTracker), speak
+    requests, speak_start and speak_end are recorded on the current turn.
+
+    A reply is several speak requests, and Furhat resumes listening after
+    each of them (resume_robot_end), often picking up echo or noise. A
+    hear_start within `grace` seconds of the end of an utterance, while the
+    reply goes on, is held (heard_start() returns False); its hear_end is
+    dropped if it has fewer than `min_words` words (heard_end() returns
+    False), otherwise it is a late barge-in.
+    """
+
+    def __init__(self, furhat, max_queue: int = 8, first_clause_words: int = 4, max_chars: int = 200, tracker=None,
+                 grace: float = 0.5, min_words: int = 2):
+        self.furhat = furhat
+        self.tracker = tracker
+        self.segmenter = SentenceSegmenter(first_clause_words, max_chars)
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.speaking = None
+        self.speak_ended = asyncio.Event()
+        self.spoken = []
+        self.requests = 0
+        self.replying = False
+        self.finished = False
+        self.grace = grace
+        self.min_words = min_words
+        self.ended_at = 0.0
+        self.held = False
+        self.worker = None
+
+    def attach(self):
+        """Register Furhat handlers and start the speak worker."""
+        self.furhat.add_handler(Events.response_speak_end, self.on_speak_end)
+        if self.tracker:
+            self.furhat.add_handler(Events.response_speak_start, self.on_speak_start)
+        self.worker = asyncio.create_task(self._run())
+
+    async def on_speak_start(self, event):
+        if self.speaking is not None:
+            self.tracker.mark("speak_start")
+
+    async def on_speak_end(self, event):
+        if self.speaking is not None:
+            if self.tracker:
+                self.tracker.mark("speak_end")
+            self.ended_at = time.monotonic()
+            self.speak_ended.set()
+
+    def heard_start(self) -> bool:
+        """False if this hear_start is held: it came right after an utterance, in the middle of a reply."""
+        self.held = self.replying and time.monotonic() - self.ended_at < self.grace
+        return not self.held
+
+    def heard_end(self, text: str) -> bool:
+        """False if the user's turn is noise: a held hear_start followed by no or too few words."""
+        held, self.held = self.held, False
+        return not held or len((text or "").split()) >= self.min_words
+
+    def begin(self):
+        """Start a new response."""
+        self.segmenter.reset()
+        self.spoken = []
+        self.finished = False
+
+    async def feed(self, text: str):
+        for segment in self.segmenter.feed(text):
+            await self.queue.put(segment)
+
+    async def finish(self):
+        self.finished = True
+        for segment in self.segmenter.flush():
+            await self.queue.put(segment)
+        self._check_done()
+
+    async def say(self, text: str):
+        self.finished = True
+        await self.queue.put(text)
+
+    def _check_done(self):
+        if self.finished and self.speaking is None and self.queue.empty():
+            self.replying = False
+
+    async def wait_idle(self) -> str:
+        """Wait until everything queued has been spoken; returns the spoken text."""
+        await self.queue.join()
+        return " ".join(self.spoken)
+
+    def clear(self):
+        """Drop queued speech that has not been sent to Furhat yet."""
+        self.segmenter.reset()
+        self.replying = False
+        self.finished = True
+        while not self.queue.empty():
+            self.queue.get_nowait()
+            self.queue.task_done()
+
+    async def close(self):
+        if self.worker and not self.worker.done():
+            self.worker.cancel()
+            try:
+                await self.worker
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self):
+        while True:
+            parts = [await self.queue.get()]
+            while not self.queue.empty():
+                parts.append(self.queue.get_nowait())
+            utterance = " ".join(parts)
+
+            try:
+                self.speak_ended.clear()
+                self.speaking = utterance
+                self.replying = True
+                if self.tracker:
+                    self.tracker.mark("speak_request")
+                await self.furhat.request_speak_text(utterance)
+                self.requests += 1
+                # generous upper bound in case speak_end never arrives
+                await asyncio.wait_for(self.speak_ended.wait(), timeout=10.0 + len(utterance) / 5)
+                self.spoken.append(utterance)
+            except asyncio.TimeoutError:
+                print(f"[Speech] no speak_end for: {utterance}")
+            except Exception as e:
+                print(f"[Speech] error: {e}")
+            finally:
+                self.speaking = None
+                for _ in parts:
+                    self.queue.task_done()
+                self._check_done()
@@ -0,0 +1,182 @@
+import asyncio
+import json
+import time
+
+
+# Events of a turn, in the order they normally happen
+TURN_EVENTS = ("hear_start", "hear_end", "request_sent", "first_token", "speak_request", "speak_start", "speak_end")
+
+# Stage name -> (from event, to event)
+TURN_STAGES = {
+    "user_speech": ("hear_start", "hear_end"),
+    "request_delay": ("hear_end", "request_sent"),
+    "ttft": ("request_sent", "first_token"),
+    "first_segment": ("first_token", "speak_request"),
+    "speak_delay": ("speak_request", "speak_start"),
+    "response": ("hear_end", "speak_start"),
+    "robot_speech": ("speak_start", "speak_end"),
+}
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0)
+
+
+class Histogram:
+    """Cumulative histogram in the Prometheus sense."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+    def render(self, name: str, labels: str) -> list:
+        lines = [f'{name}_bucket{{{labels},le="{bound}"}} {n}' for bound, n in zip(self.buckets, self.counts)]
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {self.count}')
+        lines.append(f"{name}_sum{{{labels}}} {self.sum:.6f}")
+        lines.append(f"{name}_count{{{labels}}} {self.count}")
+        return lines
+
+
+class TurnMetrics:
+    """Per-stage latency histograms and turn counters, served in Prometheus text format."""
+
+    def __init__(self, bridge: str):
+        self.bridge = bridge
+        self.stages = {stage: Histogram() for stage in TURN_STAGES}
+        self.turns = {}
+        self.server = None
+
+    def record(self, stages: dict, outcome: str):
+        for stage, seconds in stages.items():
+            # speculative requests can start before hear_end
+            self.stages[stage].observe(max(0.0, seconds))
+        self.turns[outcome] = self.turns.get(outcome, 0) + 1
+
+    def render(self) -> str:
+        lines = [
+            "# HELP furhat_turn_stage_seconds Latency of each stage of a dialog turn.",
+            "# TYPE furhat_turn_stage_seconds histogram",
+        ]
+        for stage, histogram in self.stages.items():
+            lines += histogram.render("furhat_turn_stage_seconds", f'bridge="{self.bridge}",stage="{stage}"')
+        lines += [
+            "# HELP furhat_turns_total Dialog turns by outcome.",
+            "# TYPE furhat_turns_total counter",
+        ]
+        for outcome, n in self.turns.items():
+            lines.append(f'furhat_turns_total{{bridge="{self.bridge}",outcome="{outcome}"}} {n}')
+        return "\n".join(lines) + "\n"
+
+    async def serve(self, port: int, host: str = "127.0.0.1"):
+        """Expose the metrics on http://host:port/metrics; a port of 0 disables it."""
+        if not port:
+            return
+        try:
+            self.server = await asyncio.start_server(self._handle, host, port)
+            print(f"[Metrics] serving on http://{host}:{port}/metrics")
+        except OSError as e:
+            print(f"[Metrics] cannot listen on port {port}: {e}")
+
+    async def _handle(self, reader, writer):
+        try:
+            request = await reader.readline()
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            if request.split()[1:2] in ([b"/metrics"], [b"/"]):
+                body = self.render().encode()
+                status = "200 OK"
+            else:
+                body = b"not found\n"
+                status = "404 Not Found"
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except Exception:
+            pass
+        finally:
+            writer.close()
+
+    async def close(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+
+class TurnTimeline:
+    """Monotonic timestamps of one turn."""
+
+    def __init__(self):
+        self.events = {}
+        self.info = {}
+
+    def stages(self) -> dict:
+        return {
+            stage: self.events[end] - self.events[start]
+            for stage, (start, end) in TURN_STAGES.items()
+            if start in self.events and end in self.events
+        }
+
+
+class TurnTracker:
+    """
+    Records the timeline of each dialog turn.
+
+    A turn starts at hear_start (or hear_end if no hear_start was seen). Every
+    event is recorded the first time it happens within the turn, except
+    speak_end, which keeps the last one. Finished turns feed `metrics` and are
+    appended to the JSONL file at `trace_path`. A turn that is superseded by
+    the next hear_start before it finishes is recorded as interrupted.
+    """
+
+    def __init__(self, metrics: TurnMetrics, trace_path: str = None):
+        self.metrics = metrics
+        self.trace_path = trace_path
+        self.current = None
+
+    def begin(self):
+        if self.current is not None and len(self.current.events) > 1:
+            self.finish(self.current, outcome="interrupted")
+        self.current = TurnTimeline()
+        self.current.events["hear_start"] = time.monotonic()
+
+    def mark(self, event: str, **info):
+        if self.current is None:
+            if event not in ("hear_start", "hear_end"):
+                return
+            self.current = TurnTimeline()
+        if event == "speak_end" or event not in self.current.events:
+            self.current.events[event] = time.monotonic()
+        self.current.info.update(info)
+
+    def finish(self, turn: TurnTimeline = None, outcome: str = "ok"):
+        """Finish `turn` (default: the current one), unless a newer turn has replaced it."""
+        turn = turn or self.current
+        if turn is None or (turn is not self.current and outcome == "ok"):
+            return
+        if turn is self.current:
+            self.current = None
+
+        stages = turn.stages()
+        self.metrics.record(stages, outcome)
+        if self.trace_path:
+            origin = min(turn.events.values())
+            record = {
+                "time": time.time(),
+                "bridge": self.metrics.bridge,
+                "outcome": outcome,
+                "events_ms": {e: round((turn.events[e] - origin) * 1000, 1) for e in TURN_EVENTS if e in turn.events},
+                "stages_ms": {s: round(v * 1000, 1) for s, v in stages.items()},
+                **turn.info,
+            }
+            with open(self.trace_path, "a") as f:
+                f.write(json.dumps(record) + "\n")
@@ -2,13 +2,20 @@
 
 import asyncio
 import argparse
-import httpx
 import json
 import time
 import os
-from urllib.parse import urlparse
+import sys
+from contextlib import aclosing
 from furhat_realtime_api import AsyncFurhatClient, Events
 
+# shared helpers live one directory up, next to the other bridges
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from speculative import SpeculativeTurn
+from speech_pipeline import SpeechPipeline
+from turn_metrics import TurnMetrics, TurnTracker
+from ollama_client import ConnectionStats, HedgedOllamaClient, OllamaPool, create_ollama_client, parse_ollama_urls
+
 
 # =========================================================
 # Log conversation to file for Streamlit UI
@@ -19,27 +26,13 @@ def log_event(role: str, text: str):
         f.write(json.dumps(record) + "\n")
 
 
-# =========================================================
-# URL Normalization
-# =========================================================
-def normalize_ollama_url(ip_or_url: str) -> str:
-    if not ip_or_url.startswith("http"):
-        ip_or_url = "http://" + ip_or_url
-    parsed = urlparse(ip_or_url)
-    host = parsed.hostname
-    port = parsed.port or 11434
-    return f"http://{host}:{port}".rstrip("/")
-
-
 # =========================================================
 # Streaming Ollama Client
 # =========================================================
-async def ollama_stream(base_url: str, model: str, system_prompt: str, user_text: str):
+async def ollama_stream(ollama: HedgedOllamaClient, model: str, system_prompt: str, user_text: str):
     """
-    Streams tokens from Ollama in real-time.
+    Streams tokens from the fastest responding Ollama server in real-time.
     """
-    url = f"{base_url}/api/chat"
-
     payload = {
         "model": model,
         "stream": True,
@@ -49,110 +42,180 @@ async def ollama_stream(base_url: str, model: str, system_prompt: str, user_text
         ],
     }
 
-    async with httpx.AsyncClient(timeout=None) as client:
-        async with client.stream("POST", url, json=payload) as resp:
-            async for line in resp.aiter_lines():
-                if not line:
-                    continue
-                try:
-                    data = json.loads(line)
-                except json.JSONDecodeError:
-                    continue
-
-                if data.get("done"):
-                    break
+    async with aclosing(ollama.stream_chat(payload)) as stream:
+        async for data in stream:
+            if data.get("done"):
+                continue
 
-                chunk = data.get("message", {}).get("content", "")
-                if chunk:
-                    yield chunk
+            chunk = data.get("message", {}).get("content", "")
+            if chunk:
+                yield chunk
 
 
 # =========================================================
 # Furhat + Ollama Streaming Chat
 # =========================================================
 class FurhatOllamaStreamChat:
-    def __init__(self, furhat_ip, ollama_ip, model, system_prompt):
+    def __init__(self, furhat_ip, ollama_ip, model, system_prompt, speculative=False, similarity=0.9, hedge_delay=0.5, pool_file=None,
+                 metrics_port=9464, trace_file="turn_trace.jsonl"):
         self.furhat_ip = furhat_ip
-        self.ollama_url = normalize_ollama_url(ollama_ip)
+        self.ollama_urls = parse_ollama_urls(ollama_ip)
         self.model = model
         self.system_prompt = system_prompt
 
         self.furhat = AsyncFurhatClient(furhat_ip)
 
-        # streaming buffer
-        self.buffer = ""
-        self.last_send_time = time.time()
-        self.min_interval = 0.4
+        # one keep-alive connection pool for the whole session
+        self.http = create_ollama_client()
+        self.http_stats = ConnectionStats()
+
+        # health-checked pool of Ollama servers; slow first tokens are hedged to a second one
+        self.pool = OllamaPool(self.http, self.ollama_urls, model=model, pool_file=pool_file)
+        self.ollama = HedgedOllamaClient(self.http, self.ollama_urls, hedge_delay=hedge_delay, connection_stats=self.http_stats, pool=self.pool)
+
+        # per-turn latency timeline: Prometheus histograms and a JSONL trace
+        self.metrics_port = metrics_port
+        self.metrics = TurnMetrics("furhat_ollama_streamchat")
+        self.tracker = TurnTracker(self.metrics, trace_file)
+
+        # sentence-aware speech: segments streamed text, speaks one utterance at a time
+        self.speech = SpeechPipeline(self.furhat, tracker=self.tracker)
 
         self.lock = asyncio.Lock()
 
+        # optionally start generating on partial hearing results
+        self.speculation = None
+        self.speculative_task = None
+        self.final_text = None
+        if speculative:
+            self.speculation = SpeculativeTurn(self.start_speculative, self.cancel_speculative, threshold=similarity)
+
         # reset conversation log
         open("conversation_log.jsonl", "w").close()
 
-    async def speak_chunk(self, text: str):
-        now = time.time()
-        self.buffer += text
+    async def on_hear_partial(self, event):
+        if self.speech.held:
+            return
+        self.speculation.on_partial(event.get("text", ""))
 
-        should_send = (
-            (now - self.last_send_time > self.min_interval)
-            or text.endswith((".", "?", "!"))
-        )
+    def start_speculative(self, text, confirmed):
+        self.speculative_task = asyncio.create_task(self.respond(text, confirmed))
 
-        if should_send and self.buffer.strip():
-            await self.furhat.request_speak_text(self.buffer)
-            self.buffer = ""
-            self.last_send_time = now
+    def cancel_speculative(self):
+        if self.speculative_task and not self.speculative_task.done():
+            self.speculative_task.cancel()
 
-    async def finalize_speech(self):
-        if self.buffer.strip():
-            await self.furhat.request_speak_text(self.buffer)
-            self.buffer = ""
+    async def on_hear_start(self, event):
+        if self.speech.heard_start():
+            self.interrupt()
+
+    def interrupt(self):
+        self.tracker.begin()
+        # a new utterance: the speculation on the previous one's partials is stale
+        if self.speculation:
+            self.speculation.abandon()
 
     async def on_hear_end(self, event):
+        held = self.speech.held
+        user_text = event.get("text", "")
+        if not self.speech.heard_end(user_text):
+            return      # echo or noise right after an utterance of the reply
+        if held:
+            self.interrupt()
+        if not user_text:
+            if self.speculation:
+                self.speculation.abandon()
+            return
+        self.tracker.mark("hear_end")
+        self.final_text = user_text
+
+        print(f"[USER]: {user_text}")
+        log_event("user", user_text)
+
+        if self.speculation and self.speculation.on_final(user_text):
+            return
+        asyncio.create_task(self.respond(user_text))
+
+    async def respond(self, user_text: str, confirmed=None):
+        """
+        Streams a response and speaks it. A speculative response
+        is held at its first token until the final transcript confirms it.
+        """
+        turn = self.tracker.current
         async with self.lock:
-            user_text = event.get("text", "")
-            if not user_text:
-                return
-
-            print(f"[USER]: {user_text}")
-            log_event("user", user_text)
-
             full_response = ""
+            if confirmed is None:
+                self.speech.begin()
 
             try:
-                async for chunk in ollama_stream(
-                    self.ollama_url,
+                self.tracker.mark("request_sent")
+                stream = ollama_stream(
+                    self.ollama,
                     self.model,
                     self.system_prompt,
                     user_text,
-                ):
-                    print(chunk, end="", flush=True)
-                    full_response += chunk
-                    await self.speak_chunk(chunk)
-
-                await self.finalize_speech()
+                )
+                async with aclosing(stream):
+                    async for chunk in stream:
+                        if confirmed is not None:
+                            self.speculation.mark_ready(confirmed)
+                            if not await confirmed:
+                                return
+                            confirmed = None
+                            self.speech.begin()
+
+                        self.tracker.mark("first_token")
+                        print(chunk, end="", flush=True)
+                        full_response += chunk
+                        await self.speech.feed(chunk)
+
+                if confirmed is not None:
+                    self.speculative_failed(confirmed)     # nothing to say
+                    return
+                await self.speech.finish()
 
             except Exception as e:
                 print(f"[LLM ERROR]: {e}")
+                if confirmed is not None:
+                    # unconfirmed: the user may still be talking, so do not apologise yet
+                    self.speculative_failed(confirmed)
+                    return
                 full_response = "Sorry, I had trouble thinking."
 
-                try:
-                    await self.furhat.request_speak_text(full_response)
-                except:
-                    pass
+                self.speech.clear()
+                await self.speech.say(full_response)
 
+            asyncio.create_task(self.finish_turn(turn))
             log_event("assistant", full_response)
+            print(f"\n[HTTP]: {self.http_stats.summary()}")
+            print(f"[OLLAMA]: {self.ollama.summary()}")
+
+    def speculative_failed(self, confirmed):
+        """A speculative request failed or was empty: answer the final transcript normally"""
+        if self.speculation.fail(confirmed) and self.final_text:
+            asyncio.create_task(self.respond(self.final_text))
+
+    async def finish_turn(self, turn):
+        await self.speech.wait_idle()
+        self.tracker.finish(turn)
 
     async def run(self):
         print(f"Connecting to Furhat at {self.furhat_ip}...")
         await self.furhat.connect()
         await self.furhat.request_attend_user()
+        await self.ollama.start()
+        await self.metrics.serve(self.metrics_port)
 
         print("Robot ready. Listening for speech...")
 
+        self.furhat.add_handler(Events.response_hear_start, self.on_hear_start)
         self.furhat.add_handler(Events.response_hear_end, self.on_hear_end)
+        self.speech.attach()
+        if self.speculation:
+            self.furhat.add_handler(Events.response_hear_partial, self.on_hear_partial)
 
         await self.furhat.request_listen_start(
+            partial=self.speculation is not None,
             concat=True,
             stop_no_speech=False,
             stop_user_end=True,
@@ -161,8 +224,14 @@ class FurhatOllamaStreamChat:
             end_speech_timeout=0.4,
         )
 
-        while True:
-            await asyncio.sleep(1)
+        try:
+            while True:
+                await asyncio.sleep(1)
+        finally:
+            await self.speech.close()
+            await self.ollama.close()
+            await self.metrics.close()
+            await self.http.aclose()
 
 
 # =========================================================
@@ -172,9 +241,15 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
 
     parser.add_argument("--furhat_ip", required=True)
-    parser.add_argument("--ollama_ip", required=True)
+    parser.add_argument("--ollama_ip", required=True, help="One or more Ollama servers, comma-separated")
     parser.add_argument("--model", required=True)
     parser.add_argument("--system_prompt", required=True)
+    parser.add_argument("--speculative", action="store_true")
+    parser.add_argument("--similarity", type=float, default=0.9)
+    parser.add_argument("--hedge_delay", type=float, default=0.5)
+    parser.add_argument("--ollama_pool_file", default=None, help="File listing Ollama servers, one per line; re-read while running")
+    parser.add_argument("--metrics_port", type=int, default=9464, help="Port for Prometheus turn latency metrics, 0 to disable")
+    parser.add_argument("--trace_file", default="turn_trace.jsonl", help="JSONL file for per-turn latency timelines")
 
     args = parser.parse_args()
 
@@ -183,6 +258,12 @@ if __name__ == "__main__":
         ollama_ip=args.ollama_ip,
         model=args.model,
         system_prompt=args.system_prompt,
+        speculative=args.speculative,
+        similarity=args.similarity,
+        hedge_delay=args.hedge_delay,
+        pool_file=args.ollama_pool_file,
+        metrics_port=args.metrics_port,
+        trace_file=args.trace_file,
     )
 
     asyncio.run(chat.run())
\ No newline at end of file
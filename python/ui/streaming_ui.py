@@ -34,7 +34,7 @@ with left:
     st.header("Settings")
 
     furhat_ip = st.text_input("Furhat Robot IP Address", "172.27.8.18")
-    ollama_ip = st.text_input("Ollama Server IP", "127.0.0.1")
+    ollama_ip = st.text_input("Ollama Server IP(s), comma-separated", "127.0.0.1")
     model = st.text_input("Model Name", "llama3.2:3b")
 
     system_prompt = st.text_area(
@@ -1,6 +1,14 @@
 import asyncio
 import httpx
+from contextlib import aclosing
 from furhat_realtime_api import AsyncFurhatClient, Events
+from ollama_client import HedgedOllamaClient, OllamaPool, parse_ollama_urls
+from ollama_residency import ResidencyGroup
+from speculative import SpeculativeTurn
+from speech_pipeline import SpeechPipeline
+from dialog_history import DialogHistory, SUMMARY_INSTRUCTION, summary_request
+from response_cache import ResponseCache
+from turn_metrics import TurnMetrics, TurnTracker
 from dotenv import load_dotenv
 import os
 
@@ -14,28 +22,47 @@ import os
 load_dotenv()
 
 class OptimizedChatbot:
-    def __init__(self, system_prompt: str, model: str = "llama3.2:3b"):
+    def __init__(self, system_prompt: str, model: str = "llama3.2:3b", keep_alive: float = 1800.0, history_budget: int = 400, cache: ResponseCache = None,
+                 base_url: str = "http://127.0.0.1:11434", hedge_delay: float = 0.5, pool_file: str = None):
         self.system_prompt = system_prompt
         self.model = model
-        self.base_url = "http://127.0.0.1:11434"
-        self.history = []  # Keep only last 2 exchanges (4 messages)
+        self.cache = cache
+        self.base_urls = parse_ollama_urls(base_url)
+        # Recent exchanges verbatim within the token budget, older ones summarized when idle
+        self.history = DialogHistory(history_budget, summarize=self.summarize)
         self.current_task = None
         self.http = httpx.AsyncClient(timeout=httpx.Timeout(10.0, read=15.0))
+        self.pool = OllamaPool(self.http, self.base_urls, model=model, pool_file=pool_file)
+        self.ollama = HedgedOllamaClient(self.http, self.base_urls, hedge_delay=hedge_delay, pool=self.pool)
+        self.residency = ResidencyGroup(self.http, self.pool, model, keep_alive=keep_alive)
+        self.tracker = None
 
     def add_exchange(self, user_text: str, assistant_text: str):
-        """Add user-assistant pair and maintain 2-message limit"""
-        self.history.append({"role": "user", "content": user_text})
-        self.history.append({"role": "assistant", "content": assistant_text})
-        
-        # Keep only last 4 messages (2 exchanges)
-        if len(self.history) > 4:
-            self.history = self.history[-4:]
+        """Add user-assistant pair; the history keeps itself within its token budget"""
+        self.history.append("user", user_text)
+        self.history.append("assistant", assistant_text)
 
     async def get_response(self, user_text: str) -> str:
-        """Get LLM response with streaming for lower latency"""
+        """Get the complete LLM response"""
+        full_response = ""
+        async for content in self.stream_response(user_text):
+            full_response += content
+        return full_response.strip()
+
+    async def stream_response(self, user_text: str):
+        """Stream LLM response chunks for lower latency"""
+        # Repeated questions with little preceding context are answered from the cache
+        cacheable = self.cache is not None and self.cache.cacheable(self.history.user_turns())
+        if cacheable:
+            cached = self.cache.get(user_text, self.system_prompt, self.model)
+            if cached is not None:
+                if self.tracker:
+                    self.tracker.mark("first_token", cached=True)
+                yield cached
+                return
+
         messages = [
-            {"role": "system", "content": self.system_prompt},
-            *self.history,
+            *self.history.prompt(self.system_prompt),
             {"role": "user", "content": user_text}
         ]
 
@@ -43,6 +70,7 @@ class OptimizedChatbot:
             "model": self.model,
             "messages": messages,
             "stream": True,  # Stream for faster first token
+            "keep_alive": self.residency.keep_alive,
             "options": {
                 "temperature": 0.7,
                 "num_predict": 150,  # Limit response length for speed
@@ -52,21 +80,53 @@ class OptimizedChatbot:
         }
 
         full_response = ""
-        async with self.http.stream("POST", f"{self.base_url}/api/chat", json=payload) as response:
-            async for line in response.aiter_lines():
-                if line:
-                    import json
-                    chunk = json.loads(line)
+        self.history.begin_turn()
+        try:
+            if self.tracker:
+                self.tracker.mark("request_sent")
+            async with aclosing(self.ollama.stream_chat(payload)) as stream:
+                async for chunk in stream:
                     if content := chunk.get("message", {}).get("content"):
+                        if self.tracker:
+                            self.tracker.mark("first_token")
                         full_response += content
+                        yield content
+        finally:
+            self.history.end_turn()
 
-        return full_response.strip()
+        self.residency.touch(self.ollama.last_endpoints)
+        if cacheable:
+            self.cache.put(user_text, self.system_prompt, self.model, full_response.strip())
+
+    async def summarize(self, summary: str, messages: list) -> str:
+        payload = {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": SUMMARY_INSTRUCTION},
+                {"role": "user", "content": summary_request(summary, messages)}
+            ],
+            "stream": False,
+            "keep_alive": self.residency.keep_alive,
+            "options": {"num_predict": 150}
+        }
+        # Background work: no duplicate requests
+        response = await self.ollama.chat(payload, hedge=False)
+        return response.get("message", {}).get("content", "")
 
     def cancel(self):
         if self.current_task and not self.current_task.done():
             self.current_task.cancel()
 
+    async def start(self):
+        await self.ollama.start()
+        await self.residency.start()
+
     async def close(self):
+        if self.cache:
+            self.cache.close()
+        await self.history.close()
+        await self.residency.stop()
+        await self.ollama.close()
         await self.http.aclose()
 
 
@@ -74,6 +134,19 @@ class FurhatOllamaChat:
     def __init__(self):
         self.host = os.getenv("FURHAT_HOST", "172.27.8.18")
         self.model = os.getenv("OLLAMA_MODEL", "llama3.2:3b")
+        self.ollama_urls = os.getenv("OLLAMA_URLS", "http://127.0.0.1:11434")
+        self.pool_file = os.getenv("OLLAMA_POOL_FILE") or None
+        self.hedge_delay = float(os.getenv("OLLAMA_HEDGE_DELAY", "0.5"))
+        self.keep_alive = float(os.getenv("OLLAMA_KEEP_ALIVE", "1800"))
+        self.history_budget = int(os.getenv("HISTORY_TOKEN_BUDGET", "400"))
+
+        cache = None
+        if os.getenv("RESPONSE_CACHE", "0") == "1":
+            cache = ResponseCache(
+                ttl=float(os.getenv("RESPONSE_CACHE_TTL", "86400")),
+                path=os.getenv("RESPONSE_CACHE_FILE") or None,
+                max_context=int(os.getenv("RESPONSE_CACHE_CONTEXT", "0")),
+            )
         
         # Default to Option 4 if not set in .env
         default_prompt = """You are a friendly robot. Keep ALL responses under 15 words.
@@ -82,56 +155,135 @@ Be conversational and engaging but extremely concise. Every word counts."""
         self.system_prompt = os.getenv("SYSTEM_PROMPT", default_prompt)
         
         self.furhat = AsyncFurhatClient(self.host)
-        self.chatbot = OptimizedChatbot(self.system_prompt, self.model)
+        self.chatbot = OptimizedChatbot(self.system_prompt, self.model, keep_alive=self.keep_alive, history_budget=self.history_budget, cache=cache,
+                                        base_url=self.ollama_urls, hedge_delay=self.hedge_delay, pool_file=self.pool_file)
+
+        # Per-turn latency timeline: Prometheus histograms and a JSONL trace
+        self.metrics_port = int(os.getenv("METRICS_PORT", "9464"))
+        self.metrics = TurnMetrics("v2_ollama_async")
+        self.tracker = TurnTracker(self.metrics, os.getenv("TURN_TRACE_FILE", "turn_trace.jsonl") or None)
+        self.chatbot.tracker = self.tracker
+        self.speech = SpeechPipeline(self.furhat, tracker=self.tracker)
         self.stop_event = asyncio.Event()
         self.current_user_text = None
 
+        # Optionally start generating on partial hearing results
+        self.speculation = None
+        if os.getenv("OLLAMA_SPECULATIVE", "0") == "1":
+            self.speculation = SpeculativeTurn(
+                self.start_speculative,
+                self.chatbot.cancel,
+                threshold=float(os.getenv("SPECULATIVE_SIMILARITY", "0.9")),
+            )
+
     async def on_hear_start(self, event):
         """User started speaking - cancel pending requests"""
+        if self.speech.heard_start():
+            self.interrupt()
+
+    def interrupt(self):
+        self.tracker.begin()
+        if self.speculation:
+            self.speculation.abandon()
         self.chatbot.cancel()
+        self.speech.clear()
+
+    async def on_hear_partial(self, event):
+        """Partial transcript - start generating before the user has finished"""
+        if self.speech.held:
+            return
+        self.speculation.on_partial(event.get("text", ""))
 
     async def on_hear_end(self, event):
         """User finished speaking - get LLM response"""
+        held = self.speech.held
+        if not self.speech.heard_end(event["text"]):
+            return      # echo or noise right after an utterance of the reply
+        if held:
+            self.interrupt()
         self.current_user_text = event["text"]
+        self.tracker.mark("hear_end")
         print(f"User: {self.current_user_text}")
-        
+
+        if self.speculation and self.speculation.on_final(self.current_user_text):
+            return
+        self.chatbot.current_task = asyncio.create_task(self.respond(self.current_user_text))
+
+    def start_speculative(self, text, confirmed):
+        self.chatbot.current_task = asyncio.create_task(self.respond(text, confirmed))
+
+    async def respond(self, user_text: str, confirmed=None):
+        """Speak the LLM response sentence by sentence, once confirmed if speculative"""
+        turn = self.tracker.current
         try:
-            response = await self.chatbot.get_response(self.current_user_text)
+            if confirmed is None:
+                self.speech.begin()
+            async with aclosing(self.chatbot.stream_response(user_text)) as stream:
+                async for chunk in stream:
+                    if confirmed is not None:
+                        self.speculation.mark_ready(confirmed)
+                        if not await confirmed:
+                            return
+                        confirmed = None
+                        self.speech.begin()
+                    await self.speech.feed(chunk)
+            if confirmed is not None:
+                self.speculative_failed(confirmed)     # nothing to say
+                return
+            await self.speech.finish()
+
+            # Robot finished speaking - update history with what was said
+            response = await self.speech.wait_idle()
+            self.tracker.finish(turn)
             print(f"Furhat: {response}")
-            await self.furhat.request_speak_text(response)
+            if self.current_user_text:
+                self.chatbot.add_exchange(self.current_user_text, response)
+                self.current_user_text = None
         except asyncio.CancelledError:
             print("Request cancelled")
         except Exception as e:
             print(f"Error: {e}")
+            if confirmed is not None:
+                self.speculative_failed(confirmed)
+            else:
+                await self.speech.finish()      # end the reply, so the robot listens again
 
-    async def on_speak_end(self, event):
-        """Robot finished speaking - update history"""
-        if self.current_user_text:
-            self.chatbot.add_exchange(self.current_user_text, event["text"])
-            self.current_user_text = None
+    def speculative_failed(self, confirmed):
+        """A speculative request failed or was empty: answer the final transcript normally"""
+        if self.speculation.fail(confirmed) and self.current_user_text:
+            self.chatbot.current_task = asyncio.create_task(self.respond(self.current_user_text))
 
     async def run(self):
+        # Load the model while the Furhat connection is being set up
+        warmup = asyncio.create_task(self.chatbot.start())
         try:
             await self.furhat.connect()
             print(f"Connected to Furhat at {self.host}")
             print(f"Using model: {self.model}")
             print(f"System prompt: {self.system_prompt[:50]}...")
-            print(f"Keeping last 3 message exchanges in memory")
+            print(f"Keeping ~{self.history_budget} tokens of recent dialog, older turns summarized")
             print("Press Ctrl+C to stop\n")
         except Exception as e:
             print(f"Failed to connect: {e}")
+            warmup.cancel()
+            await self.chatbot.close()
             return
 
+        await self.metrics.serve(self.metrics_port)
+
         # Register handlers
         self.furhat.add_handler(Events.response_hear_start, self.on_hear_start)
         self.furhat.add_handler(Events.response_hear_end, self.on_hear_end)
-        self.furhat.add_handler(Events.response_speak_end, self.on_speak_end)
+        if self.speculation:
+            self.furhat.add_handler(Events.response_hear_partial, self.on_hear_partial)
+        self.speech.attach()
 
         # Start conversation
         await self.furhat.request_attend_user()
         await self.furhat.request_speak_text("Hi! How can I help you today?")
         
         await self.furhat.request_listen_start(
+            partial=self.speculation is not None,
             concat=True,
             stop_robot_start=True,
             resume_robot_end=True,
@@ -143,7 +295,9 @@ Be conversational and engaging but extremely concise. Every word counts."""
         except KeyboardInterrupt:
             print("\nShutting down...")
         finally:
+            await self.speech.close()
             await self.chatbot.close()
+            await self.metrics.close()
             await self.furhat.disconnect()
 
 